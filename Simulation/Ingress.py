@@ -1,17 +1,25 @@
 import pyrebase
-import tensorflow as tf
 import numpy as np
-from tensorflow.keras.models import load_model
-from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
 import time
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
 import requests  # Required for sending Telegram messages
+from batching import MicroBatcher
+from partitioned import PartitionedExecutor, partition
+from alerts import AlertDispatcher
+from sharding import DEFAULT_SENSOR_KEY, LeaseManager, iter_sensor_readings
+from metrics import registry_from_env, start_http_server
+from intake import BoundedIntake
+from preprocessing import Standardizer
+from feature_stats import SnapshotWatcher, standardizer_from_snapshot
+from model_registry import DiskRegistry, GridFSRegistry, ModelWatcher, load_model, warm_up
+from write_buffer import WriteBuffer
 
 # MongoDB configuration
 mongo_uri = ""
 client = MongoClient(mongo_uri, server_api=ServerApi('1'))
-db_collection = client.GOCI.status
 
 try:
     client.admin.command('ping')
@@ -19,41 +27,129 @@ try:
 except Exception as e:
     print(f"MongoDB connection error: {e}")
 
-# Telegram credentials
+# Per-stage latency histograms and event counters, served in the Prometheus text
+# format on METRICS_PORT (/metrics). METRICS_ENABLED=0 turns every metric into a no-op.
+metrics = registry_from_env()
+stage_seconds = metrics.histogram("ingress_stage_seconds", "Time spent in each ingress stage", labels=("stage",))
+intake_wait_seconds = stage_seconds.labels("intake_wait")
+queue_wait_seconds = stage_seconds.labels("queue_wait")
+preprocess_seconds = stage_seconds.labels("preprocess")
+inference_seconds = stage_seconds.labels("inference")
+mongo_write_seconds = stage_seconds.labels("mongo_write")
+alert_seconds = stage_seconds.labels("alert")
+end_to_end_seconds = metrics.histogram(
+    "ingress_end_to_end_seconds", "Time from the simulator stamping a reading (Sent_at) to its label")
+events_total = metrics.counter("ingress_events_total", "Sensor readings received")
+events_per_second = metrics.rate("ingress_events_per_second", "Sensor readings received per second (10 s window)")
+skipped_total = metrics.counter("ingress_skipped_total", "Readings skipped because another replica owns the sensor")
+errors_total = metrics.counter("ingress_errors_total", "Readings that failed classification")
+labels_total = metrics.counter("ingress_labels_total", "Classified readings by label", labels=("label",))
+
+# Status writes go to a local write-ahead log first (WRITE_BUFFER_DIR) and are
+# flushed to MongoDB in the background, so a slow or unavailable database
+# neither blocks the dispatcher nor loses the latest status.
+write_buffer = WriteBuffer(client.GOCI, os.environ.get("WRITE_BUFFER_DIR", "status_write_buffer"),
+                           on_flush=mongo_write_seconds.observe)
+
+# Telegram credentials; TELEGRAM_API_URL can point at a local stand-in for testing.
 TELEGRAM_BOT_TOKEN = ''
 TELEGRAM_CHAT_ID = ''
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
 
 def send_telegram_message(message):
-    """Send an alert message to Telegram."""
-    url = f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage'
+    """Send an alert message to Telegram; raises on failure so the dispatcher can retry."""
+    url = f'{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage'
     payload = {'chat_id': TELEGRAM_CHAT_ID, 'text': message}
-    try:
-        requests.post(url, data=payload)
-    except Exception as e:
-        print(f"Failed to send Telegram message: {e}")
+    with alert_seconds.time():
+        response = requests.post(url, data=payload, timeout=5)
+    response.raise_for_status()
+
+def write_status(status, key=DEFAULT_SENSOR_KEY):
+    """
+    Update the status record of a sensor key. The single-pipe layout keeps one
+    document (update_one with an empty filter); other keys get one document per Sensor_id.
+    """
+    status_filter = {} if key == DEFAULT_SENSOR_KEY else {"Sensor_id": key}
+    write_buffer.update("status", status_filter, {"$set": {"status": status}})
+
+# Alert delivery and status writes run on their own thread and bounded queue,
+# so a slow Telegram or MongoDB round-trip never holds up inference.
+alert_dispatcher = AlertDispatcher(
+    send_telegram_message,
+    write_status,
+    max_queue=int(os.environ.get("ALERT_QUEUE_SIZE", "1000")),
+    max_retries=int(os.environ.get("ALERT_MAX_RETRIES", "5")),
+)
+metrics.gauge("ingress_alert_queue_depth", "Status changes waiting for delivery",
+              lambda: alert_dispatcher.queue_depth)
+metrics.gauge("ingress_write_buffer_records", "Status writes buffered locally, not yet in MongoDB",
+              lambda: write_buffer.log.pending_records)
+metrics.gauge("ingress_write_buffer_bytes", "Size of the buffered status writes",
+              lambda: write_buffer.log.pending_bytes())
+metrics.gauge("ingress_write_buffer_flush_lag_seconds", "Age of the oldest buffered status write",
+              lambda: write_buffer.stats()["flush_lag_seconds"])
 
 # Load the Trained Model and Preprocessing Details
-model = load_model("water_system_model.h5")
-print("Model loaded successfully.")
+# INFERENCE_ENGINE selects the runtime: "numpy" runs the exported weights in
+# water_system_model.npz (see export_model.py) without importing TensorFlow,
+# "keras" loads the original .h5 model.
+INFERENCE_ENGINE = os.environ.get("INFERENCE_ENGINE", "numpy")
+BUNDLED_MODELS = {"numpy": "water_system_model.npz", "keras": "water_system_model.h5"}
+
+# MODEL_REGISTRY "disk" (MODEL_REGISTRY_DIR) or "gridfs" (MongoDB) serves the latest
+# published model version and swaps in new ones, polled every
+# MODEL_REGISTRY_POLL_SECONDS (see model_registry.py); "none" serves the bundled file.
+# Every model is warmed up with synthetic batches before it serves events.
+MODEL_REGISTRY = os.environ.get("MODEL_REGISTRY", "none")
+WARM_UP_BATCH_SIZES = (1, int(os.environ.get("BATCH_MAX_SIZE", "64")))
+model = None
+model_version = None
 
-# Standardization values used during training; update these based on your training data.
-feature_means = np.array([97.03, 52.16, 94.71, 20.08])
-feature_stds = np.array([9.63, 7.17, 8.28, 2.47])
+def swap_model(new_model, version):
+    """
+    Replace the serving model; batches in flight finish on the previous one.
+    """
+    global model, model_version
+    model = new_model
+    model_version = version
+
+model_watcher = None
+if MODEL_REGISTRY != "none":
+    if MODEL_REGISTRY == "gridfs":
+        model_registry = GridFSRegistry(client.GOCI)
+    else:
+        model_registry = DiskRegistry(os.environ.get("MODEL_REGISTRY_DIR", "model_registry"))
+    model_watcher = ModelWatcher(
+        model_registry, INFERENCE_ENGINE, swap_model,
+        poll_seconds=float(os.environ.get("MODEL_REGISTRY_POLL_SECONDS", "30")),
+        batch_sizes=WARM_UP_BATCH_SIZES,
+    )
+    try:
+        model_watcher.check()
+    except Exception as e:
+        print("Model registry error, serving the bundled model:", e)
+if model is None:
+    bundled = load_model(BUNDLED_MODELS[INFERENCE_ENGINE], INFERENCE_ENGINE)
+    warm_up(bundled, WARM_UP_BATCH_SIZES)
+    swap_model(bundled, "bundled")
+if model_watcher is not None:
+    model_watcher.start()
+print(f"Model loaded successfully ({INFERENCE_ENGINE} engine, version {model_version}).")
+
+# Standardization values used during training (see preprocessing.py).
+standardizer = Standardizer()
 
 def preprocess_input(sensor_data):
     """
     Extract features from sensor_data and apply scaling.
     """
-    features = np.array([
-        sensor_data.get('Pressure'),
-        sensor_data.get('Flow_rate'),
-        sensor_data.get('Water_quality'),
-        sensor_data.get('Temperature')
-    ], dtype=np.float32)
-    
-    # Standardize the features
-    features = (features - feature_means) / feature_stds
-    return features.reshape(1, -1)
+    return standardizer.transform_dict(sensor_data)
+
+def preprocess_batch(sensor_batch):
+    """
+    Stack a list of sensor_data dicts into one standardized (N, 4) float32 array.
+    """
+    return standardizer.transform_dicts(sensor_batch)
 
 def get_anomaly_label(prediction):
     """
@@ -69,35 +165,93 @@ def get_anomaly_label(prediction):
     }
     return label_mapping.get(predicted_index, "Unknown")
 
-# Global variable to ensure Telegram alert is sent only once per anomaly occurrence.
-last_alert_sent = "Normal"
+# Labels by prediction index, as in get_anomaly_label; any index past the known
+# classes maps to the trailing "Unknown"
+ANOMALY_LABELS = np.array(["Normal", "Pipe Leak", "Water Quality Issue", "Temperature Issue", "Unknown"], dtype=object)
+
+def get_anomaly_labels(prediction):
+    """
+    Map every row of a batched prediction to its anomaly label.
+    """
+    indices = np.minimum(np.argmax(prediction, axis=1), len(ANOMALY_LABELS) - 1)
+    return ANOMALY_LABELS[indices].tolist()
+
+# Last alerted status per sensor key, so a Telegram alert is sent only once per anomaly occurrence.
+# Each key is only ever handled on its own lane, so entries are never updated concurrently.
+last_alert_sent = {}
+
+def observe_batch(queue_waits):
+    """
+    Record how long each event of a batch waited for its forward pass.
+    """
+    for wait in queue_waits:
+        queue_wait_seconds.observe(wait)
+
+def handle_anomaly_label(key, sensor_data, anomaly_label):
+    """
+    Queue alerts and MongoDB updates when the detected status of a sensor changes.
+    """
+    previous = last_alert_sent.get(key, "Normal")
+    print(f"Detected anomaly ({key}):", anomaly_label)
+    labels_total.labels(anomaly_label).inc()
+    # End-to-end latency of readings stamped by the simulator
+    sent_at = sensor_data.get("Sent_at")
+    if sent_at is not None:
+        end_to_end_seconds.observe(time.time() - sent_at)
 
-def process_sensor_data(sensor_data):
+    # If anomaly is detected and no alert has been sent yet for this anomaly, send alert and update MongoDB.
+    if anomaly_label != "Normal" and previous == "Normal":
+        site = "" if key == DEFAULT_SENSOR_KEY else f" at {key}"
+        alert_message = f"Alert, {anomaly_label} detected{site}, please check the dashboard for further information"
+        alert_dispatcher.status_changed(anomaly_label, alert_message, key=key)
+        last_alert_sent[key] = anomaly_label
+    # If the system has returned to normal, update MongoDB and reset alert flag.
+    elif anomaly_label == "Normal" and previous != "Normal":
+        alert_dispatcher.status_changed("Normal", key=key)
+        last_alert_sent[key] = "Normal"
+
+def process_sensor_data(key, sensor_data, received):
     """
     Preprocess sensor data, run prediction, and handle alerts and MongoDB updates.
-    This function is run in a separate thread.
+    This function is run on the sensor's lane.
     """
-    global last_alert_sent
+    queue_wait_seconds.observe(time.perf_counter() - received)
     try:
-        input_data = preprocess_input(sensor_data)
-        prediction = model.predict(input_data)
+        with preprocess_seconds.time():
+            input_data = preprocess_input(sensor_data)
+        with inference_seconds.time():
+            prediction = model.predict(input_data)
         anomaly_label = get_anomaly_label(prediction)
-        print("Detected anomaly:", anomaly_label)
-        
-        # If anomaly is detected and no alert has been sent yet for this anomaly, send alert and update MongoDB.
-        if anomaly_label != "Normal" and last_alert_sent == "Normal":
-            alert_message = f"Alert, {anomaly_label} detected, please check the dashboard for further information"
-            send_telegram_message(alert_message)
-            # Update MongoDB record (using update_one with an empty filter since there's only one document)
-            db_collection.update_one({}, {"$set": {"status": anomaly_label}}, upsert=True)
-            last_alert_sent = anomaly_label
-        # If the system has returned to normal, update MongoDB and reset alert flag.
-        elif anomaly_label == "Normal" and last_alert_sent != "Normal":
-            db_collection.update_one({}, {"$set": {"status": "Normal"}}, upsert=True)
-            last_alert_sent = "Normal"
-            
+        handle_anomaly_label(key, sensor_data, anomaly_label)
     except Exception as e:
+        errors_total.inc()
         print("Error during prediction:", e)
+    finally:
+        intake.done()
+
+def classify_batch(sensor_batch):
+    """
+    Run a single forward pass over a batch of sensor readings.
+    This function is run on the batcher thread.
+    """
+    with preprocess_seconds.time():
+        input_data = preprocess_batch(sensor_batch)
+    with inference_seconds.time():
+        prediction = model.predict(input_data, verbose=0)
+    return get_anomaly_labels(prediction)
+
+def handle_batch_result(key, sensor_data, future):
+    """
+    Handle alerts and MongoDB updates for one event once its batch has been classified.
+    Results are delivered on the lane's batcher thread in arrival order.
+    """
+    try:
+        handle_anomaly_label(key, sensor_data, future.result())
+    except Exception as e:
+        errors_total.inc()
+        print("Error during prediction:", e)
+    finally:
+        intake.done()
 
 # Setup Firebase Ingress Pod
 firebaseConfig = {
@@ -110,13 +264,96 @@ firebaseConfig = {
 firebase = pyrebase.initialize_app(firebaseConfig)
 db = firebase.database()
 
-# Create a ThreadPoolExecutor with a specified number of worker threads.
-executor = ThreadPoolExecutor(max_workers=4)
+# Events are hashed by sensor key onto INGRESS_LANES lanes. Each lane has a single
+# worker, so readings from one sensor are processed in arrival order while
+# different sensors run in parallel.
+INGRESS_LANES = int(os.environ.get("INGRESS_LANES", "4"))
+executor = PartitionedExecutor(lanes=INGRESS_LANES)
+
+# Inference mode: "single" runs one model.predict per event on the sensor's lane,
+# "batch" groups events and runs one model.predict per batch (one batcher per lane).
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "batch")
+batchers = []
+if INFERENCE_MODE == "batch":
+    batchers = [
+        MicroBatcher(
+            classify_batch,
+            max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", "64")),
+            max_wait=float(os.environ.get("BATCH_MAX_WAIT_MS", "50")) / 1000,
+            on_batch=observe_batch,
+        )
+        for _ in range(INGRESS_LANES)
+    ]
+
+metrics.gauge("ingress_executor_backlog", "Events queued on the lanes", executor.backlog)
+metrics.gauge("ingress_batcher_queue_depth", "Events waiting for a batched forward pass",
+              lambda: sum(batcher.queue_depth for batcher in batchers))
+
+def dispatch(key, entry):
+    """
+    Hand one reading from the intake to its batcher or lane.
+    This function is run on the intake thread.
+    """
+    sensor_data, received = entry
+    intake_wait_seconds.observe(time.perf_counter() - received)
+    if batchers:
+        # Queue the event for the next batched forward pass on its lane.
+        batcher = batchers[partition(key, len(batchers))]
+        batcher.submit(sensor_data, callback=partial(handle_batch_result, key, sensor_data))
+    else:
+        # Offload heavy processing to the sensor's lane.
+        executor.submit(key, process_sensor_data, key, sensor_data, time.perf_counter())
+
+# Bounded intake in front of the lanes. INTAKE_POLICY picks what happens under
+# overload: "latest" keeps only the newest pending reading per sensor,
+# "drop_oldest" sheds the oldest readings and "block" holds up the stream.
+# At most INTAKE_MAX_IN_FLIGHT readings are queued or processed behind it.
+intake = BoundedIntake(
+    dispatch,
+    capacity=int(os.environ.get("INTAKE_CAPACITY", "1000")),
+    policy=os.environ.get("INTAKE_POLICY", "latest"),
+    max_in_flight=int(os.environ.get("INTAKE_MAX_IN_FLIGHT", str(INGRESS_LANES * 64))),
+)
+metrics.gauge("ingress_intake_depth", "Readings waiting in the intake", lambda: intake.depth)
+metrics.gauge("ingress_intake_in_flight", "Readings dispatched and not yet handled", lambda: intake.in_flight)
+metrics.counter_func("ingress_intake_coalesced_total", "Readings replaced by a newer reading of the same sensor",
+                     lambda: intake.coalesced)
+metrics.counter_func("ingress_intake_dropped_total", "Readings shed because the intake was full",
+                     lambda: intake.dropped)
+
+# FEATURE_STATS selects the standardization: "static" keeps the training constants,
+# "active" follows the snapshot promoted in MongoDB and "latest" the newest snapshot
+# of the streaming feature statistics (see feature_stats.py). Snapshots are polled
+# every FEATURE_STATS_POLL_SECONDS and swapped in without a restart.
+FEATURE_STATS = os.environ.get("FEATURE_STATS", "static")
+
+def use_feature_stats(snapshot):
+    global standardizer
+    standardizer = standardizer_from_snapshot(snapshot)
+    print(f"Standardizing with feature statistics version {snapshot['_id']} ({snapshot['count']} readings)")
+
+stats_watcher = None
+if FEATURE_STATS != "static":
+    stats_watcher = SnapshotWatcher(
+        client.GOCI, use_feature_stats, mode=FEATURE_STATS,
+        poll_seconds=float(os.environ.get("FEATURE_STATS_POLL_SECONDS", "30")),
+    )
+    stats_watcher.start()
+metrics.gauge("ingress_feature_stats_version", "Feature statistics snapshot in use (0: training constants)",
+              lambda: (stats_watcher.version or 0) if stats_watcher is not None else 0)
+
+# INGRESS_SHARDING=1 lets several replicas share the stream: sensor keys hash to
+# INGRESS_PARTITIONS partitions, leased in MongoDB, and each replica only
+# classifies the keys of the partitions it currently owns.
+lease_manager = None
+if os.environ.get("INGRESS_SHARDING", "0") == "1":
+    lease_manager = LeaseManager(client.GOCI, partitions=int(os.environ.get("INGRESS_PARTITIONS", "64")))
+    lease_manager.start()
 
 def stream_handler(message):
     """
     Callback triggered on data changes.
-    Prints the event details and submits sensor data to the thread pool for processing.
+    Prints the event details and puts sensor data into the intake for processing.
     """
     print("-----")
     print("Event:", message["event"])
@@ -124,11 +361,18 @@ def stream_handler(message):
     print("Data:", message["data"])
     print("-----\n")
     
-    sensor_data = message["data"]
-    # Ensure sensor_data is a dictionary before processing.
-    if isinstance(sensor_data, dict):
-        # Offload heavy processing to the thread pool.
-        executor.submit(process_sensor_data, sensor_data)
+    # One event can carry a single reading or one reading per sensor (sensor_data/<sensor_id>).
+    for key, sensor_data in iter_sensor_readings(message):
+        if lease_manager is not None and not lease_manager.owns(key):
+            # Another replica owns this sensor's partition.
+            skipped_total.inc()
+            continue
+        events_total.inc()
+        events_per_second.mark()
+        intake.put(key, (sensor_data, time.perf_counter()))
+
+if metrics.enabled:
+    start_http_server(metrics, int(os.environ.get("METRICS_PORT", "4000")))
 
 # Start the Firebase stream listener on the "sensor_data" node.
 my_stream = db.child("sensor_data").stream(stream_handler)
@@ -142,4 +386,19 @@ try:
 except KeyboardInterrupt:
     print("Stream stopped.")
     my_stream.close()
+    if lease_manager is not None:
+        lease_manager.stop()
+    if stats_watcher is not None:
+        stats_watcher.stop()
+    if model_watcher is not None:
+        model_watcher.stop()
+    intake.close()
+    print(intake.report())
     executor.shutdown(wait=True)
+    for batcher in batchers:
+        batcher.close()
+        print(batcher.report())
+    alert_dispatcher.close()
+    print(alert_dispatcher.report())
+    write_buffer.close()
+    print(write_buffer.report())
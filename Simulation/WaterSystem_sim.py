@@ -1,11 +1,14 @@
 import tkinter as tk
 from PIL import Image, ImageTk
-import random
 import threading
 import pyrebase  # Install with pip install pyrebase4
+import os
 import time
+from datetime import datetime
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
+from sim_core import SensorArray, TIMESTAMP_FORMAT
+from write_buffer import WriteBuffer
 
 # Firebase configuration – replace these with your actual credentials
 firebaseConfig = {
@@ -22,7 +25,11 @@ db = firebase.database()
 # MongoDB configuration
 mongo_uri = ""
 client = MongoClient(mongo_uri, server_api=ServerApi('1'))
-db_collection = client.GOCI.sensors
+
+# Readings are appended to a local write-ahead log (WRITE_BUFFER_DIR) and
+# flushed to the "sensors" collection in batches by a background thread, so
+# they are kept through a MongoDB slowdown or outage and replayed after a crash.
+write_buffer = WriteBuffer(client.GOCI, os.environ.get("WRITE_BUFFER_DIR", "sensor_write_buffer"))
 
 try:
     client.admin.command('ping')
@@ -30,29 +37,43 @@ try:
 except Exception as e:
     print(f"MongoDB connection error: {e}")
 
+# SENSOR_ID names this pipe when several simulators (sites) share the database:
+# readings then go to "sensor_data/<SENSOR_ID>" and carry a Sensor_id field.
+# Unset keeps the single-pipe layout with readings written to "sensor_data".
+SENSOR_ID = os.environ.get("SENSOR_ID")
+
 def update_firebase(data):
+    # Sent_at stamps the reading so ingress can measure end-to-end latency
+    data = dict(data, Sent_at=time.time())
     try:
-        db.child("sensor_data").set(data)
+        if SENSOR_ID:
+            db.child("sensor_data").child(SENSOR_ID).set(data)
+        else:
+            db.child("sensor_data").set(data)
     except Exception as e:
         print("Firebase update error:", e)
 
 def store_mongo(data):
     try:
-        db_collection.insert_one(data)
-        print("Data sent to MongoDB:", data)
+        # Parse the timestamp once at write time so readers don't have to.
+        document = dict(data, Time=datetime.strptime(data['Timestamp'], TIMESTAMP_FORMAT))
+        write_buffer.insert("sensors", document)
+        print("Data queued for MongoDB:", data)
     except Exception as e:
-        print("MongoDB insert error:", e)
+        print("MongoDB write buffer error:", e)
 
 class WaterSystemSimulation:
+    """
+    Tkinter front end for a single simulated pipe. The sensor values come from
+    the shared simulation core (sim_core.SensorArray), which load_generator.py
+    also uses headless for many sensors.
+    """
     def __init__(self, master):
         self.master = master
         master.title("Water Supply System Simulation")
 
-        # Sensor variables
-        self.pressure = 100    # arbitrary starting pressure value
-        self.flow_rate = 50    # arbitrary starting flow rate
-        self.water_quality = 100  # quality index (100 means ideal)
-        self.temperature = 20  # in Celsius
+        # Sensor variables: one simulated pipe
+        self.sensors = SensorArray(n=1)
 
         # Create main frame with two columns: left (canvas) and right (readings & buttons)
         self.main_frame = tk.Frame(master)
@@ -118,18 +139,25 @@ class WaterSystemSimulation:
         # Create a leak indicator that can change color (default green)
         self.leak_indicator = self.canvas.create_oval(240-10, 150-10, 240+10, 150+10, fill="green")
 
+    @property
+    def pressure(self):
+        return float(self.sensors.state[0, 0])
+
+    @property
+    def flow_rate(self):
+        return float(self.sensors.state[0, 1])
+
+    @property
+    def water_quality(self):
+        return float(self.sensors.state[0, 2])
+
+    @property
+    def temperature(self):
+        return float(self.sensors.state[0, 3])
+
     def update_simulation(self):
-        # Normal random variations in sensor readings
-        self.pressure += random.uniform(-0.5, 0.5)
-        self.flow_rate += random.uniform(-0.3, 0.3)
-        self.water_quality += random.uniform(-0.2, 0.2)
-        self.temperature += random.uniform(-0.2, 0.2)
-
-        # Ensure the values remain within realistic ranges
-        self.pressure = max(0, min(120, self.pressure))
-        self.flow_rate = max(0, min(100, self.flow_rate))
-        self.water_quality = max(0, min(100, self.water_quality))
-        self.temperature = max(-10, min(40, self.temperature))
+        # Normal random variations in sensor readings, clamped to realistic ranges
+        self.sensors.step()
 
         # Update sensor labels
         self.pressure_label.config(text=f"Water Pressure: {self.pressure:.1f}")
@@ -145,42 +173,43 @@ class WaterSystemSimulation:
 
         # Create the data dictionary with a timestamp
         data = {
-            'Timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'Timestamp': time.strftime(TIMESTAMP_FORMAT),
             "Pressure": self.pressure,
             "Flow_rate": self.flow_rate,
             "Water_quality": self.water_quality,
             "Temperature": self.temperature
         }
+        if SENSOR_ID:
+            data["Sensor_id"] = SENSOR_ID
 
         # Offload Firebase update to a separate thread so it doesn't block the GUI
         threading.Thread(target=update_firebase, args=(data,), daemon=True).start()
 
-        # Offload MongoDB storage to a separate thread so it doesn't block the GUI
-        threading.Thread(target=store_mongo, args=(data,), daemon=True).start()
+        # Appending to the write buffer is local and fast; the flush to MongoDB runs in the background
+        store_mongo(data)
 
         # Continue updating every 500 ms
         self.master.after(500, self.update_simulation)
 
     def simulate_leak(self):
         # Simulate a pipe leak: drop water pressure significantly
-        self.pressure -= random.uniform(10, 20)
-        self.pressure = max(0, self.pressure)
+        self.sensors.simulate_leak()
         # Visual change: change leak indicator to red
         self.canvas.itemconfig(self.leak_indicator, fill="red")
 
     def drop_quality(self):
         # Simulate a drop in water quality (e.g., contamination)
-        self.water_quality -= random.uniform(20, 30)
-        self.water_quality = max(0, self.water_quality)
+        self.sensors.drop_quality()
         # Visual change: if quality falls, indicator turns red
         self.canvas.itemconfig(self.leak_indicator, fill="red")
 
     def adjust_temperature(self):
         # Simulate a temperature adjustment (e.g., due to environmental effects)
-        self.temperature -= random.uniform(5, 10)
-        self.temperature = max(-10, self.temperature)
+        self.sensors.adjust_temperature()
 
 if __name__ == "__main__":
     root = tk.Tk()
     sim = WaterSystemSimulation(root)
     root.mainloop()
+    write_buffer.close()
+    print(write_buffer.report())
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class AlertDispatcher:
+    """
+    Deliver Telegram alerts and MongoDB status writes off the inference path.
+
+    status_changed() only appends to a bounded queue and returns. A background
+    thread drains everything queued so far, collapses it (only the newest
+    status per sensor key is written, and repeated identical alerts are sent
+    once), and delivers with retry and exponential backoff. When the queue is full the
+    oldest pending event is dropped, so the newest status always gets through.
+    """
+
+    def __init__(self, send_alert, write_status, max_queue=1000, max_retries=5,
+                 base_backoff=0.5, max_backoff=30.0, latency_window=1000):
+        self.send_alert = send_alert
+        self.write_status = write_status
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+
+        # Delivery statistics
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.collapsed = 0
+        self._latencies = deque(maxlen=latency_window)
+
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    def status_changed(self, status, alert_message=None, key=None):
+        """
+        Queue a status transition of one sensor key and, optionally, an alert to send for it.
+        write_status is called as write_status(status, key).
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append((key, status, alert_message, time.perf_counter()))
+            self._cond.notify()
+
+    def _drain(self):
+        with self._cond:
+            while not self._pending and not self._stop:
+                self._cond.wait()
+            events = list(self._pending)
+            self._pending.clear()
+        return events
+
+    def _collapse(self, events):
+        """
+        Keep alerts that differ from the previous one and only the newest status per key.
+        """
+        alerts = []
+        statuses = {}
+        for key, status, alert_message, enqueued in events:
+            statuses.pop(key, None)
+            statuses[key] = (status, enqueued)
+            if alert_message is None:
+                continue
+            if alerts and alerts[-1][0] == alert_message:
+                self.collapsed += 1
+                continue
+            alerts.append((alert_message, enqueued))
+        # Only the newest status of each key needs to be written
+        self.collapsed += len(events) - len(statuses)
+        return alerts, statuses
+
+    def _deliver(self, fn, args, enqueued):
+        for attempt in range(self.max_retries + 1):
+            try:
+                fn(*args)
+                self.delivered += 1
+                self._latencies.append(time.perf_counter() - enqueued)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Giving up on {fn.__name__} after {attempt + 1} attempts: {e}")
+                    self.failed += 1
+                    return False
+                time.sleep(min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def _run(self):
+        while True:
+            events = self._drain()
+            if not events:
+                return
+            alerts, statuses = self._collapse(events)
+            for alert_message, enqueued in alerts:
+                self._deliver(self.send_alert, (alert_message,), enqueued)
+            for key, (status, enqueued) in statuses.items():
+                self._deliver(self.write_status, (status, key), enqueued)
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+        return {
+            "queue_depth": self.queue_depth,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "collapsed": self.collapsed,
+            "delivery_latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "delivery_latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+        }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"Alerts queue depth: {s['queue_depth']}, delivered: {s['delivered']}, failed: {s['failed']}, "
+            f"dropped: {s['dropped']}, collapsed: {s['collapsed']}, "
+            f"delivery latency p50: {s['delivery_latency_p50_ms']:.1f} ms, p99: {s['delivery_latency_p99_ms']:.1f} ms"
+        )
+
+    def close(self):
+        """
+        Deliver what is already queued, then stop the worker thread.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join()
@@ -0,0 +1,84 @@
+"""
+Read side of the streaming per-feature statistics of the sensor readings.
+
+The statistics are kept current and published as versioned snapshots in the
+feature_stats collection by predict's FeatureStatsUpdater (see
+predict/feature_stats.py, which also promotes a snapshot to "active"):
+
+    {'_id': <version>, 'created_at', 'watermark', 'count', 'features',
+     'mean': [...], 'std': [...], 'min': [...], 'max': [...]}
+
+Ingress picks a snapshot with SnapshotWatcher and swaps its standardizer when
+it changes: "latest" follows every new snapshot, "active" only the promoted
+one, since a trained model expects the scaling it was trained with.
+"""
+import threading
+
+import numpy as np
+from pymongo import DESCENDING
+
+from preprocessing import FEATURES, Standardizer
+
+ACTIVE_ID = 'active'
+
+
+def _column(snapshot, key, features):
+    index = {name: i for i, name in enumerate(snapshot['features'])}
+    return [snapshot[key][index[name]] for name in features]
+
+
+def standardizer_from_snapshot(snapshot, features=FEATURES):
+    stds = np.array(_column(snapshot, 'std', features))
+    # A constant feature is only centered
+    stds[stds == 0] = 1.0
+    return Standardizer(_column(snapshot, 'mean', features), stds)
+
+
+def latest_snapshot(db):
+    return db.feature_stats.find_one({}, sort=[('_id', DESCENDING)])
+
+
+def active_snapshot(db):
+    pointer = db.feature_stats_state.find_one({'_id': ACTIVE_ID})
+    return db.feature_stats.find_one({'_id': pointer['version']}) if pointer else None
+
+
+class SnapshotWatcher:
+    """
+    Poll for the snapshot selected by mode ("active" or "latest") and call
+    on_change(snapshot) from a daemon thread whenever its version changes.
+    """
+
+    def __init__(self, db, on_change, mode='active', poll_seconds=30.0):
+        if mode not in ('active', 'latest'):
+            raise ValueError(f"Unknown feature statistics mode {mode!r}, expected 'active' or 'latest'")
+        self.db = db
+        self.on_change = on_change
+        self.fetch = active_snapshot if mode == 'active' else latest_snapshot
+        self.poll_seconds = poll_seconds
+        self.version = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="feature-stats-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def check(self):
+        snapshot = self.fetch(self.db)
+        if snapshot is not None and snapshot['_id'] != self.version:
+            self.on_change(snapshot)
+            self.version = snapshot['_id']
+            return True
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print("Feature statistics watcher error:", e)
+            self._stop.wait(self.poll_seconds)
+
+    def stop(self):
+        self._stop.set()
+
@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict, deque
+
+POLICIES = ("latest", "drop_oldest", "block")
+
+
+class BoundedIntake:
+    """
+    Bounded buffer between the Firebase stream and inference.
+
+    put() holds at most `capacity` readings. What happens when more arrive
+    than inference keeps up with depends on the policy:
+
+    - "latest": one pending reading per sensor key. A newer reading replaces
+      the pending one in place (coalesced), since with Firebase set semantics
+      only the newest value of a node matters. A new key arriving at capacity
+      evicts the oldest pending key (dropped).
+    - "drop_oldest": FIFO of readings; at capacity the oldest is dropped.
+    - "block": FIFO of readings; put() waits for space, pushing back on the stream.
+
+    A dispatcher thread hands readings to dispatch_fn(key, item) in order
+    while fewer than max_in_flight are being processed downstream; call
+    done() when one has been handled. This bounds the queues behind the
+    intake too, so a reading never waits behind an unbounded backlog.
+    """
+
+    def __init__(self, dispatch_fn, capacity=1000, policy="latest", max_in_flight=256):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown intake policy {policy!r}, expected one of {POLICIES}")
+        self.dispatch_fn = dispatch_fn
+        self.capacity = capacity
+        self.policy = policy
+        self.max_in_flight = max_in_flight
+
+        self._pending = OrderedDict() if policy == "latest" else deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stop = False
+
+        # Intake statistics
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.dispatched = 0
+
+        self._thread = threading.Thread(target=self._run, name="intake", daemon=True)
+        self._thread.start()
+
+    def put(self, key, item):
+        with self._cond:
+            self.received += 1
+            if self.policy == "latest":
+                if key in self._pending:
+                    # Keeps its place in line with the newer value
+                    self._pending[key] = item
+                    self.coalesced += 1
+                    return
+                if len(self._pending) >= self.capacity:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[key] = item
+            elif self.policy == "drop_oldest":
+                if len(self._pending) >= self.capacity:
+                    self._pending.popleft()
+                    self.dropped += 1
+                self._pending.append((key, item))
+            else:
+                while len(self._pending) >= self.capacity and not self._stop:
+                    self._cond.wait()
+                self._pending.append((key, item))
+            self._cond.notify_all()
+
+    def done(self):
+        """
+        Mark one dispatched reading as handled, making room for the next.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _next(self):
+        with self._cond:
+            while not (self._pending and self._in_flight < self.max_in_flight):
+                if self._stop and not self._pending:
+                    return None
+                self._cond.wait()
+            if self.policy == "latest":
+                entry = self._pending.popitem(last=False)
+            else:
+                entry = self._pending.popleft()
+            self._in_flight += 1
+            self.dispatched += 1
+            # Wake producers blocked on a full intake
+            self._cond.notify_all()
+            return entry
+
+    def _run(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            try:
+                self.dispatch_fn(*entry)
+            except Exception as e:
+                print("Intake dispatch error:", e)
+                self.done()
+
+    @property
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    @property
+    def in_flight(self):
+        with self._cond:
+            return self._in_flight
+
+    def stats(self):
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "depth": len(self._pending),
+                "in_flight": self._in_flight,
+                "received": self.received,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "dispatched": self.dispatched,
+            }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"Intake ({s['policy']}) depth: {s['depth']}, in flight: {s['in_flight']}, "
+            f"received: {s['received']}, coalesced: {s['coalesced']}, dropped: {s['dropped']}, "
+            f"dispatched: {s['dispatched']}"
+        )
+
+    def close(self):
+        """
+        Dispatch what is still pending, then stop the dispatcher thread.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
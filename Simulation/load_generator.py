@@ -0,0 +1,146 @@
+"""
+Headless, high-rate load generator on the shared simulation core.
+
+Simulates many pipe sensors with vectorized random walks (same variation,
+clamping and leak / quality / temperature injections as the GUI) and writes
+their readings to MongoDB with bulk insert_many through one pooled client.
+
+Usage:
+    python load_generator.py --mongo-uri mongodb://localhost:27017 \
+        --sensors 5000 --rate 20000 --duration 60
+    python load_generator.py --dry-run --sensors 5000 --rate 100000 --duration 10
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sim_core import SensorArray
+
+
+class LoadGenerator:
+    """
+    Emit one reading per sensor per tick, pacing ticks to the target rate
+    (readings per second), and hand the documents to a pool of writer threads
+    in insert_many batches.
+    """
+
+    def __init__(self, collection, sensors, rate, batch_size=5000, writers=4, inject_probability=0.001, seed=None):
+        self.collection = collection
+        self.array = SensorArray(n=sensors, seed=seed)
+        self.rate = rate
+        self.batch_size = batch_size
+        self.inject_probability = inject_probability
+        self.executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="writer")
+        # Bound the number of batches waiting for a writer so a slow database
+        # slows generation down instead of growing memory.
+        self._in_flight = threading.BoundedSemaphore(writers * 2)
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.written = 0
+        self.errors = 0
+
+    def _write(self, docs):
+        try:
+            if self.collection is not None:
+                # Insertion time (UTC), which consumers of new readings page through
+                inserted_at = datetime.now(timezone.utc)
+                for doc in docs:
+                    doc["Inserted_at"] = inserted_at
+                self.collection.insert_many(docs, ordered=False)
+            with self._lock:
+                self.written += len(docs)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print("MongoDB insert error:", e)
+        finally:
+            self._in_flight.release()
+
+    def _submit(self, docs):
+        self._in_flight.acquire()
+        self.executor.submit(self._write, docs)
+
+    def run(self, duration):
+        tick_interval = self.array.n / self.rate
+        start_wall = datetime.now()
+        started = time.perf_counter()
+        next_tick = started
+        tick = 0
+        pending = []
+
+        while time.perf_counter() - started < duration:
+            self.array.step()
+            if self.inject_probability:
+                self.array.inject_random(self.inject_probability)
+            # Simulated time advances by one tick interval per tick
+            docs = self.array.readings(now=start_wall + timedelta(seconds=tick * tick_interval))
+            self.generated += len(docs)
+            pending.extend(docs)
+            while len(pending) >= self.batch_size:
+                self._submit(pending[:self.batch_size])
+                pending = pending[self.batch_size:]
+
+            tick += 1
+            next_tick += tick_interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if pending:
+            self._submit(pending)
+        self.executor.shutdown(wait=True)
+        elapsed = time.perf_counter() - started
+        return {
+            "sensors": self.array.n,
+            "target_rate": self.rate,
+            "duration_s": elapsed,
+            "generated": self.generated,
+            "written": self.written,
+            "write_errors": self.errors,
+            "achieved_rate": self.written / elapsed if elapsed else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default="")
+    parser.add_argument('--db', default='GOCI')
+    parser.add_argument('--collection', default='sensors')
+    parser.add_argument('--sensors', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=2000, help='target readings per second')
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--inject-probability', type=float, default=0.001,
+                        help='per-tick probability of each injection per sensor')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='generate without writing to MongoDB')
+    args = parser.parse_args()
+
+    collection = None
+    if not args.dry_run:
+        from pymongo import MongoClient
+        from pymongo.server_api import ServerApi
+
+        client = MongoClient(args.mongo_uri, server_api=ServerApi('1'), maxPoolSize=args.writers)
+        collection = client[args.db][args.collection]
+
+    generator = LoadGenerator(
+        collection,
+        sensors=args.sensors,
+        rate=args.rate,
+        batch_size=args.batch_size,
+        writers=args.writers,
+        inject_probability=args.inject_probability,
+        seed=args.seed,
+    )
+    result = generator.run(args.duration)
+    print(f"Sensors: {result['sensors']}, target rate: {result['target_rate']:.0f} readings/s")
+    print(f"Generated: {result['generated']}, written: {result['written']}, write errors: {result['write_errors']}")
+    print(f"Achieved rate: {result['achieved_rate']:.0f} readings/s over {result['duration_s']:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
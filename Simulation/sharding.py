@@ -0,0 +1,148 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from partitioned import partition
+
+# Key used for readings written straight to the "sensor_data" node (single-pipe layout)
+DEFAULT_SENSOR_KEY = "sensor_data"
+
+
+def iter_sensor_readings(message):
+    """
+    Yield (sensor_key, reading) pairs from a Firebase stream message.
+
+    Supports both layouts: a single reading set on "sensor_data" itself, and one
+    child per sensor ("sensor_data/<sensor_id>"), where the initial "put" at
+    "/" carries every child and later events carry one child's path.
+    """
+    data = message["data"]
+    path = message["path"].strip("/")
+    if not isinstance(data, dict):
+        return
+    if path:
+        # "/<sensor_id>" carries one sensor's reading; deeper paths are partial field updates
+        if "/" not in path:
+            yield data.get("Sensor_id", path), data
+        return
+    if "Pressure" in data:
+        yield data.get("Sensor_id", DEFAULT_SENSOR_KEY), data
+        return
+    for sensor_id, reading in data.items():
+        if isinstance(reading, dict):
+            yield reading.get("Sensor_id", sensor_id), reading
+
+
+class LeaseManager:
+    """
+    Split the sensor keyspace across ingress replicas with leases in MongoDB.
+
+    Keys hash to one of `partitions` partitions. Every replica heartbeats a
+    membership document; the live members, sorted by id, divide the
+    partitions round-robin, and each replica claims its share through lease
+    documents that expire after `ttl` seconds. A partition still leased by
+    another live replica is only taken over once that replica releases it
+    (after seeing the new membership) or its lease expires, so a partition
+    never has two owners. Joining or leaving replicas rebalance within about
+    one renew interval (or one ttl after a crash). When no renew has
+    succeeded for `ttl` seconds (e.g. MongoDB is unreachable), the leases may
+    already belong to another replica, so this one stops owning anything until
+    a renew succeeds again.
+    """
+
+    def __init__(self, db, replica_id=None, partitions=64, ttl=15.0, renew_every=5.0):
+        self.members = db.ingress_members
+        self.leases = db.ingress_leases
+        self.replica_id = replica_id or os.environ.get("HOSTNAME") or f"{socket.gethostname()}-{os.getpid()}"
+        self.partitions = partitions
+        self.ttl = ttl
+        self.renew_every = renew_every
+        self.owned = frozenset()
+        # Monotonic time until which the leases taken by the last successful renew hold
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def owns(self, key):
+        if self.owned and time.monotonic() >= self._valid_until:
+            self._expire()
+        return partition(key, self.partitions) in self.owned
+
+    def _expire(self):
+        if self.owned:
+            self.owned = frozenset()
+            print(f"Replica {self.replica_id} dropped its partitions: no lease renew succeeded within {self.ttl} s")
+
+    def _live_members(self, now):
+        return sorted(doc["_id"] for doc in self.members.find({"expires_at": {"$gt": now}}, {"_id": 1}))
+
+    def renew(self):
+        """
+        Heartbeat, recompute this replica's share, claim it and release the rest.
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        self.members.update_one({"_id": self.replica_id}, {"$set": {"expires_at": expires_at}}, upsert=True)
+
+        members = self._live_members(now)
+        if self.replica_id not in members:
+            members = sorted(members + [self.replica_id])
+        index = members.index(self.replica_id)
+        target = set(range(index, self.partitions, len(members)))
+
+        owned = set()
+        for p in target:
+            try:
+                self.leases.update_one(
+                    {"_id": p, "$or": [{"owner": self.replica_id}, {"owner": None}, {"expires_at": {"$lt": now}}]},
+                    {"$set": {"owner": self.replica_id, "expires_at": expires_at}},
+                    upsert=True,
+                )
+                owned.add(p)
+            except DuplicateKeyError:
+                # Still leased by another live replica; retry on the next renew
+                pass
+
+        released = self.owned - target
+        if released:
+            self.leases.update_many(
+                {"_id": {"$in": list(released)}, "owner": self.replica_id},
+                {"$set": {"owner": None, "expires_at": now}},
+            )
+
+        changed = owned != self.owned
+        self.owned = frozenset(owned)
+        self._valid_until = started + self.ttl
+        if changed:
+            print(f"Replica {self.replica_id} owns {len(owned)}/{self.partitions} partitions ({len(members)} live replicas)")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.renew()
+            except Exception as e:
+                print("Lease renew error:", e)
+                if time.monotonic() >= self._valid_until:
+                    self._expire()
+            self._stop.wait(self.renew_every)
+
+    def start(self):
+        self.renew()
+        self._thread = threading.Thread(target=self._run, name="lease-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Release every lease and leave the membership so others rebalance at once.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.leases.update_many({"owner": self.replica_id}, {"$set": {"owner": None, "expires_at": datetime.utcnow()}})
+        self.members.delete_one({"_id": self.replica_id})
+        self.owned = frozenset()
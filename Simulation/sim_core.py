@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import numpy as np
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Column order of the state array
+FEATURES = ['Pressure', 'Flow_rate', 'Water_quality', 'Temperature']
+
+# Starting values: pressure, flow rate, quality index (100 means ideal), temperature in Celsius
+START = np.array([100.0, 50.0, 100.0, 20.0])
+# Normal random variation per tick (uniform in [-step, step])
+STEP = np.array([0.5, 0.3, 0.2, 0.2])
+# Realistic ranges each value is clamped to
+LOWER = np.array([0.0, 0.0, 0.0, -10.0])
+UPPER = np.array([120.0, 100.0, 100.0, 40.0])
+
+
+class SensorArray:
+    """
+    Vectorized random-walk simulation of n pipe sensors.
+
+    state is an (n, 4) array in FEATURES order; step() advances every sensor
+    at once with the same variation and clamping as the original single-pipe
+    simulation, and the inject methods apply the leak, quality and
+    temperature events to a chosen subset of sensors.
+    """
+
+    def __init__(self, n=1, seed=None, prefix="pipe"):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.state = np.tile(START, (n, 1))
+        self.sensor_ids = [f"{prefix}-{i}" for i in range(n)]
+
+    def step(self):
+        self.state += self.rng.uniform(-1, 1, size=self.state.shape) * STEP
+        np.clip(self.state, LOWER, UPPER, out=self.state)
+
+    def simulate_leak(self, idx=slice(None)):
+        # Simulate a pipe leak: drop water pressure significantly
+        count = len(self.state[idx])
+        self.state[idx, 0] = np.maximum(0, self.state[idx, 0] - self.rng.uniform(10, 20, size=count))
+
+    def drop_quality(self, idx=slice(None)):
+        # Simulate a drop in water quality (e.g., contamination)
+        count = len(self.state[idx])
+        self.state[idx, 2] = np.maximum(0, self.state[idx, 2] - self.rng.uniform(20, 30, size=count))
+
+    def adjust_temperature(self, idx=slice(None)):
+        # Simulate a temperature adjustment (e.g., due to environmental effects)
+        count = len(self.state[idx])
+        self.state[idx, 3] = np.maximum(-10, self.state[idx, 3] - self.rng.uniform(5, 10, size=count))
+
+    def inject_random(self, probability):
+        """
+        Apply each injection independently to roughly probability * n sensors.
+        """
+        for inject in (self.simulate_leak, self.drop_quality, self.adjust_temperature):
+            idx = np.flatnonzero(self.rng.random(self.n) < probability)
+            if len(idx):
+                inject(idx)
+
+    def readings(self, now=None, include_sensor_id=None):
+        """
+        Build one reading document per sensor for the current state.
+        """
+        now = datetime.now() if now is None else now
+        now = now.replace(microsecond=0)
+        timestamp = now.strftime(TIMESTAMP_FORMAT)
+        if include_sensor_id is None:
+            include_sensor_id = self.n > 1
+        docs = []
+        for i, (pressure, flow_rate, water_quality, temperature) in enumerate(self.state.tolist()):
+            doc = {
+                'Timestamp': timestamp,
+                'Time': now,
+                'Pressure': pressure,
+                'Flow_rate': flow_rate,
+                'Water_quality': water_quality,
+                'Temperature': temperature,
+            }
+            if include_sensor_id:
+                doc['Sensor_id'] = self.sensor_ids[i]
+            docs.append(doc)
+        return docs
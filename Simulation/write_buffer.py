@@ -0,0 +1,368 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import bson
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process guard on the buffer directory
+    fcntl = None
+
+# MongoDB error code for a duplicate _id, i.e. a record that was already written
+DUPLICATE_KEY = 11000
+
+
+def _iter_records(path, start, end):
+    """
+    Yield (offset after the record, record) for the complete BSON records
+    between start and end. Stops at the first torn or corrupt record.
+    """
+    if start >= end:
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        while offset + 4 <= end:
+            header = f.read(4)
+            length = int.from_bytes(header, "little")
+            if length < 5 or offset + length > end:
+                return
+            data = header + f.read(length - 4)
+            if len(data) < length:
+                return
+            try:
+                record = bson.decode(data)
+            except Exception:
+                return
+            offset += length
+            yield offset, record
+
+
+class SegmentLog:
+    """
+    Append-only log of BSON records in numbered segment files, plus a
+    checkpoint of how far it has been consumed.
+
+    Records are written unbuffered, so they survive a crash of the process
+    (fsync() additionally covers a crash of the machine). On open, a torn
+    record at the end of the last segment is truncated, and everything after
+    the checkpoint is pending again. Segments are deleted once consumed.
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_file = self._acquire(directory)
+
+        self.checkpoint = self._load_checkpoint()
+        segments = [seq for seq in self._segments() if seq >= self.checkpoint[0]] or [self.checkpoint[0]]
+        for seq in self._segments():
+            if seq < self.checkpoint[0]:
+                os.remove(self._path(seq))
+
+        # Valid size of every segment and the pending records after the checkpoint
+        self._sizes = {}
+        self.pending_records = 0
+        self.oldest_pending_time = None
+        for seq in segments:
+            path = self._path(seq)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            start = self.checkpoint[1] if seq == self.checkpoint[0] else 0
+            valid = start
+            for valid, record in _iter_records(path, start, size):
+                self.pending_records += 1
+                if self.oldest_pending_time is None:
+                    self.oldest_pending_time = record.get("t")
+            if seq == segments[-1] and valid < size:
+                print(f"Write buffer: truncating {size - valid} bytes of a torn record in {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(valid)
+                size = valid
+            self._sizes[seq] = size
+
+        self.active = segments[-1]
+        self._file = open(self._path(self.active), "ab", buffering=0)
+
+    @staticmethod
+    def _acquire(directory):
+        lock_file = open(os.path.join(directory, "LOCK"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                raise RuntimeError(f"Write buffer {directory} is in use by another process")
+        return lock_file
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"segment-{seq:010d}.log")
+
+    def _segments(self):
+        return sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, "CHECKPOINT")) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_checkpoint(self, position):
+        path = os.path.join(self.directory, "CHECKPOINT")
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{position[0]} {position[1]}")
+        os.replace(path + ".tmp", path)
+
+    def append(self, record):
+        data = bson.encode(record)
+        with self._lock:
+            if self._sizes[self.active] >= self.segment_bytes:
+                # Roll over to a new segment
+                self._file.close()
+                self.active += 1
+                self._sizes[self.active] = 0
+                self._file = open(self._path(self.active), "ab", buffering=0)
+            self._file.write(data)
+            self._sizes[self.active] += len(data)
+            self.pending_records += 1
+            if self.oldest_pending_time is None:
+                self.oldest_pending_time = record.get("t")
+
+    def read(self, max_records):
+        """
+        Return (records, position) for up to max_records pending records after
+        the checkpoint; commit(position, records) once they are applied.
+        """
+        while True:
+            with self._lock:
+                seq, offset = self.checkpoint
+                end = self._sizes[seq]
+                finished = offset >= end and seq < self.active
+            if not finished:
+                break
+            # Segment fully consumed: move on to the next one
+            self._commit_position((seq + 1, 0))
+
+        records = []
+        position = (seq, offset)
+        for next_offset, record in _iter_records(self._path(seq), offset, end):
+            records.append(record)
+            position = (seq, next_offset)
+            if len(records) >= max_records:
+                break
+        return records, position
+
+    def _commit_position(self, position):
+        self._save_checkpoint(position)
+        with self._lock:
+            self.checkpoint = position
+            consumed = [seq for seq in self._sizes if seq < position[0]]
+            for seq in consumed:
+                del self._sizes[seq]
+        for seq in consumed:
+            os.remove(self._path(seq))
+
+    def commit(self, position, records):
+        self._commit_position(position)
+        with self._lock:
+            self.pending_records -= len(records)
+            if self.pending_records == 0:
+                self.oldest_pending_time = None
+            elif records:
+                # Lower bound for the next pending record
+                self.oldest_pending_time = records[-1].get("t")
+
+    def pending_bytes(self):
+        with self._lock:
+            return sum(self._sizes.values()) - self.checkpoint[1]
+
+    def segment_count(self):
+        with self._lock:
+            return len(self._sizes)
+
+    def sync(self):
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        self._lock_file.close()
+
+
+class WriteBuffer:
+    """
+    Accept MongoDB writes at once into a local SegmentLog and drain them to
+    MongoDB from a background thread.
+
+    insert() and update() only append to the log. The flusher reads up to
+    max_batch records and writes each run of inserts into one collection with
+    a single insert_many, and each run of upserts as one update_one per
+    filter (keeping only the last update of each). Then it advances the
+    checkpoint. Failed flushes are retried with exponential backoff, so
+    delivery is at-least-once: records still in the log after a crash are
+    replayed on the next start. Inserts carry an _id assigned at append time,
+    so a replayed insert that already reached MongoDB is skipped as a duplicate.
+    Inserted documents are stamped with Inserted_at, the UTC time of the flush
+    that writes them, so readers can follow the collection in insertion order
+    and still see records that were held back in the log. Readers re-read a
+    margin before their last cutoff (see predict/sensor_store.py), which covers
+    a slow insert_many and clock differences between hosts.
+    If given, on_flush(seconds) is called after every successful flush with
+    the time its MongoDB writes took, e.g. to feed metrics.
+    """
+
+    def __init__(self, db, directory, max_batch=5000, flush_interval=0.5, fsync_interval=1.0,
+                 base_backoff=0.5, max_backoff=30.0, report_every=60.0, on_flush=None):
+        self.db = db
+        self.on_flush = on_flush
+        self.log = SegmentLog(directory)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.report_every = report_every
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+        # Flush statistics
+        self.flushed = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+        if self.log.pending_records:
+            print(f"Write buffer: replaying {self.log.pending_records} records from {directory}")
+        self._thread = threading.Thread(target=self._run, name="write-buffer", daemon=True)
+        self._thread.start()
+
+    def insert(self, collection, doc):
+        doc = dict(doc)
+        doc.setdefault("_id", ObjectId())
+        self.log.append({"t": time.time(), "c": collection, "op": "insert", "doc": doc})
+        self._wakeup.set()
+
+    def update(self, collection, filter, update):
+        """
+        Queue an upsert (update_one(filter, update, upsert=True)).
+        """
+        self.log.append({"t": time.time(), "c": collection, "op": "update", "filter": filter, "update": update})
+        self._wakeup.set()
+
+    def _insert_many(self, collection, docs):
+        inserted_at = datetime.now(timezone.utc)
+        for doc in docs:
+            doc["Inserted_at"] = inserted_at
+        try:
+            self.db[collection].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Documents written before a crash come back as duplicates on replay
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+
+    def _update_many(self, collection, updates):
+        latest = {}
+        for record in updates:
+            latest[bson.encode(record["filter"])] = record
+        for record in latest.values():
+            self.db[collection].update_one(record["filter"], record["update"], upsert=True)
+
+    def _apply(self, records):
+        """
+        Write records in order, one call per run of the same collection and operation.
+        """
+        run = []
+        for record in records + [None]:
+            if run and (record is None or (record["c"], record["op"]) != (run[0]["c"], run[0]["op"])):
+                if run[0]["op"] == "insert":
+                    self._insert_many(run[0]["c"], [r["doc"] for r in run])
+                else:
+                    self._update_many(run[0]["c"], run)
+                run = []
+            if record is not None:
+                run.append(record)
+
+    def _run(self):
+        failures = 0
+        last_sync = last_report = time.monotonic()
+        while True:
+            records, position = self.log.read(self.max_batch)
+            if records:
+                try:
+                    started = time.perf_counter()
+                    self._apply(records)
+                    if self.on_flush is not None:
+                        self.on_flush(time.perf_counter() - started)
+                    self.log.commit(position, records)
+                    self.flushed += len(records)
+                    self.flushes += 1
+                    failures = 0
+                except Exception as e:
+                    self.flush_errors += 1
+                    failures += 1
+                    print("Write buffer flush error:", e)
+                    if self._stop.is_set():
+                        # Closing: leave the rest for replay
+                        return
+                    self._stop.wait(min(self.max_backoff, self.base_backoff * 2 ** (failures - 1)))
+            else:
+                if self._stop.is_set():
+                    return
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+
+            now = time.monotonic()
+            if now - last_sync >= self.fsync_interval:
+                self.log.sync()
+                last_sync = now
+            if self.report_every and now - last_report >= self.report_every and self.log.pending_records:
+                print(self.report())
+                last_report = now
+
+    def stats(self):
+        oldest = self.log.oldest_pending_time
+        return {
+            "pending_records": self.log.pending_records,
+            "pending_bytes": self.log.pending_bytes(),
+            "segments": self.log.segment_count(),
+            "flush_lag_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"Write buffer pending: {s['pending_records']} records ({s['pending_bytes'] / 1024:.1f} KiB "
+            f"in {s['segments']} segments), flush lag: {s['flush_lag_seconds']:.1f} s, "
+            f"flushed: {s['flushed']} in {s['flushes']} batches, flush errors: {s['flush_errors']}"
+        )
+
+    def close(self, timeout=5.0):
+        """
+        Try to drain for up to timeout seconds, then stop. Whatever is left
+        stays in the log and is replayed on the next start.
+        """
+        deadline = time.monotonic() + timeout
+        while self.log.pending_records and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=max(0.0, deadline - time.monotonic()) + 1)
+        if self.log.pending_records:
+            print(f"Write buffer: {self.log.pending_records} records left for replay")
+        self.log.sync()
+        self.log.close()
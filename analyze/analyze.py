@@ -1,143 +1,458 @@
-import pandas as pd
+import hashlib
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
 import numpy as np
-import requests
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense
-from flask import Flask, Response
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS, cross_origin
+from model_store import ModelStore
+from forecaster import NumpyForecaster, forecast
+from sensor_store import (
+    DEFAULT_SITE, IngestPosition, ensure_indexes, fetch_readings, iter_reading_batches, count_since, format_timestamp,
+    latest_timestamp, utc_now,
+)
+from coalesce import SingleFlight, ResultCache
+from weather import OpenWeatherProvider, FileProvider, CircuitBreaker, AmbientTemperatureCache
+from metrics import DEFAULT_BUCKETS, instrument_flask, registry_from_env
+from rollups import RESOLUTIONS, rollup_collection
+from pipeline import (
+    features, window_size, train_size, time_step, num_steps,
+    train_model, dynamic_temperature_threshold, anomaly_percentages, render_summary,
+)
+from feature_stats import latest_snapshot, scaler_from_snapshot
+from jobs import DONE, MODELS, JobManager, JobQueueFull
+from streaming import StreamingDetector
 
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+mongo_uri = "############################################"
+
+# One pooled client shared by the request handlers and the trainer thread.
+client = MongoClient(mongo_uri, server_api=ServerApi('1'), maxPoolSize=int(os.environ.get("MONGO_MAX_POOL_SIZE", "20")))
+# ANALYZE_RESOLUTION "raw" analyzes individual readings; "1m", "1h" or "1d" analyzes
+# the per-bucket means of the rollup collections (see rollups.py) instead.
+ANALYZE_RESOLUTION = os.environ.get("ANALYZE_RESOLUTION", "raw")
+db_collection = rollup_collection(client.GOCI, ANALYZE_RESOLUTION)
+# ANALYZE_SITE is the Sensor_id whose readings the model is trained on and GET /
+# analyzes unless the request names another ?site=; the default, DEFAULT_SITE,
+# is the readings without a Sensor_id (single-sensor deployments).
+ANALYZE_SITE = os.environ.get("ANALYZE_SITE", DEFAULT_SITE)
+
+# Concurrent identical requests share one computation; rendered summaries are
+# cached until a new reading, a new model or a different temperature bucket.
+single_flight = SingleFlight()
+summary_cache = ResultCache()
+
+# Request and stage latency histograms served at /metrics in the Prometheus text
+# format. METRICS_ENABLED=0 turns every metric into a no-op.
+metrics = registry_from_env()
+instrument_flask(app, metrics, "analyze")
+# Training runs for minutes, so the stage buckets go further than the default
+stage_seconds = metrics.histogram("analyze_stage_seconds", "Time spent in each analysis stage", labels=("stage",),
+                                  buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0, 900.0))
+mongo_read_seconds = stage_seconds.labels("mongo_read")
+forecast_seconds = stage_seconds.labels("forecast")
+train_seconds = stage_seconds.labels("train")
+job_seconds = stage_seconds.labels("job")
+streaming_seconds = stage_seconds.labels("streaming_update")
+summary_cache_total = metrics.counter("analyze_summary_cache_total", "Summary cache lookups by result", labels=("result",))
+
+# Background training: retrain when this many new readings have arrived since the
+# stored model's watermark, or when the stored model is older than the interval.
+model_store = ModelStore(os.environ.get("MODEL_STORE_DIR", "models"))
+RETRAIN_MIN_NEW_READINGS = int(os.environ.get("RETRAIN_MIN_NEW_READINGS", "500"))
+RETRAIN_INTERVAL_SECONDS = int(os.environ.get("RETRAIN_INTERVAL_SECONDS", "3600"))
+TRAINER_POLL_SECONDS = int(os.environ.get("TRAINER_POLL_SECONDS", "30"))
+
+# ANALYZE_SCALER "fit" fits the scaler on the training window; "stats" takes the
+# [0, 1] scaling from the latest snapshot of the streaming feature statistics
+# (see feature_stats.py) and retrains when a new snapshot appears.
+ANALYZE_SCALER = os.environ.get("ANALYZE_SCALER", "fit")
+
+# FORECAST_MODE "numpy" runs the LSTM recursion in NumPy (see forecaster.py),
+# "keras" keeps the reference loop of one model.predict call per step.
+FORECAST_MODE = os.environ.get("FORECAST_MODE", "numpy")
+_forecasters = {}
+
+# ANALYZE_MODE "batch" forecasts the last 120 readings of the 500-reading window on
+# request; "streaming" flags every new reading of ANALYZE_SITE against a one-step-ahead
+# forecast as it arrives (see streaming.py) and GET / returns the rolling anomaly rates
+# over the last STREAMING_WINDOWS readings at once. New readings are polled every
+# STREAMING_POLL_SECONDS by the time they were written (Inserted_at, see
+# sensor_store.py), up to INGEST_LAG_SECONDS before now, re-reading
+# INGEST_OVERLAP_SECONDS before the previous poll so readings whose insert was
+# still in flight are not skipped. A rollup bucket rewritten by a late reading
+# is fed again with its corrected means.
+ANALYZE_MODE = os.environ.get("ANALYZE_MODE", "batch")
+STREAMING_WINDOWS = [int(w) for w in os.environ.get("STREAMING_WINDOWS", "120,1000").split(",")]
+STREAMING_POLL_SECONDS = float(os.environ.get("STREAMING_POLL_SECONDS", "1"))
+INGEST_LAG_SECONDS = float(os.environ.get("INGEST_LAG_SECONDS", "5"))
+INGEST_OVERLAP_SECONDS = float(os.environ.get("INGEST_OVERLAP_SECONDS", "60"))
+streaming_detector = StreamingDetector(windows=STREAMING_WINDOWS)
+
+# Forecast-and-detect jobs (POST /jobs, see jobs.py) run in ANALYZE_JOB_WORKERS
+# processes, by default all cores but one so the HTTP server is never starved.
+# At most ANALYZE_MAX_PENDING_JOBS are queued or running per replica; jobs that
+# train their own model fit it for ANALYZE_JOB_EPOCHS epochs.
+ANALYZE_JOB_WORKERS = int(os.environ.get("ANALYZE_JOB_WORKERS", "0")) or None
+ANALYZE_MAX_PENDING_JOBS = int(os.environ.get("ANALYZE_MAX_PENDING_JOBS", "32"))
+ANALYZE_JOB_EPOCHS = int(os.environ.get("ANALYZE_JOB_EPOCHS", "50"))
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
 # --------------------------
-# Function to get ambient temperature from OpenWeather API
-def get_ambient_temperature(city="Bangsar", api_key="##############################"):
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-    try:
-        response = requests.get(url)
-        data = response.json()
-        ambient_temp = data['main']['temp']
-        return ambient_temp
-    except Exception as e:
-        return 20  # default value
+# Ambient temperature enrichment: cached per city and refreshed in the background,
+# so requests never wait on OpenWeather. WEATHER_PROVIDER=file reads a local JSON
+# file instead; WEATHER_BASE_URL can point the API provider at a local stand-in.
+AMBIENT_CITY = os.environ.get("AMBIENT_CITY", "Bangsar")
+if os.environ.get("WEATHER_PROVIDER", "openweather") == "file":
+    weather_provider = FileProvider(os.environ.get("WEATHER_FILE", "weather.json"))
+else:
+    weather_provider = OpenWeatherProvider(
+        api_key=os.environ.get("OPENWEATHER_API_KEY", "##############################"),
+        base_url=os.environ.get("WEATHER_BASE_URL", "http://api.openweathermap.org/data/2.5/weather"),
+        timeout=float(os.environ.get("WEATHER_TIMEOUT_SECONDS", "3")),
+    )
+ambient_temperature = AmbientTemperatureCache(
+    weather_provider,
+    ttl=float(os.environ.get("WEATHER_TTL_SECONDS", "600")),
+    default=20.0,
+    breaker=CircuitBreaker(failure_threshold=3, reset_timeout=float(os.environ.get("WEATHER_BREAKER_RESET_SECONDS", "60"))),
+)
 
-@app.route('/', methods=['GET'])
-@cross_origin()
+def get_ambient_temperature(city=AMBIENT_CITY):
+    """
+    Return (temperature, fetched_at, age_seconds) from the enrichment cache without blocking.
+    """
+    return ambient_temperature.get(city)
 
-def analyze():
-    # 1. Connect to MongoDB and fetch sensor data
-    mongo_uri = "############################################"
-    client = MongoClient(mongo_uri, server_api=ServerApi('1'))
-    db_collection = client.GOCI.sensors
-
-    cursor = db_collection.find({})
-    data_list = list(cursor)
-    df = pd.DataFrame(data_list)
-    if '_id' in df.columns:
-        df = df.drop(columns=['_id'])
-
-    # Convert Timestamp to datetime and sort
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'], format='%Y-%m-%d %H:%M:%S')
-    df = df.sort_values('Timestamp')
-
-    # 2. Use the last 500 readings (error if not enough records)
-    if len(df) >= 500:
-        df = df.iloc[-500:]
-    else:
-        return Response("Warning: less than 500 records available.", status=400, mimetype='text/plain')
+def fetch_recent_readings(db_collection, site=ANALYZE_SITE):
+    """
+    Load the last window_size readings of one site, oldest first, as (times, values) arrays.
+    """
+    return fetch_readings(db_collection, limit=window_size, features=features, site=site)
+
+def get_forecaster(model, version):
+    """
+    Build the NumPy forecaster once per stored model version.
+    """
+    if version not in _forecasters:
+        _forecasters.clear()
+        _forecasters[version] = NumpyForecaster(model)
+    return _forecasters[version]
+
+def current_snapshot():
+    return latest_snapshot(client.GOCI) if ANALYZE_SCALER == "stats" else None
 
-    # Define features and extract data
-    features = ['Pressure', 'Flow_rate', 'Water_quality', 'Temperature']
-    data = df[features].values
+def needs_training(db_collection, snapshot):
+    """
+    Decide whether the stored model is missing or stale.
+    """
+    meta = model_store.latest_metadata()
+    if meta is None or meta.get('resolution', 'raw') != ANALYZE_RESOLUTION:
+        return True
+    if snapshot is not None and meta.get('stats_version') != snapshot['_id']:
+        return True
+    trained_at = time.mktime(time.strptime(meta['trained_at'], '%Y-%m-%d %H:%M:%S'))
+    if time.time() - trained_at >= RETRAIN_INTERVAL_SECONDS:
+        return True
+    new_readings = count_since(db_collection, meta['watermark'], site=ANALYZE_SITE)
+    return new_readings >= RETRAIN_MIN_NEW_READINGS
 
-    # 3. Normalize the data to [0,1]
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(data)
+def train_and_store(snapshot):
+    """
+    Train on the recent window and store the model as the latest version.
+    """
+    times, data = fetch_recent_readings(db_collection)
+    if len(data) < window_size:
+        print("Trainer: less than 500 records available.")
+        return
+    scaler = scaler_from_snapshot(snapshot) if snapshot is not None else None
+    with train_seconds.time():
+        model, scaler = train_model(data, scaler=scaler)
+    watermark = format_timestamp(times[-1])
+    version = model_store.save(model, scaler, watermark, len(data), resolution=ANALYZE_RESOLUTION,
+                               stats_version=snapshot['_id'] if snapshot is not None else None)
+    print(f"Stored model version {version} (watermark {watermark})")
 
-    # 4. Split data: first 380 readings for training, last 120 for testing
-    train_size = 380
+def run_trainer():
+    """
+    Background loop that retrains and stores the model off the request path.
+    """
+    ensure_indexes(db_collection)
+    while True:
+        try:
+            snapshot = current_snapshot()
+            if needs_training(db_collection, snapshot):
+                # Replicas sharing the store train one at a time; the check is
+                # repeated under the lock in case another one just stored a model
+                with model_store.training_lock() as locked:
+                    if locked and needs_training(db_collection, snapshot):
+                        train_and_store(snapshot)
+        except Exception as e:
+            print("Trainer error:", e)
+        time.sleep(TRAINER_POLL_SECONDS)
+
+def start_trainer():
+    threading.Thread(target=run_trainer, name="model-trainer", daemon=True).start()
+
+def detect_anomalies(model, scaler, meta, dynamic_threshold_temp, site=ANALYZE_SITE):
+    """
+    Forecast the test window of the site and render the anomaly summary.
+    Returns (summary, status).
+    """
+    # 2. Fetch the last 500 readings from the shared client (error if not enough records)
+    with mongo_read_seconds.time():
+        times, data = fetch_recent_readings(db_collection, site)
+    if len(data) < window_size:
+        return "Warning: less than 500 records available.", 400
+
+    # 3. Scale with the scaler fitted at training time and split train/test
+    scaled_data = scaler.transform(data)
     train_data = scaled_data[:train_size]
     test_data = scaled_data[train_size:]
 
-    # 5. Create training sequences using a sliding window
-    time_step = 20
-    def create_dataset(dataset, time_step):
-        X, y = [], []
-        for i in range(len(dataset) - time_step):
-            X.append(dataset[i:i+time_step])
-            y.append(dataset[i+time_step])
-        return np.array(X), np.array(y)
-
-    X_train, y_train = create_dataset(train_data, time_step)
-
-    # 6. Build and train an LSTM model for multivariate output
-    model = Sequential()
-    model.add(LSTM(50, return_sequences=True, input_shape=(time_step, len(features))))
-    model.add(LSTM(50))
-    model.add(Dense(len(features)))
-    model.compile(loss='mean_squared_error', optimizer='adam')
-    model.fit(X_train, y_train, epochs=50, batch_size=32, validation_split=0.1, verbose=0)
-
-    # 7. Recursive multi-step forecasting for 120 steps
-    num_steps = 120
-    input_seq = train_data[-time_step:]
-    predictions = []
-    for _ in range(num_steps):
-        pred = model.predict(input_seq[np.newaxis, :, :], verbose=0)
-        predictions.append(pred[0])
-        input_seq = np.concatenate([input_seq[1:], pred], axis=0)
-    predictions = np.array(predictions)
-
-    # 8. Inverse transform predictions and actual test data to original scale
+    # 4. Recursive multi-step forecasting for 120 steps
+    forecaster = get_forecaster(model, meta['version']) if FORECAST_MODE == "numpy" else None
+    with forecast_seconds.time():
+        predictions = forecast(model, train_data[-time_step:], num_steps, mode=FORECAST_MODE, forecaster=forecaster)
+
+    # 5. Inverse transform predictions and actual test data to original scale
     predictions_inv = scaler.inverse_transform(predictions)
     test_data_inv = scaler.inverse_transform(test_data)
 
-    # 10. Anomaly detection:
-    # Get ambient temperature and set dynamic threshold for Temperature anomaly.
-    ambient_temp = get_ambient_temperature()
-    if ambient_temp >= 30 or ambient_temp <= 10:
-        dynamic_threshold_temp = 5.0
-    else:
-        dynamic_threshold_temp = 2.0
-
-    # Define fixed thresholds for other features
-    thresholds = {
-        'Pressure': 5.0,
-        'Flow_rate': 5.0,
-        'Water_quality': 5.0,
-        'Temperature': dynamic_threshold_temp
-    }
+    # 6. Anomaly detection over the test window
+    percentages = anomaly_percentages(test_data_inv, predictions_inv, dynamic_threshold_temp)
+    return render_summary(percentages, meta['version'], meta['watermark']), 200
+
+def run_streaming_detector():
+    """
+    Background loop: follow the newest stored model and feed new readings
+    to the streaming detector, ordered by Timestamp within each poll. The
+    first pass seeds it with enough history to fill the largest window.
+    """
+    position = None
+    while True:
+        try:
+            stored = model_store.load_latest()
+            if stored is not None:
+                model, scaler, meta = stored
+                if meta['version'] != streaming_detector.model_version:
+                    streaming_detector.set_model(model, scaler, meta['version'])
+                threshold = dynamic_temperature_threshold(get_ambient_temperature()[0])
+                cutoff = utc_now() - timedelta(seconds=INGEST_LAG_SECONDS)
+                if position is None:
+                    times, values = fetch_readings(db_collection, limit=max(STREAMING_WINDOWS) + time_step,
+                                                   end=datetime.now() - timedelta(seconds=INGEST_LAG_SECONDS),
+                                                   features=features, site=ANALYZE_SITE)
+                    # The readings of the last overlap are in the seed already (or older than it)
+                    position = IngestPosition(inserted=cutoff, overlap=INGEST_OVERLAP_SECONDS)
+                    for _ in iter_reading_batches(db_collection, features=features, site=ANALYZE_SITE,
+                                                  inserted_after=position.inserted_after, inserted_until=cutoff,
+                                                  position=position):
+                        pass
+                else:
+                    batches = list(iter_reading_batches(db_collection, features=features, site=ANALYZE_SITE,
+                                                        inserted_after=position.inserted_after,
+                                                        inserted_until=cutoff, position=position))
+                    times = np.concatenate([b[0] for b in batches] or [np.empty(0, 'datetime64[s]')])
+                    values = np.concatenate([b[1] for b in batches] or [np.empty((0, len(features)))])
+                    # Batches come in insertion order; the detector expects reading order
+                    order = np.argsort(times, kind='stable')
+                    times, values = times[order], values[order]
+                position.advance(cutoff)
+                if len(times):
+                    with streaming_seconds.time():
+                        streaming_detector.update(times, values, threshold)
+        except Exception as e:
+            print("Streaming detector error:", e)
+        time.sleep(STREAMING_POLL_SECONDS)
+
+def start_streaming_detector():
+    threading.Thread(target=run_streaming_detector, name="streaming-detector", daemon=True).start()
+
+def streaming_summary(meta):
+    """
+    Render the current rolling rates. Returns (summary, status, cache key).
+    """
+    current = streaming_detector.snapshot()
+    if current['readings'] == 0:
+        return "Warning: streaming detector is warming up, please retry shortly.", 503, None
+    windows = current['windows']
+    # The first window plays the part of the 120-reading test window
+    summary = render_summary(windows[STREAMING_WINDOWS[0]], meta['version'], meta['watermark'])
+    lines = [f"\n\nRolling anomaly rates up to {current['watermark']}:"]
+    for window, rates in windows.items():
+        lines.append(
+            f"Last {rates['readings']} readings: leakage {rates['leakage_percent']:.2f}%, "
+            f"water quality {rates['water_quality_percent']:.2f}%, temperature {rates['temperature_percent']:.2f}%"
+        )
+    return summary + "\n".join(lines), 200, (current['watermark'], current['model_version'], current['readings'])
+
+@app.route('/', methods=['GET'])
+@cross_origin()
+
+def analyze():
+    # 1. Load the newest stored model; training happens in the background
+    stored = model_store.load_latest()
+    if stored is None:
+        return Response("Warning: model is not trained yet, please retry shortly.", status=503, mimetype='text/plain')
+    model, scaler, meta = stored
 
-    # Compare over overlapping region
-    n_compare = min(test_data_inv.shape[0], predictions_inv.shape[0])
-    pressure_flags = np.abs(test_data_inv[:n_compare, 0] - predictions_inv[:n_compare, 0]) > thresholds['Pressure']
-    flow_flags     = np.abs(test_data_inv[:n_compare, 1] - predictions_inv[:n_compare, 1]) > thresholds['Flow_rate']
-    wq_flags       = np.abs(test_data_inv[:n_compare, 2] - predictions_inv[:n_compare, 2]) > thresholds['Water_quality']
-    temp_flags     = np.abs(test_data_inv[:n_compare, 3] - predictions_inv[:n_compare, 3]) > thresholds['Temperature']
+    # Get ambient temperature and set dynamic threshold for Temperature anomaly.
+    ambient_temp, ambient_fetched_at, ambient_age = get_ambient_temperature()
+    dynamic_threshold_temp = dynamic_temperature_threshold(ambient_temp)
+    site = request.args.get('site', ANALYZE_SITE)
 
-    # Combine Pressure and Flow anomalies for Leakage detection
-    leakage_flags = pressure_flags & flow_flags
+    if ANALYZE_MODE == "streaming" and site == ANALYZE_SITE:
+        summary, status, key = streaming_summary(meta)
+        result = (summary, status)
+    else:
+        # The result only changes with new readings, a new model or a new temperature bucket.
+        key = (site, latest_timestamp(db_collection, site=site), meta['version'], dynamic_threshold_temp)
+        result = summary_cache.get(key)
+        summary_cache_total.labels("miss" if result is None else "hit").inc()
+    if result is None:
+        def compute():
+            # Another request may have filled the cache while this one waited.
+            cached = summary_cache.get(key)
+            if cached is not None:
+                return cached
+            result = detect_anomalies(model, scaler, meta, dynamic_threshold_temp, site)
+            if result[1] == 200:
+                summary_cache.put(key, result)
+            return result
+        result = single_flight.do(key, compute)
 
-    # 11. Calculate anomaly percentages for each
-    leakage_percent = np.mean(leakage_flags) * 100
-    wq_percent = np.mean(wq_flags) * 100
-    temp_percent = np.mean(temp_flags) * 100
+    summary, status = result
+    if status != 200:
+        return Response(summary, status=status, mimetype='text/plain')
 
-    # 12. Final output message (only return the required output)
+    # Final output message (only return the required output)
+    if ambient_fetched_at is None:
+        ambient_source = "default, no reading fetched yet"
+    else:
+        fetched = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ambient_fetched_at))
+        ambient_source = f"fetched {fetched}, {ambient_age:.0f} s old"
     output = (
-        f"Ambient Temperature (from API): {ambient_temp} °C\n"
+        f"Ambient Temperature (from API): {ambient_temp} °C ({ambient_source})\n"
         f"Dynamic Temperature Anomaly Threshold: {dynamic_threshold_temp} °C\n\n"
-        "Anomaly Summary:\n"
-        f"Leakage (Pressure & Flow): {leakage_percent:.2f}% of readings flagged as potential leakage\n"
-        f"Water Quality Drop: {wq_percent:.2f}% of readings flagged\n"
-        f"Temperature Anomaly (with ambient adjustment): {temp_percent:.2f}% of readings flagged"
+        f"{summary}"
     )
+    response = Response(output, status=status, mimetype='text/plain')
+    if ambient_age is not None:
+        response.headers['X-Ambient-Temperature-Age'] = f"{ambient_age:.0f}"
+    response.set_etag(hashlib.sha1(repr((key, ambient_temp, ambient_fetched_at)).encode()).hexdigest())
+    return response.make_conditional(request)
+
+def get_job_manager():
+    """
+    Create the job manager (and its process pool) on first use.
+    """
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(
+                client.GOCI, mongo_uri,
+                workers=ANALYZE_JOB_WORKERS,
+                max_pending=ANALYZE_MAX_PENDING_JOBS,
+                on_finish=observe_job,
+            )
+            metrics.gauge("analyze_jobs_pending", "Jobs queued or running on this replica",
+                          lambda: _job_manager.pending)
+        return _job_manager
+
+def observe_job(update):
+    if update['status'] == DONE:
+        job_seconds.observe(update['result']['seconds'])
+
+def job_view(doc):
+    """
+    JSON form of a job record.
+    """
+    view = {'id': doc['_id'], 'status': doc['status']}
+    view['params'] = {name: doc['params'][name] for name in
+                      ('site', 'start', 'end', 'resolution', 'model', 'watermark', 'temperature_threshold')}
+    for name in ('created_at', 'started_at', 'finished_at'):
+        if doc.get(name) is not None:
+            view[name] = format_timestamp(doc[name])
+    if doc.get('result') is not None:
+        view['result'] = doc['result']
+    if doc.get('error'):
+        view['error'] = doc['error']
+    return view
+
+@app.route('/jobs', methods=['POST'])
+@cross_origin()
+def submit_job():
+    """
+    Start a forecast-and-detect job. JSON body, all optional:
+    site (Sensor_id, default ANALYZE_SITE), start and end (Timestamp range of the window),
+    resolution (raw, 1m, 1h, 1d) and model ("train" a model on the window,
+    or use the "stored" one). Returns the job; 202 when it was started,
+    200 when an identical job already exists.
+    """
+    body = request.get_json(silent=True) or {}
+    resolution = body.get('resolution', ANALYZE_RESOLUTION)
+    model = body.get('model', 'train')
+    if resolution != 'raw' and resolution not in RESOLUTIONS:
+        return jsonify({'error': f"unknown resolution {resolution}"}), 400
+    if model not in MODELS:
+        return jsonify({'error': f"unknown model {model}, expected one of {list(MODELS)}"}), 400
+    params = {
+        'db': client.GOCI.name,
+        'site': body.get('site', ANALYZE_SITE),
+        'start': body.get('start'),
+        'end': body.get('end'),
+        'resolution': resolution,
+        'model': model,
+        'epochs': ANALYZE_JOB_EPOCHS,
+        'model_store': model_store.root,
+        'model_version': model_store.latest_version() if model == 'stored' else None,
+    }
+    if model == 'stored' and params['model_version'] is None:
+        return jsonify({'error': "model is not trained yet, please retry shortly"}), 503
+
+    # Identical jobs are identified by the newest reading in their window
+    params['watermark'] = latest_timestamp(rollup_collection(client.GOCI, resolution),
+                                           params['start'], params['end'], params['site'])
+    if params['watermark'] is None:
+        return jsonify({'error': "no readings in the window"}), 400
+    ambient_temp, _, _ = get_ambient_temperature()
+    params['temperature_threshold'] = dynamic_temperature_threshold(ambient_temp)
+
+    try:
+        doc, created = get_job_manager().submit(params)
+    except JobQueueFull as e:
+        response = jsonify({'error': f"too many jobs pending ({e}), retry later"})
+        response.headers['Retry-After'] = "5"
+        return response, 429
+    response = jsonify(job_view(doc))
+    response.headers['Location'] = f"/jobs/{doc['_id']}"
+    return response, 202 if created else 200
+
+@app.route('/jobs/<job>', methods=['GET'])
+@cross_origin()
+def get_job(job):
+    doc = get_job_manager().get(job)
+    if doc is None:
+        return jsonify({'error': "unknown job"}), 404
+    return jsonify(job_view(doc))
 
-    return Response(output, status=200, mimetype='text/plain')
+def start_background_tasks():
+    start_trainer()
+    if ANALYZE_MODE == "streaming":
+        start_streaming_detector()
+    ambient_temperature.refresh_async(AMBIENT_CITY)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    # The job pool's spawned processes re-import the main module; as the main
+    # module, this one would build the whole service in each of them.
+    sys.exit("Start the analyze service with `python serve.py`")
@@ -0,0 +1,76 @@
+"""
+Compare wall time and forecast error of the reference per-step Keras loop
+against the NumPy forecaster on the 500-reading analyze window.
+
+Usage:
+    python benchmark_forecast.py [--epochs 5] [--repeat 3] [--store models]
+
+With --store the newest model in the model store is used; otherwise a model is
+trained on a synthetic random-walk series shaped like the simulator output.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from pipeline import features, window_size, train_size, time_step, num_steps, train_model
+from forecaster import NumpyForecaster, recursive_forecast
+
+
+def synthetic_readings(n=window_size, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.array([100.0, 50.0, 100.0, 20.0])
+    step = np.array([0.5, 0.3, 0.2, 0.2])
+    return start + np.cumsum(rng.uniform(-1, 1, size=(n, 4)) * step, axis=0)
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--store', default=None)
+    args = parser.parse_args()
+
+    data = synthetic_readings()
+    if args.store:
+        from model_store import ModelStore
+        model, scaler, meta = ModelStore(args.store).load_latest()
+        print(f"Using stored model version {meta['version']}")
+    else:
+        model, scaler = train_model(data, epochs=args.epochs)
+
+    scaled = scaler.transform(data)
+    seed = scaled[train_size - time_step:train_size]
+    actual = scaler.inverse_transform(scaled[train_size:])
+
+    reference, reference_time = time_call(lambda: recursive_forecast(model, seed, num_steps), args.repeat)
+    forecaster, build_time = time_call(lambda: NumpyForecaster(model), 1)
+    fast, fast_time = time_call(lambda: forecaster.forecast(seed, num_steps), args.repeat)
+
+    reference_inv = scaler.inverse_transform(reference)
+    fast_inv = scaler.inverse_transform(fast)
+
+    def rmse(pred):
+        return np.sqrt(np.mean((pred - actual) ** 2, axis=0))
+
+    print(f"Horizon: {num_steps} steps, window: {time_step}")
+    print(f"keras recursive: {reference_time * 1000:.1f} ms")
+    print(f"numpy forecaster: {fast_time * 1000:.1f} ms (+{build_time * 1000:.1f} ms one-off weight extraction)")
+    print(f"speedup: {reference_time / fast_time:.1f}x")
+    print(f"max |numpy - keras| (original scale): {np.max(np.abs(fast_inv - reference_inv)):.2e}")
+    print("RMSE vs actual per feature:")
+    for name, r, f in zip(features, rmse(reference_inv), rmse(fast_inv)):
+        print(f"  {name:<14} keras {r:.4f}  numpy {f:.4f}")
+
+
+if __name__ == '__main__':
+    main()
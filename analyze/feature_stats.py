@@ -0,0 +1,28 @@
+"""
+Read side of the streaming per-feature statistics of the sensor readings.
+
+The statistics are kept current and published as versioned snapshots in the
+feature_stats collection by predict's FeatureStatsUpdater (see
+predict/feature_stats.py):
+
+    {'_id': <version>, 'created_at', 'watermark', 'count', 'features',
+     'mean': [...], 'std': [...], 'min': [...], 'max': [...]}
+
+analyze only reads the newest snapshot to take its [0, 1] scaling from it.
+"""
+from pymongo import DESCENDING
+
+from preprocessing import FEATURES, MinMaxScaler
+
+
+def _column(snapshot, key, features):
+    index = {name: i for i, name in enumerate(snapshot['features'])}
+    return [snapshot[key][index[name]] for name in features]
+
+
+def scaler_from_snapshot(snapshot, features=FEATURES, feature_range=(0, 1)):
+    return MinMaxScaler(feature_range).fit_range(_column(snapshot, 'min', features), _column(snapshot, 'max', features))
+
+
+def latest_snapshot(db):
+    return db.feature_stats.find_one({}, sort=[('_id', DESCENDING)])
@@ -0,0 +1,133 @@
+import numpy as np
+from tensorflow.keras.layers import LSTM, Dense
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def recursive_forecast(model, seed, num_steps):
+    """
+    Reference forecaster: one model.predict call per step, feeding each
+    prediction back into the sliding input window.
+    """
+    input_seq = seed
+    predictions = []
+    for _ in range(num_steps):
+        pred = model.predict(input_seq[np.newaxis, :, :], verbose=0)
+        predictions.append(pred[0])
+        input_seq = np.concatenate([input_seq[1:], pred], axis=0)
+    return np.array(predictions)
+
+
+class NumpyForecaster:
+    """
+    Recursive multi-step forecaster that runs the stacked LSTM + Dense model
+    in NumPy instead of calling model.predict once per step.
+
+    It computes the same sliding-window recursion as recursive_forecast (every
+    step restarts the LSTMs from zero state over the last time_step rows), so
+    the results match the reference up to float32 rounding. The per-call
+    framework overhead disappears, the window is a view into one preallocated
+    buffer, and the first layer's input projection is computed once per row
+    instead of once per window position.
+    """
+
+    def __init__(self, model):
+        self.lstm_layers = []
+        self.dense_layers = []
+        for layer in model.layers:
+            if isinstance(layer, LSTM):
+                kernel, recurrent_kernel, bias = layer.get_weights()
+                self.lstm_layers.append((kernel.astype(np.float32), recurrent_kernel.astype(np.float32), bias.astype(np.float32)))
+            elif isinstance(layer, Dense):
+                kernel, bias = layer.get_weights()
+                self.dense_layers.append((kernel.astype(np.float32), bias.astype(np.float32)))
+            else:
+                raise ValueError(f"Unsupported layer for NumpyForecaster: {layer.__class__.__name__}")
+
+    @staticmethod
+    def _run_lstm(projected, recurrent_kernel, return_sequences):
+        """
+        Run one LSTM layer over inputs already multiplied by the kernel and
+        shifted by the bias. Gate order is Keras' (input, forget, cell, output).
+        """
+        units = recurrent_kernel.shape[0]
+        h = np.zeros(units, dtype=np.float32)
+        c = np.zeros(units, dtype=np.float32)
+        outputs = np.empty((projected.shape[0], units), dtype=np.float32) if return_sequences else None
+        for t in range(projected.shape[0]):
+            z = projected[t] + h @ recurrent_kernel
+            i = sigmoid(z[:units])
+            f = sigmoid(z[units:2 * units])
+            g = np.tanh(z[2 * units:3 * units])
+            o = sigmoid(z[3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+            if return_sequences:
+                outputs[t] = h
+        return outputs if return_sequences else h
+
+    def forecast(self, seed, num_steps):
+        time_step, n_features = seed.shape
+        first_kernel, _, first_bias = self.lstm_layers[0]
+        last_depth = len(self.lstm_layers) - 1
+
+        # Seed window followed by room for every prediction; windows are views.
+        buffer = np.empty((time_step + num_steps, n_features), dtype=np.float32)
+        buffer[:time_step] = seed
+        projected = np.empty((time_step + num_steps, first_kernel.shape[1]), dtype=np.float32)
+        projected[:time_step] = buffer[:time_step] @ first_kernel + first_bias
+
+        for step in range(num_steps):
+            x = projected[step:step + time_step]
+            for depth, (kernel, recurrent_kernel, bias) in enumerate(self.lstm_layers):
+                if depth > 0:
+                    x = x @ kernel + bias
+                x = self._run_lstm(x, recurrent_kernel, return_sequences=depth != last_depth)
+            for kernel, bias in self.dense_layers:
+                x = x @ kernel + bias
+
+            buffer[time_step + step] = x
+            projected[time_step + step] = x @ first_kernel + first_bias
+
+        return buffer[time_step:].copy()
+
+    def predict_next(self, windows):
+        """
+        One-step-ahead predictions for a batch of (B, time_step, F) windows,
+        run as one batched pass over the time steps.
+        """
+        x = np.asarray(windows, dtype=np.float32)
+        last_depth = len(self.lstm_layers) - 1
+        for depth, (kernel, recurrent_kernel, bias) in enumerate(self.lstm_layers):
+            projected = x @ kernel + bias
+            units = recurrent_kernel.shape[0]
+            h = np.zeros((x.shape[0], units), dtype=np.float32)
+            c = np.zeros((x.shape[0], units), dtype=np.float32)
+            outputs = np.empty((x.shape[0], x.shape[1], units), dtype=np.float32)
+            for t in range(x.shape[1]):
+                z = projected[:, t] + h @ recurrent_kernel
+                i = sigmoid(z[:, :units])
+                f = sigmoid(z[:, units:2 * units])
+                g = np.tanh(z[:, 2 * units:3 * units])
+                o = sigmoid(z[:, 3 * units:])
+                c = f * c + i * g
+                h = o * np.tanh(c)
+                outputs[:, t] = h
+            x = outputs if depth != last_depth else h
+        for kernel, bias in self.dense_layers:
+            x = x @ kernel + bias
+        return x
+
+
+def forecast(model, seed, num_steps, mode="numpy", forecaster=None):
+    """
+    Produce num_steps predictions from the seed window with the selected engine.
+    mode="keras" runs the reference per-step model.predict loop.
+    """
+    if mode == "keras":
+        return recursive_forecast(model, seed, num_steps)
+    if forecaster is None:
+        forecaster = NumpyForecaster(model)
+    return forecaster.forecast(seed, num_steps)
@@ -0,0 +1,217 @@
+"""
+Asynchronous forecast-and-detect jobs run in a process pool.
+
+A job analyzes one window of readings of one site (Sensor_id): the last
+window_size readings up to `end` (or the watermark, the newest when the job
+was submitted), optionally from a rollup resolution. With model "train" it
+fits its own scaler and LSTM on the window, as the service originally did per
+request; with "stored" it uses the model version that was the newest in the
+model store when the job was submitted (params["model_version"], part of the
+job id). The result holds the anomaly percentages
+and the rendered summary.
+
+Jobs are recorded in the analyze_jobs collection, so any replica can report
+on a job and identical jobs are shared across replicas: the job id is a hash
+of the parameters and the data watermark (newest reading in the window), and
+a job with the same id that is queued, running or done is returned instead of
+starting another one. Failed jobs, and queued or running jobs not updated for
+job_timeout seconds (e.g. their replica died), are started again.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+MODELS = ("train", "stored")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def job_id(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:24]
+
+
+# --------------------------
+# Worker side: runs in the pool processes. They are spawned, so each re-imports
+# the main module (serve.py, which starts nothing unless it is the main program)
+# and this one; run_job imports the rest of the pipeline itself.
+
+_worker = {}
+
+
+def _init_worker(mongo_uri, threads):
+    # One pool process per core; keep TensorFlow from spreading each one across all of them
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    from pymongo import MongoClient
+    _worker["client"] = MongoClient(mongo_uri)
+
+
+def run_job(params):
+    """
+    Fetch the window, forecast its test part and flag anomalies. Returns the
+    result document.
+    """
+    from forecaster import NumpyForecaster
+    from model_store import ModelStore
+    from pipeline import (
+        features, window_size, train_size, time_step, num_steps,
+        train_model, anomaly_percentages, render_summary,
+    )
+    from rollups import rollup_collection
+    from sensor_store import fetch_readings, format_timestamp
+
+    db = _worker["client"][params["db"]]
+    db.analyze_jobs.update_one(
+        {"_id": params["id"]}, {"$set": {"status": RUNNING, "started_at": datetime.now(), "updated_at": datetime.now()}})
+    started = time.perf_counter()
+
+    collection = rollup_collection(db, params["resolution"])
+    # Without an end, the window ends at the watermark the job was identified by,
+    # not at whatever is newest by the time a worker picks it up
+    end = params["end"] if params["end"] is not None else params["watermark"]
+    times, data = fetch_readings(collection, limit=window_size, start=params["start"], end=end,
+                                 site=params["site"], features=features)
+    if len(data) < window_size:
+        raise ValueError(f"less than {window_size} records available")
+    watermark = format_timestamp(times[-1])
+
+    if params["model"] == "stored":
+        if "store" not in _worker:
+            _worker["store"] = ModelStore(params["model_store"])
+        stored = _worker["store"].load(params["model_version"])
+        if stored is None:
+            raise ValueError(f"model version {params['model_version']} is no longer stored")
+        model, scaler, meta = stored
+        version, trained_on = meta["version"], meta["watermark"]
+    else:
+        model, scaler = train_model(data, epochs=params["epochs"])
+        version, trained_on = f"job {params['id']}", watermark
+
+    scaled_data = scaler.transform(data)
+    predictions = NumpyForecaster(model).forecast(scaled_data[train_size - time_step:train_size], num_steps)
+    percentages = anomaly_percentages(
+        scaler.inverse_transform(scaled_data[train_size:]), scaler.inverse_transform(predictions),
+        params["temperature_threshold"])
+    return {
+        **percentages,
+        "summary": render_summary(percentages, version, trained_on),
+        "watermark": watermark,
+        "first": format_timestamp(times[0]),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# --------------------------
+# Service side
+
+class JobManager:
+    """
+    Submit jobs to a pool of `workers` processes and track them in MongoDB.
+
+    At most max_pending jobs may be queued or running on this replica;
+    submit() raises JobQueueFull beyond that. Finished job records expire
+    after ttl_seconds.
+    """
+
+    def __init__(self, db, mongo_uri, workers=None, max_pending=32, job_timeout=1800.0,
+                 ttl_seconds=86400, threads_per_worker=1, on_finish=None):
+        self.db = db
+        self.jobs = db.analyze_jobs
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self.on_finish = on_finish
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.jobs.create_index("created_at", expireAfterSeconds=ttl_seconds, name="created_at_ttl")
+        # spawn: TensorFlow is not fork-safe once initialized in the parent
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(mongo_uri, threads_per_worker),
+        )
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def submit(self, params):
+        """
+        Start a job for params unless an identical one exists. Returns
+        (job document, created).
+        """
+        params = dict(params, id=job_id(params))
+        now = datetime.now()
+        with self._lock:
+            existing = self.jobs.find_one({"_id": params["id"]})
+            if existing is not None and not self._restartable(existing, now):
+                # Identical job: share it
+                return existing, False
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs pending")
+            if existing is None:
+                doc = {"_id": params["id"], "status": QUEUED, "params": params, "created_at": now, "updated_at": now}
+                try:
+                    self.jobs.insert_one(doc)
+                except DuplicateKeyError:
+                    # Another replica started it just now
+                    return self.get(params["id"]), False
+            else:
+                # Restart a failed or abandoned job, unless another replica already did
+                doc = self.jobs.find_one_and_update(
+                    {"_id": params["id"], "status": existing["status"], "updated_at": existing["updated_at"]},
+                    {"$set": {"status": QUEUED, "created_at": now, "updated_at": now, "error": None}},
+                    return_document=ReturnDocument.AFTER,
+                )
+                if doc is None:
+                    return self.get(params["id"]), False
+            self._pending += 1
+        future = self.pool.submit(run_job, params)
+        future.add_done_callback(lambda f: self._finished(params["id"], f))
+        return doc, True
+
+    def _restartable(self, doc, now):
+        if doc["status"] == FAILED:
+            return True
+        return doc["status"] in (QUEUED, RUNNING) and doc["updated_at"] < now - timedelta(seconds=self.job_timeout)
+
+    def _finished(self, job, future):
+        with self._lock:
+            self._pending -= 1
+        now = datetime.now()
+        try:
+            result = future.result()
+            update = {"status": DONE, "result": result, "finished_at": now, "updated_at": now}
+        except Exception as e:
+            update = {"status": FAILED, "error": str(e), "finished_at": now, "updated_at": now}
+        try:
+            self.jobs.update_one({"_id": job}, {"$set": update})
+        except Exception as e:
+            print(f"Job {job}: could not record the result:", e)
+        if self.on_finish is not None:
+            self.on_finish(update)
+
+    def get(self, job):
+        return self.jobs.find_one({"_id": job})
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,376 @@
+import bisect
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from 0.5 ms up to 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Timer:
+    """
+    Context manager observing the elapsed time of its block into a histogram.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _NullMetric:
+    """
+    Stand-in returned by a disabled registry: every call is a no-op, so
+    instrumented code paths cost one attribute lookup and call.
+    """
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def mark(self, count=1):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_METRIC = _NullMetric()
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Metric(ABC):
+    """
+    A named metric family, rendered as its HELP and TYPE lines and samples.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self):
+        """
+        Return the exposition lines of the family.
+        """
+
+
+class _LabeledMetric(_Metric):
+    """
+    A metric family with optional labels; labels(*values) returns the
+    child for one combination of label values (cache it on hot paths).
+    """
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help)
+        self.labelnames = tuple(labels)
+        self._children = {}
+
+    @abstractmethod
+    def _new_child(self):
+        """
+        Return the child holding the values of one combination of labels.
+        """
+
+    @abstractmethod
+    def _render_child(self, values, child):
+        """
+        Return the sample lines of one child.
+        """
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Counter(_LabeledMetric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Histogram(_LabeledMetric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total, count = child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Gauge read from a callback at scrape time (queue depths, backlogs).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = _format_value(self.fn())
+        except Exception:
+            value = "NaN"
+        return self._header() + [f"{self.name} {value}"]
+
+
+class CounterFunc(Gauge):
+    """
+    Counter read from a callback at scrape time, for cumulative totals kept
+    by another object.
+    """
+
+    kind = "counter"
+
+
+class Rate(_Metric):
+    """
+    Events per second over a sliding window of one-second buckets, exposed as a gauge.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, window=10):
+        super().__init__(name, help)
+        self.window = window
+        self._counts = [0] * (window + 1)
+        self._seconds = [0] * (window + 1)
+
+    def mark(self, count=1):
+        second = int(time.time())
+        slot = second % len(self._counts)
+        with self._lock:
+            if self._seconds[slot] != second:
+                self._seconds[slot] = second
+                self._counts[slot] = 0
+            self._counts[slot] += count
+
+    def per_second(self):
+        # Only complete seconds count, so the current (partial) bucket is skipped
+        now = int(time.time())
+        with self._lock:
+            total = sum(c for c, s in zip(self._counts, self._seconds) if now - self.window <= s < now)
+        return total / self.window
+
+    def render(self):
+        return self._header() + [f"{self.name} {_format_value(self.per_second())}"]
+
+
+class Registry:
+    """
+    Collection of the metrics of one process, rendered in the Prometheus text format.
+
+    A disabled registry hands out NULL_METRIC for every metric and renders
+    nothing, so instrumentation can stay in place at near-zero cost.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return NULL_METRIC
+        if isinstance(metric, (Counter, Histogram)) and not metric.labelnames:
+            # Unlabeled metrics are exported from the start, even at zero
+            metric.labels()
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn):
+        return self._register(Gauge(name, help, fn))
+
+    def counter_func(self, name, help, fn):
+        return self._register(CounterFunc(name, help, fn))
+
+    def rate(self, name, help, window=10):
+        return self._register(Rate(name, help, window))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def registry_from_env():
+    """
+    Registry enabled unless METRICS_ENABLED=0.
+    """
+    return Registry(enabled=os.environ.get("METRICS_ENABLED", "1") != "0")
+
+
+def instrument_flask(app, registry, prefix):
+    """
+    Add GET /metrics to a Flask app and, when the registry is enabled, time
+    every request by endpoint.
+    """
+    from flask import Response, g, request
+
+    request_seconds = registry.histogram(f"{prefix}_request_seconds", "Request latency by endpoint", labels=("endpoint",))
+    requests_total = registry.counter(f"{prefix}_requests_total", "Requests by endpoint and status", labels=("endpoint", "status"))
+
+    if registry.enabled:
+        @app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def observe_request(response):
+            started = g.pop("request_started", None)
+            endpoint = request.endpoint or "unknown"
+            if started is not None:
+                request_seconds.labels(endpoint).observe(time.perf_counter() - started)
+            requests_total.labels(endpoint, response.status_code).inc()
+            return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+def start_http_server(registry, port, host="0.0.0.0"):
+    """
+    Serve GET /metrics for a process without a web framework, on a daemon thread.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep scrapes out of the console output
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,157 @@
+import contextlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+
+from tensorflow.keras.models import load_model
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process guard on training
+    fcntl = None
+
+
+class ModelStore:
+    """
+    Versioned on-disk store for the trained LSTM, its fitted scaler and the
+    data watermark (newest sensor Timestamp used for training).
+
+    Each version lives in its own directory under root; the LATEST file names
+    the newest complete version and is replaced atomically, so readers never
+    see a half-written model. Point MODEL_STORE_DIR at a shared volume to let
+    several analyze replicas reuse the same trained model; training_lock()
+    lets only one of them train at a time.
+    """
+
+    def __init__(self, root="models", keep=3):
+        self.root = root
+        self.keep = keep
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cached_version = None
+        self._cached = None
+
+    def _latest_path(self):
+        return os.path.join(self.root, "LATEST")
+
+    def latest_version(self):
+        try:
+            with open(self._latest_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def latest_metadata(self):
+        version = self.latest_version()
+        if version is None:
+            return None
+        with open(os.path.join(self.root, version, "meta.json")) as f:
+            return json.load(f)
+
+    @contextlib.contextmanager
+    def training_lock(self):
+        """
+        Try to take the store's training lock without waiting; yields True
+        if this process holds it for the block, False if another process
+        (e.g. another replica on the shared volume) is training. The lock is
+        released when the block exits or the process dies.
+        """
+        with open(os.path.join(self.root, "TRAINING.lock"), "w") as lock_file:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, model, scaler, watermark, samples, resolution="raw", stats_version=None):
+        """
+        Write a new version and make it the latest one. Returns the version id.
+        """
+        # The time orders the versions; the random suffix keeps ids written by
+        # several processes in the same second apart
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        final_dir = os.path.join(self.root, version)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        model.save(os.path.join(tmp_dir, "model.keras"))
+        with open(os.path.join(tmp_dir, "scaler.pkl"), "wb") as f:
+            pickle.dump(scaler, f)
+        meta = {
+            "version": version,
+            "watermark": watermark,
+            "samples": samples,
+            "resolution": resolution,
+            "stats_version": stats_version,
+            "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.rename(tmp_dir, final_dir)
+
+        tmp_latest = self._latest_path() + ".tmp"
+        with open(tmp_latest, "w") as f:
+            f.write(version)
+        os.replace(tmp_latest, self._latest_path())
+        self._prune()
+        return version
+
+    def _prune(self):
+        """
+        Remove all but the newest `keep` versions, never the LATEST one (ids
+        from the same second sort by their random suffix).
+        """
+        latest = self.latest_version()
+        versions = sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name)) and not name.endswith(".tmp")
+        )
+        for name in versions[:-self.keep]:
+            if name == latest:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def load_latest(self):
+        """
+        Return (model, scaler, metadata) for the newest version, or None if
+        nothing has been trained yet. The loaded model is cached in memory until
+        a newer version appears.
+        """
+        version = self.latest_version()
+        if version is None:
+            return None
+        return self.load(version)
+
+    def load(self, version):
+        """
+        Return (model, scaler, metadata) for the given version, or None if it
+        is not stored (any more: only the newest `keep` are). The loaded model
+        is cached in memory until another version is loaded.
+        """
+        with self._lock:
+            if version != self._cached_version:
+                version_dir = os.path.join(self.root, version)
+                if not os.path.isdir(version_dir):
+                    return None
+                model = load_model(os.path.join(version_dir, "model.keras"))
+                with open(os.path.join(version_dir, "scaler.pkl"), "rb") as f:
+                    scaler = pickle.load(f)
+                with open(os.path.join(version_dir, "meta.json")) as f:
+                    meta = json.load(f)
+                self._cached = (model, scaler, meta)
+                self._cached_version = version
+            return self._cached
@@ -0,0 +1,101 @@
+"""
+Training, forecasting and anomaly flagging of the analyze window, without
+any service state, so the request path (analyze.py) and job processes
+(jobs.py) run the same code.
+"""
+import numpy as np
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import LSTM, Dense
+
+from preprocessing import MinMaxScaler, supervised_windows
+from sensor_store import FEATURES
+
+# Forecasting setup shared by training and inference
+features = FEATURES
+window_size = 500   # readings used per analysis
+train_size = 380    # first 380 readings for training, last 120 for testing
+time_step = 20      # sliding window length
+num_steps = 120     # forecast horizon
+
+# Fixed thresholds for the features without ambient adjustment
+THRESHOLDS = {
+    'Pressure': 5.0,
+    'Flow_rate': 5.0,
+    'Water_quality': 5.0,
+}
+
+
+def create_dataset(dataset, time_step):
+    """
+    Sliding-window training sequences as strided views of dataset (no copies).
+    """
+    return supervised_windows(dataset, time_step)
+
+
+def train_model(data, epochs=50, scaler=None):
+    """
+    Fit the LSTM (and the scaler, unless one is given) on the training part of the window.
+    """
+    # Normalize the data to [0,1] (float32, the dtype the LSTM trains in)
+    if scaler is None:
+        scaler = MinMaxScaler(feature_range=(0, 1)).fit(data)
+    scaled_data = scaler.transform(data)
+    train_data = scaled_data[:train_size]
+
+    # Create training sequences using a sliding window
+    X_train, y_train = create_dataset(train_data, time_step)
+
+    # Build and train an LSTM model for multivariate output
+    model = Sequential()
+    model.add(LSTM(50, return_sequences=True, input_shape=(time_step, len(features))))
+    model.add(LSTM(50))
+    model.add(Dense(len(features)))
+    model.compile(loss='mean_squared_error', optimizer='adam')
+    model.fit(X_train, y_train, epochs=epochs, batch_size=32, validation_split=0.1, verbose=0)
+    return model, scaler
+
+
+def dynamic_temperature_threshold(ambient_temp):
+    """
+    Temperature anomaly threshold for the ambient temperature bucket.
+    """
+    if ambient_temp >= 30 or ambient_temp <= 10:
+        return 5.0
+    return 2.0
+
+
+def anomaly_percentages(test_data_inv, predictions_inv, dynamic_threshold_temp):
+    """
+    Share of test readings (in %) whose forecast error exceeds the thresholds:
+    leakage (Pressure and Flow_rate), water quality and temperature.
+    """
+    thresholds = dict(THRESHOLDS, Temperature=dynamic_threshold_temp)
+
+    # Compare over overlapping region
+    n_compare = min(test_data_inv.shape[0], predictions_inv.shape[0])
+    pressure_flags = np.abs(test_data_inv[:n_compare, 0] - predictions_inv[:n_compare, 0]) > thresholds['Pressure']
+    flow_flags     = np.abs(test_data_inv[:n_compare, 1] - predictions_inv[:n_compare, 1]) > thresholds['Flow_rate']
+    wq_flags       = np.abs(test_data_inv[:n_compare, 2] - predictions_inv[:n_compare, 2]) > thresholds['Water_quality']
+    temp_flags     = np.abs(test_data_inv[:n_compare, 3] - predictions_inv[:n_compare, 3]) > thresholds['Temperature']
+
+    # Combine Pressure and Flow anomalies for Leakage detection
+    leakage_flags = pressure_flags & flow_flags
+
+    return {
+        'leakage_percent': float(np.mean(leakage_flags) * 100),
+        'water_quality_percent': float(np.mean(wq_flags) * 100),
+        'temperature_percent': float(np.mean(temp_flags) * 100),
+    }
+
+
+def render_summary(percentages, version, watermark):
+    """
+    Anomaly summary text (the ambient temperature header is added per request).
+    """
+    return (
+        "Anomaly Summary:\n"
+        f"Leakage (Pressure & Flow): {percentages['leakage_percent']:.2f}% of readings flagged as potential leakage\n"
+        f"Water Quality Drop: {percentages['water_quality_percent']:.2f}% of readings flagged\n"
+        f"Temperature Anomaly (with ambient adjustment): {percentages['temperature_percent']:.2f}% of readings flagged\n\n"
+        f"Model version: {version} (trained on data up to {watermark})"
+    )
@@ -0,0 +1,163 @@
+"""
+Batch-oriented feature preprocessing shared by ingress, analyze and predict.
+
+Readings are parsed straight from dicts (Firebase events, MongoDB documents)
+or row records into one preallocated (N, len(features)) array, and scaled in
+place in float32, so a batch costs a few array operations instead of one
+array and two float64 temporaries per reading. sliding_windows returns the
+windows of a series as a strided view instead of copying each window.
+"""
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+FEATURES = ['Pressure', 'Flow_rate', 'Water_quality', 'Temperature']
+
+# Standardization values used during training of the ingress classifier;
+# update these based on your training data.
+TRAINING_MEANS = [97.03, 52.16, 94.71, 20.08]
+TRAINING_STDS = [9.63, 7.17, 8.28, 2.47]
+
+
+def _value(value):
+    # Missing fields become NaN, like np.array([None], dtype=np.float32)
+    return np.nan if value is None else value
+
+
+def features_from_dicts(batch, features=FEATURES, out=None, dtype=np.float32):
+    """
+    Fill an (N, len(features)) array from a sequence of dicts in one pass.
+    """
+    n = len(batch)
+    if out is None:
+        out = np.empty((n, len(features)), dtype=dtype)
+    getter = itemgetter(*features)
+    try:
+        values = np.fromiter(chain.from_iterable(map(getter, batch)), dtype=out.dtype, count=n * len(features))
+        out[...] = values.reshape(n, len(features))
+    except (KeyError, TypeError, ValueError):
+        # Some reading lacks a field or has it set to None
+        for j, name in enumerate(features):
+            out[:, j] = [_value(item.get(name)) for item in batch]
+    return out
+
+
+def features_from_records(records, out=None, dtype=np.float32):
+    """
+    Fill an (N, F) array from row records (tuples or lists in feature order,
+    or a 2-D array), without going through an intermediate float64 array.
+    """
+    n = len(records)
+    if n == 0:
+        return np.empty((0, len(FEATURES)), dtype=dtype) if out is None else out
+    if out is None:
+        out = np.empty((n, len(records[0])), dtype=dtype)
+    out[...] = records
+    return out
+
+
+def _is_float32(x):
+    return isinstance(x, np.ndarray) and x.dtype == np.float32
+
+
+class Standardizer:
+    """
+    (x - mean) / std in float32, folded into one multiply and one add.
+    """
+
+    def __init__(self, means=TRAINING_MEANS, stds=TRAINING_STDS):
+        means = np.asarray(means, dtype=np.float64)
+        stds = np.asarray(stds, dtype=np.float64)
+        self.means = means.astype(np.float32)
+        self.stds = stds.astype(np.float32)
+        self._scale = (1.0 / stds).astype(np.float32)
+        self._offset = (-means / stds).astype(np.float32)
+
+    def transform(self, x, copy=True):
+        """
+        Standardize an (N, F) or (F,) array; with copy=False a float32 array
+        is scaled in place.
+        """
+        if copy or not _is_float32(x):
+            x = np.array(x, dtype=np.float32)
+        x *= self._scale
+        x += self._offset
+        return x
+
+    def transform_dict(self, sensor_data, features=FEATURES):
+        """
+        Standardize one reading dict into a (1, F) float32 array.
+        """
+        x = np.array([sensor_data.get(name) for name in features], dtype=np.float32)
+        x *= self._scale
+        x += self._offset
+        return x.reshape(1, -1)
+
+    def transform_dicts(self, batch, features=FEATURES):
+        """
+        Parse and standardize a batch of reading dicts into one (N, F) float32 array.
+        """
+        return self.transform(features_from_dicts(batch, features), copy=False)
+
+
+class MinMaxScaler:
+    """
+    Scale each feature to feature_range in float32. Same interface as
+    sklearn.preprocessing.MinMaxScaler for fit, fit_transform, transform and
+    inverse_transform; constant features are mapped to the lower bound.
+    """
+
+    def __init__(self, feature_range=(0, 1)):
+        self.feature_range = feature_range
+
+    def fit(self, x):
+        x = np.asarray(x)
+        return self.fit_range(x.min(axis=0), x.max(axis=0))
+
+    def fit_range(self, data_min, data_max):
+        """
+        Set the scaling from known per-feature minima and maxima, e.g. from
+        streaming statistics, instead of a pass over the data.
+        """
+        self.data_min_ = np.asarray(data_min, dtype=np.float32)
+        self.data_max_ = np.asarray(data_max, dtype=np.float32)
+        data_range = (self.data_max_ - self.data_min_).astype(np.float64)
+        data_range[data_range == 0.0] = 1.0
+        low, high = self.feature_range
+        self.scale_ = ((high - low) / data_range).astype(np.float32)
+        self.min_ = (low - self.data_min_ * self.scale_).astype(np.float32)
+        return self
+
+    def transform(self, x, copy=True):
+        if copy or not _is_float32(x):
+            x = np.array(x, dtype=np.float32)
+        x *= self.scale_
+        x += self.min_
+        return x
+
+    def fit_transform(self, x):
+        return self.fit(x).transform(x)
+
+    def inverse_transform(self, x, copy=True):
+        if copy or not _is_float32(x):
+            x = np.array(x, dtype=np.float32)
+        x -= self.min_
+        x /= self.scale_
+        return x
+
+
+def sliding_windows(data, window):
+    """
+    Read-only (N - window + 1, window, F) view of every window of an (N, F)
+    series; no data is copied.
+    """
+    return np.lib.stride_tricks.sliding_window_view(data, window, axis=0).swapaxes(1, 2)
+
+
+def supervised_windows(data, time_step):
+    """
+    (X, y) for one-step-ahead training: X[i] is data[i:i + time_step] and
+    y[i] is data[i + time_step]. Both are views of data.
+    """
+    return sliding_windows(data[:-1], time_step), data[time_step:]
@@ -0,0 +1,336 @@
+"""
+Downsampled rollups of the GOCI.sensors collection at 1-minute, 1-hour and
+1-day resolution.
+
+Each rollup document covers one bucket of the readings of one site: 'Time'
+is the bucket start, 'Timestamp' its string form, 'Sensor_id' the site
+(absent for readings without one, as in the single-pipe layout), '_id' is
+{'site': <Sensor_id or DEFAULT_SITE>, 'time': <bucket start>}, 'count' the
+number of readings, and per feature the mean under the feature's own name
+plus '<feature>_min' and '<feature>_max'. Rollups therefore read like raw
+readings, so sensor_store.fetch_readings (also with site) and
+iter_reading_batches work on them unchanged (and return the bucket means).
+'Inserted_at' is when the bucket was last written and 'Created_at' when it
+was first written (both UTC, as the readings' Inserted_at), so consumers that follow a rollup collection by
+Inserted_at can tell a rewritten bucket (rewritten_since) from a new one.
+
+RollupUpdater follows the raw readings by Inserted_at (see sensor_store.py),
+re-reading an overlap before its previous cutoff: the minutes that newly
+inserted readings fall into are recomputed from the raw readings once
+complete, then the hours containing rewritten minutes from
+the minutes and the days from the hours. A reading that arrives late thus
+rewrites its minute, hour and day. Buckets are upserted by site and start,
+so recomputing a bucket is idempotent.
+
+Run `python rollups.py --backfill <mongo_uri>` once to build the rollups for
+existing readings (or to rebuild them).
+"""
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import UpdateOne
+
+from sensor_store import (
+    DEFAULT_SITE, FEATURES, INGEST_OVERLAP_SECONDS, TIMESTAMP_FORMAT, ensure_indexes, iter_site_batches, utc_now,
+)
+
+# Bucket length in seconds and the collection each resolution is rolled up from
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+SOURCES = {'1m': 'raw', '1h': '1m', '1d': '1h'}
+STATE_ID = 'rollups'
+
+_STAT_FIELDS = FEATURES + [f'{name}_min' for name in FEATURES] + [f'{name}_max' for name in FEATURES] + ['count']
+
+
+def rollup_collection(db, resolution):
+    """
+    Collection holding readings at the given resolution ('raw' is GOCI.sensors).
+    """
+    if resolution == 'raw':
+        return db.sensors
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected 'raw' or one of {list(RESOLUTIONS)}")
+    return db[f'sensors_{resolution}']
+
+
+def floor_time(value, step):
+    """
+    Start of the step-second bucket containing value (days start at midnight).
+    """
+    return datetime.min + timedelta(seconds=(value - datetime.min).total_seconds() // step * step)
+
+
+def to_utc(value):
+    """
+    A naive local datetime (the clock of the reading Timestamps) as the naive
+    UTC datetime of Inserted_at.
+    """
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def rewritten_since(collection, inserted_after, inserted_until):
+    """
+    Whether a bucket that existed at inserted_after was written again up to
+    inserted_until, i.e. a consumer that read it before would count it twice.
+    """
+    query = {'Inserted_at': {'$gt': inserted_after, '$lte': inserted_until}, 'Created_at': {'$lte': inserted_after}}
+    return collection.find_one(query, {'_id': 1}) is not None
+
+
+def _source_batches(collection, resolution, start, end, sites=None, inserted_until=None):
+    """
+    Yield (sites, times, count, total, low, high) batches from raw readings
+    (inserted up to inserted_until) or from a finer rollup, where total is
+    the per-feature sum.
+    """
+    n = len(FEATURES)
+    if resolution == 'raw':
+        for sites, times, values in iter_site_batches(collection, start=start, end=end, features=FEATURES, sites=sites,
+                                                      inserted_until=inserted_until):
+            yield sites, times, np.ones(len(times)), values, values, values
+    else:
+        for sites, times, values in iter_site_batches(collection, start=start, end=end, features=_STAT_FIELDS, sites=sites):
+            count = values[:, -1]
+            yield sites, times, count, values[:, :n] * count[:, None], values[:, n:2 * n], values[:, 2 * n:3 * n]
+
+
+def _group(sites, buckets, count, total, low, high):
+    """
+    Merge rows of the same site and bucket; the groups come out sorted by
+    bucket (and by order of first appearance of the site within a bucket).
+    """
+    # A dict lookup per row is cheaper than np.unique on an object array
+    index = {}
+    codes = np.fromiter((index.setdefault(site, len(index)) for site in sites), dtype=np.intp, count=len(sites))
+    order = np.lexsort((codes, buckets))
+    codes, buckets = codes[order], buckets[order]
+    starts = np.flatnonzero(np.r_[True, (buckets[1:] != buckets[:-1]) | (codes[1:] != codes[:-1])])
+    names = np.array(list(index), dtype=object)
+    return (
+        names[codes[starts]],
+        buckets[starts],
+        np.add.reduceat(count[order], starts),
+        np.add.reduceat(total[order], starts, axis=0),
+        np.minimum.reduceat(low[order], starts, axis=0),
+        np.maximum.reduceat(high[order], starts, axis=0),
+    )
+
+
+def _documents(sites, buckets, count, total, low, high):
+    docs = []
+    for i, (site, bucket) in enumerate(zip(sites, buckets.astype(datetime))):
+        doc = {'_id': {'site': site, 'time': bucket}, 'Time': bucket, 'Timestamp': bucket.strftime(TIMESTAMP_FORMAT),
+               'count': int(count[i])}
+        if site != DEFAULT_SITE:
+            doc['Sensor_id'] = site
+        for j, name in enumerate(FEATURES):
+            doc[name] = float(total[i, j] / count[i])
+            doc[f'{name}_min'] = float(low[i, j])
+            doc[f'{name}_max'] = float(high[i, j])
+        docs.append(doc)
+    return docs
+
+
+def _spans(keys, step):
+    """
+    Split (site, bucket start) keys into runs of adjacent buckets; yields
+    (first bucket start, end of the last bucket, sites) per run.
+    """
+    by_bucket = defaultdict(set)
+    for site, bucket in keys:
+        by_bucket[bucket].add(site)
+    run = None
+    for bucket in sorted(by_bucket):
+        if run is not None and bucket == run[1]:
+            run[1] = bucket + timedelta(seconds=step)
+            run[2].update(by_bucket[bucket])
+        else:
+            if run is not None:
+                yield tuple(run)
+            run = [bucket, bucket + timedelta(seconds=step), set(by_bucket[bucket])]
+    if run is not None:
+        yield tuple(run)
+
+
+class RollupUpdater:
+    """
+    Keep the rollup collections up to date from the raw readings.
+
+    update() takes the raw readings inserted since the previous update (and
+    overlap_seconds before it, since recomputing a bucket is idempotent), up
+    to lag_seconds before now (the cutoff), and recomputes the buckets they
+    fall into that are complete, i.e. ended at least lag_seconds before the
+    cutoff; then the coarser buckets containing rewritten ones. Buckets that
+    are not complete yet stay pending in the rollup_state collection until
+    they are. Call it periodically. The first update (and the first after
+    reset()) rebuilds every rollup by streaming the sources in batches, so
+    memory stays bounded however much history there is.
+    """
+
+    def __init__(self, db, lag_seconds=5.0, overlap_seconds=INGEST_OVERLAP_SECONDS):
+        self.db = db
+        self.lag_seconds = lag_seconds
+        self.overlap_seconds = overlap_seconds
+        self.state = db.rollup_state
+        self._indexed = False
+
+    def _save(self, inserted, pending):
+        self.state.replace_one({'_id': STATE_ID}, {
+            '_id': STATE_ID,
+            'inserted_utc': inserted,
+            'pending': {resolution: [list(key) for key in sorted(keys)] for resolution, keys in pending.items()},
+        }, upsert=True)
+
+    def _write(self, target, groups, keys=None):
+        """
+        Upsert the grouped buckets (only those in keys, if given); returns
+        their (site, bucket start) keys.
+        """
+        docs = _documents(*groups)
+        if keys is not None:
+            docs = [doc for doc in docs if (doc['_id']['site'], doc['Time']) in keys]
+        written = [(doc['_id']['site'], doc['Time']) for doc in docs]
+        if docs:
+            now = utc_now()
+            ops = []
+            for doc in docs:
+                key = doc.pop('_id')
+                doc['Inserted_at'] = now
+                ops.append(UpdateOne({'_id': key}, {'$set': doc, '$setOnInsert': {'Created_at': now}}, upsert=True))
+            target.bulk_write(ops, ordered=False)
+        return written
+
+    def _roll(self, resolution, start=None, end=None, sites=None, keys=None, inserted_until=None):
+        """
+        Roll the source rows with Timestamp in [start, end] up into the
+        resolution's buckets, streaming them in batches; returns the keys
+        written.
+        """
+        step = RESOLUTIONS[resolution]
+        source_resolution = SOURCES[resolution]
+        source = rollup_collection(self.db, source_resolution)
+        target = rollup_collection(self.db, resolution)
+        if source_resolution != 'raw':
+            # Rollups are complete as written; only raw readings are bounded by insertion
+            inserted_until = None
+        written = []
+        carry = None
+        for sites, times, *stats in _source_batches(source, source_resolution, start, end, sites, inserted_until):
+            buckets = (times.astype('int64') // step * step).astype('datetime64[s]')
+            if carry is not None:
+                sites = np.concatenate([carry[0], sites])
+                buckets = np.concatenate([carry[1], buckets])
+                stats = [np.concatenate([c, s]) for c, s in zip(carry[2:], stats)]
+            groups = _group(sites, buckets, *stats)
+            # The last bucket (of every site) may continue in the next batch
+            last = groups[1] == groups[1][-1]
+            complete = [g[~last] for g in groups]
+            carry = [g[last] for g in groups]
+            written += self._write(target, complete, keys)
+        if carry is not None:
+            written += self._write(target, carry, keys)
+        return written
+
+    def _source_keys(self, resolution, start=None, inserted_after=None, inserted_until=None):
+        """
+        Keys of the resolution's buckets that the matching source rows fall into.
+        """
+        step = RESOLUTIONS[resolution]
+        source = rollup_collection(self.db, SOURCES[resolution])
+        keys = set()
+        # Only the times are needed; one feature keeps the projection small
+        for sites, times, _ in iter_site_batches(source, start=start, features=FEATURES[:1],
+                                                 inserted_after=inserted_after, inserted_until=inserted_until):
+            buckets = (times.astype('int64') // step * step).astype('datetime64[s]').astype(datetime)
+            keys.update(zip(sites.tolist(), buckets.tolist()))
+        return keys
+
+    def _complete_before(self, cutoff, step):
+        # Buckets starting before this ended at least lag_seconds before the cutoff
+        return floor_time(cutoff - timedelta(seconds=self.lag_seconds), step)
+
+    def _rebuild(self, cutoff, inserted_until):
+        """
+        Roll up every complete bucket; the incomplete ones become pending.
+        """
+        written = {}
+        pending = {}
+        for resolution, step in RESOLUTIONS.items():
+            complete_before = self._complete_before(cutoff, step)
+            written[resolution] = len(self._roll(resolution, end=complete_before - timedelta(seconds=1),
+                                                 inserted_until=inserted_until))
+            until = inserted_until if SOURCES[resolution] == 'raw' else None
+            pending[resolution] = self._source_keys(resolution, start=complete_before, inserted_until=until)
+        return written, pending
+
+    def _refresh(self, state, cutoff, inserted_until):
+        """
+        Recompute the complete buckets touched by readings inserted since the
+        previous update, or pending from it.
+        """
+        inserted_after = state['inserted_utc'] - timedelta(seconds=self.overlap_seconds)
+        touched = self._source_keys('1m', inserted_after=inserted_after, inserted_until=inserted_until)
+        written = {}
+        pending = {}
+        for resolution, step in RESOLUTIONS.items():
+            keys = {(site, floor_time(bucket, step)) for site, bucket in touched}
+            keys.update(tuple(key) for key in state.get('pending', {}).get(resolution, []))
+            complete_before = self._complete_before(cutoff, step)
+            complete = {key for key in keys if key[1] < complete_before}
+            pending[resolution] = keys - complete
+            touched = []
+            for start, end, sites in _spans(complete, step):
+                touched += self._roll(resolution, start=start, end=end - timedelta(seconds=1), sites=sites,
+                                      keys=complete, inserted_until=inserted_until)
+            written[resolution] = len(touched)
+        return written, pending
+
+    def update(self, now=None):
+        """
+        Roll up the buckets completed or touched by late readings since the
+        previous update; returns {resolution: buckets written}. now is local
+        time, as the reading Timestamps.
+        """
+        if not self._indexed:
+            ensure_indexes(rollup_collection(self.db, 'raw'))
+            for resolution in RESOLUTIONS:
+                ensure_indexes(rollup_collection(self.db, resolution))
+            self._indexed = True
+
+        now = datetime.now() if now is None else now
+        cutoff = now - timedelta(seconds=self.lag_seconds)
+        inserted_until = to_utc(cutoff)
+        state = self.state.find_one({'_id': STATE_ID})
+        if state is None or state.get('inserted_utc') is None:
+            # First run, or state kept before Inserted_at (or with a local-time cutoff)
+            self.reset()
+            written, pending = self._rebuild(cutoff, inserted_until)
+        else:
+            written, pending = self._refresh(state, cutoff, inserted_until)
+        self._save(inserted_until, pending)
+        return written
+
+    def reset(self):
+        """
+        Forget the state and the rollups so the next update() rebuilds them.
+        """
+        self.state.delete_one({'_id': STATE_ID})
+        for resolution in RESOLUTIONS:
+            rollup_collection(self.db, resolution).delete_many({})
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != '--backfill':
+        sys.exit("Usage: python rollups.py --backfill <mongo_uri>")
+
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+
+    db = MongoClient(sys.argv[2], server_api=ServerApi('1')).GOCI
+    ensure_indexes(db.sensors)
+    updater = RollupUpdater(db)
+    updater.reset()
+    for resolution, count in updater.update().items():
+        print(f"Backfilled {count} {resolution} rollups")
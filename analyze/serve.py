@@ -0,0 +1,14 @@
+"""
+Entry point of the analyze service: `python serve.py`.
+
+The job pool (jobs.py) spawns its processes, and each re-imports the main
+module. This one imports analyze.py, which builds the Flask app, the MongoDB
+client, the model store and the weather cache, only when it runs as the main
+program, so the pool processes do not build them.
+"""
+
+if __name__ == '__main__':
+    import analyze
+
+    analyze.start_background_tasks()
+    analyze.app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,133 @@
+"""
+Streaming anomaly detection: one-step-ahead forecast residuals for every
+new reading, and rolling anomaly rates over fixed windows of readings.
+
+Instead of forecasting the last 120 readings of a fixed 500-reading window on
+each request, every reading is compared with the forecast made from the
+time_step readings before it, as it arrives. The per-feature thresholds and
+the leakage rule (Pressure and Flow_rate both off) are those of pipeline.py.
+Each window keeps a ring buffer of flags and their running sum, so a reading
+costs O(1) per window, and one batched LSTM pass per poll.
+"""
+import threading
+
+import numpy as np
+
+from forecaster import NumpyForecaster
+from pipeline import THRESHOLDS, time_step
+from preprocessing import sliding_windows
+from sensor_store import format_timestamp
+
+KINDS = ('leakage', 'water_quality', 'temperature')
+
+
+class RollingRate:
+    """
+    Share of flagged readings among the last `window` readings.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._flags = np.zeros(window, dtype=bool)
+        self._next = 0
+        self.count = 0
+        self.flagged = 0
+
+    def push(self, flag):
+        flag = bool(flag)
+        if self.count == self.window:
+            self.flagged -= self._flags[self._next]
+        else:
+            self.count += 1
+        self._flags[self._next] = flag
+        self.flagged += flag
+        self._next = (self._next + 1) % self.window
+
+    @property
+    def percent(self):
+        return self.flagged / self.count * 100 if self.count else 0.0
+
+
+class StreamingDetector:
+    """
+    Feed the readings of one site in order with update(); read the current
+    rates with snapshot(). A model must be set before the first update.
+    """
+
+    def __init__(self, windows=(120,), thresholds=THRESHOLDS):
+        self.windows = tuple(sorted(windows))
+        self.thresholds = dict(thresholds)
+        self.rates = {window: {kind: RollingRate(window) for kind in KINDS} for window in self.windows}
+        self._lock = threading.Lock()
+        self._history = None
+        self.forecaster = None
+        self.scaler = None
+        self.model_version = None
+        self.watermark = None
+        self.readings = 0
+
+    def set_model(self, model, scaler, version):
+        """
+        Forecast with a new model from the next reading on; the rates keep
+        the flags of the previous one until they roll out of the windows.
+        """
+        forecaster = NumpyForecaster(model)
+        with self._lock:
+            self.forecaster = forecaster
+            self.scaler = scaler
+            self.model_version = version
+
+    def update(self, times, values, temperature_threshold):
+        """
+        Flag a batch of new readings (oldest first) and fold the flags into
+        the rates. The first time_step readings only fill the history.
+        """
+        if len(values) == 0:
+            return
+        with self._lock:
+            if self.forecaster is None:
+                raise RuntimeError("StreamingDetector.update() called before set_model()")
+            raw = values if self._history is None else np.concatenate([self._history, values])
+            self._history = raw[-time_step:]
+            # A late reading does not move the watermark back
+            self.watermark = times[-1] if self.watermark is None else max(self.watermark, times[-1])
+            new = len(raw) - time_step
+            if new <= 0:
+                return
+
+            # Every reading after the first time_step is forecast from the ones before it
+            scaled = self.scaler.transform(raw)
+            windows = sliding_windows(scaled[:-1], time_step)[-new:]
+            predictions = self.scaler.inverse_transform(self.forecaster.predict_next(windows))
+            residuals = np.abs(raw[-new:] - predictions)
+
+            pressure_flags = residuals[:, 0] > self.thresholds['Pressure']
+            flow_flags = residuals[:, 1] > self.thresholds['Flow_rate']
+            flags = {
+                'leakage': pressure_flags & flow_flags,
+                'water_quality': residuals[:, 2] > self.thresholds['Water_quality'],
+                'temperature': residuals[:, 3] > temperature_threshold,
+            }
+            # Only the last `window` flags can still count for a window
+            for window, rates in self.rates.items():
+                for kind, rate in rates.items():
+                    for flag in flags[kind][-window:]:
+                        rate.push(flag)
+            self.readings += new
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'model_version': self.model_version,
+                'watermark': format_timestamp(self.watermark) if self.watermark is not None else None,
+                'readings': self.readings,
+                'windows': {
+                    window: {
+                        'readings': rates['leakage'].count,
+                        'leakage_percent': rates['leakage'].percent,
+                        'water_quality_percent': rates['water_quality'].percent,
+                        'temperature_percent': rates['temperature'].percent,
+                    }
+                    for window, rates in self.rates.items()
+                },
+            }
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+
+import requests
+
+
+class OpenWeatherProvider:
+    """
+    Current temperature from the OpenWeather API (or a local stand-in serving
+    the same JSON at base_url), with a hard request timeout.
+    """
+
+    def __init__(self, api_key, base_url="http://api.openweathermap.org/data/2.5/weather", timeout=3.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def fetch(self, city):
+        response = requests.get(
+            self.base_url,
+            params={"q": city, "appid": self.api_key, "units": "metric"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return float(response.json()['main']['temp'])
+
+
+class FileProvider:
+    """
+    Temperatures read from a JSON file, either {"city": temp, ...} or a single number.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, city):
+        with open(self.path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return float(data[city])
+        return float(data)
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing provider for reset_timeout seconds after
+    failure_threshold consecutive failures, then allow one trial call.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class AmbientTemperatureCache:
+    """
+    Per-city ambient temperature with a TTL, refreshed in the background.
+
+    get() never touches the network: it returns the cached value (stale if a
+    refresh is due or in flight) and, when the value is older than ttl, starts
+    one background refresh guarded by the circuit breaker. Until the first
+    successful fetch the default value is returned.
+    """
+
+    def __init__(self, provider, ttl=600.0, default=20.0, breaker=None):
+        self.provider = provider
+        self.ttl = ttl
+        self.default = default
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._values = {}       # city -> (temperature, fetched_at wall time, fetched_at monotonic)
+        self._refreshing = set()
+
+    def get(self, city):
+        """
+        Return (temperature, fetched_at, age_seconds). fetched_at and age are
+        None when no value has been fetched yet and the default is used.
+        """
+        with self._lock:
+            entry = self._values.get(city)
+        if entry is None or time.monotonic() - entry[2] >= self.ttl:
+            self.refresh_async(city)
+        if entry is None:
+            return self.default, None, None
+        return entry[0], entry[1], time.monotonic() - entry[2]
+
+    def refresh_async(self, city):
+        with self._lock:
+            if city in self._refreshing or not self.breaker.allow():
+                return
+            self._refreshing.add(city)
+        threading.Thread(target=self._refresh, args=(city,), name=f"weather-{city}", daemon=True).start()
+
+    def _refresh(self, city):
+        try:
+            temperature = self.provider.fetch(city)
+            with self._lock:
+                self._values[city] = (temperature, time.time(), time.monotonic())
+            self.breaker.record_success()
+        except Exception as e:
+            self.breaker.record_failure()
+            print(f"Ambient temperature refresh failed for {city}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(city)
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of preprocessing.py against the per-row code it replaced:
+reading dicts to a standardized batch (ingress), MongoDB documents to arrays
+(sensor_store) and sliding-window training sequences (analyze).
+
+Usage:
+    python benchmark_preprocessing.py [--batch 256] [--docs 10000] [--window 500] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ingress"))
+
+from preprocessing import (  # noqa: E402
+    FEATURES, TRAINING_MEANS, TRAINING_STDS, Standardizer, features_from_dicts, supervised_windows,
+)
+
+feature_means = np.array(TRAINING_MEANS)
+feature_stds = np.array(TRAINING_STDS)
+
+
+# Reference implementations, as they were before preprocessing.py
+
+def per_row_input(sensor_data):
+    features = np.array([
+        sensor_data.get('Pressure'),
+        sensor_data.get('Flow_rate'),
+        sensor_data.get('Water_quality'),
+        sensor_data.get('Temperature')
+    ], dtype=np.float32)
+    features = (features - feature_means) / feature_stds
+    return features.reshape(1, -1)
+
+
+def per_row_batch(sensor_batch):
+    features = np.array([
+        [sensor_data.get('Pressure'),
+         sensor_data.get('Flow_rate'),
+         sensor_data.get('Water_quality'),
+         sensor_data.get('Temperature')]
+        for sensor_data in sensor_batch
+    ], dtype=np.float32)
+    return (features - feature_means) / feature_stds
+
+
+def per_row_documents(docs, features):
+    values = np.empty((len(docs), len(features)), dtype=np.float64)
+    for i, doc in enumerate(docs):
+        values[i] = [doc[name] for name in features]
+    return values
+
+
+def loop_dataset(dataset, time_step):
+    X, y = [], []
+    for i in range(len(dataset) - time_step):
+        X.append(dataset[i:i+time_step])
+        y.append(dataset[i+time_step])
+    return np.array(X), np.array(y)
+
+
+def readings(count, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(feature_means, feature_stds, size=(count, len(FEATURES)))
+    return [
+        {'Timestamp': '2025-01-01 00:00:00', 'Sent_at': 0.0, **dict(zip(FEATURES, row.tolist()))}
+        for row in values
+    ]
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def compare(name, reference, fast, repeat):
+    expected, reference_time = time_call(reference, repeat)
+    result, fast_time = time_call(fast, repeat)
+    if isinstance(expected, tuple):
+        error = max(np.max(np.abs(np.asarray(r) - e)) for r, e in zip(result, expected))
+    else:
+        error = np.max(np.abs(np.asarray(result) - expected))
+    print(f"{name:<28} per-row {reference_time * 1e6:>10.1f} us  vectorized {fast_time * 1e6:>10.1f} us  "
+          f"speedup {reference_time / fast_time:>6.1f}x  max |diff| {error:.1e}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', type=int, default=256, help="readings per inference batch")
+    parser.add_argument('--docs', type=int, default=10000, help="documents per MongoDB read batch")
+    parser.add_argument('--window', type=int, default=500, help="readings in the analyze window")
+    parser.add_argument('--time-step', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    standardizer = Standardizer()
+    batch = readings(args.batch)
+    docs = readings(args.docs, seed=1)
+    series = np.array([[doc[name] for name in FEATURES] for doc in readings(args.window, seed=2)], dtype=np.float32)
+
+    compare("single reading", lambda: per_row_input(batch[0]),
+            lambda: standardizer.transform_dict(batch[0]), args.repeat * 10)
+    compare(f"batch of {args.batch}", lambda: per_row_batch(batch),
+            lambda: standardizer.transform_dicts(batch), args.repeat)
+    compare(f"{args.docs} documents", lambda: per_row_documents(docs, FEATURES),
+            lambda: features_from_dicts(docs, FEATURES, dtype=np.float64), max(1, args.repeat // 10))
+    compare(f"windows of {args.window}", lambda: loop_dataset(series, args.time_step),
+            lambda: supervised_windows(series, args.time_step), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+In-process stand-ins for the external services the scripts connect to at
+import time: a fake pyrebase stream, an in-memory MongoDB (mongomock), a
+local Telegram endpoint and a weather file, plus synthetic models and data.
+"""
+import json
+import os
+import sys
+import threading
+import types
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Simulation"))
+
+from sim_core import FEATURES, TIMESTAMP_FORMAT, SensorArray  # noqa: E402
+
+
+class FakeStream:
+    def __init__(self, firebase, path, handler):
+        self.firebase = firebase
+        self.path = path
+        self.handler = handler
+
+    def close(self):
+        self.firebase.unsubscribe(self)
+
+
+class FakeDatabase:
+    """
+    The part of the pyrebase database API the scripts use: child(), set() and stream().
+    """
+
+    def __init__(self, firebase, path=()):
+        self.firebase = firebase
+        self.path = path
+
+    def child(self, name):
+        return FakeDatabase(self.firebase, self.path + (str(name),))
+
+    def set(self, data):
+        self.firebase.set("/".join(self.path), data)
+
+    def stream(self, handler):
+        return self.firebase.subscribe("/".join(self.path), handler)
+
+
+class FakeFirebase:
+    """
+    Replaces the pyrebase module. Streams registered by a script are kept so
+    the benchmark can push messages to them; push() calls the handler on the
+    caller's thread, like pyrebase does on its stream thread.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self._streams = []
+        self._subscribed = threading.Condition()
+
+    def initialize_app(self, config):
+        return self
+
+    def database(self):
+        return FakeDatabase(self)
+
+    def subscribe(self, path, handler):
+        stream = FakeStream(self, path, handler)
+        with self._subscribed:
+            self._streams.append(stream)
+            self._subscribed.notify_all()
+        return stream
+
+    def unsubscribe(self, stream):
+        with self._subscribed:
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+    def wait_for_stream(self, path, timeout=60):
+        with self._subscribed:
+            if not self._subscribed.wait_for(lambda: any(s.path == path for s in self._streams), timeout):
+                raise TimeoutError(f"No stream on {path} after {timeout} s")
+
+    def set(self, path, data):
+        self.data[path] = data
+        root, _, sub_path = path.partition("/")
+        self.push(root, data, "/" + sub_path)
+
+    def push(self, path, data, sub_path="/", event="put"):
+        message = {"event": event, "path": sub_path, "data": data}
+        for stream in list(self._streams):
+            if stream.path == path:
+                stream.handler(message)
+
+    def install(self):
+        module = types.ModuleType("pyrebase")
+        module.initialize_app = self.initialize_app
+        sys.modules["pyrebase"] = module
+
+
+def install_fake_mongo():
+    """
+    Route every pymongo.MongoClient(...) to one shared in-memory mongomock client.
+    Must run before the script under test imports MongoClient.
+    """
+    import mongomock
+    import pymongo
+
+    client = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    return client
+
+
+def start_telegram_stub():
+    """
+    Local endpoint accepting Telegram sendMessage calls; returns (server, base_url).
+    """
+
+    class TelegramHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramHandler)
+    threading.Thread(target=server.serve_forever, name="telegram-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def write_weather_file(path, city="Bangsar", temperature=27.0):
+    with open(path, "w") as f:
+        json.dump({city: temperature}, f)
+
+
+def write_synthetic_model(path, hidden=(64, 32), seed=0):
+    """
+    Random dense classifier (4 inputs, 4 classes) in the .npz format of
+    export_model.py, so NumpyModel loads it like the real model.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = [len(FEATURES), *hidden, 4]
+    arrays = {}
+    activations = []
+    for i, (n_in, n_out) in enumerate(zip(sizes[:-1], sizes[1:])):
+        arrays[f"kernel_{i}"] = rng.normal(0, 1 / np.sqrt(n_in), size=(n_in, n_out)).astype(np.float32)
+        arrays[f"bias_{i}"] = np.zeros(n_out, dtype=np.float32)
+        activations.append("softmax" if i == len(sizes) - 2 else "relu")
+    np.savez_compressed(path, activations=np.array(activations), **arrays)
+
+
+def sensor_history(count, end, interval=1.0, seed=0):
+    """
+    count simulated readings of one pipe, one every interval seconds up to end,
+    as stored by the simulator (Timestamp string plus parsed Time).
+    """
+    sensors = SensorArray(n=1, seed=seed)
+    start = end - timedelta(seconds=interval * (count - 1))
+    docs = []
+    for i in range(count):
+        sensors.step()
+        if i % 500 == 0:
+            sensors.inject_random(0.5)
+        now = (start + timedelta(seconds=interval * i)).replace(microsecond=0)
+        values = sensors.state[0].tolist()
+        doc = {"Timestamp": now.strftime(TIMESTAMP_FORMAT), "Time": now}
+        doc.update(zip(FEATURES, values))
+        docs.append(doc)
+    return docs
@@ -0,0 +1,298 @@
+"""
+Replay exported sensor history through an ingress service, without Firebase.
+
+Readings are read from a JSONL file (one reading per line, as written by
+mongoexport), a JSON array (mongoexport --jsonArray), a CSV file with a
+header row, or a mongodump .bson file, ordered by Timestamp, and pushed
+through the script's stream_handler in the same in-process setup as
+run_benchmarks.py (stand-ins for Firebase, MongoDB and Telegram). Readings
+are paced by their timestamps at --speed times real time, or sent as fast
+as the pipeline takes them with --speed max.
+
+Every handled reading is written to --output as one JSON line with its
+sequence number in the input, sensor key, Timestamp, label and latency from
+push to label; readings where the alerted status of the sensor changes
+(anomaly after Normal, Normal after an anomaly, as Simulation/Ingress.py
+alerts) also carry "status". --compare checks the labels against an earlier
+output of the same input, e.g. from another model version, and exits
+non-zero when any differ.
+
+Usage:
+    python benchmarks/replay.py history.jsonl --speed 10 --output replay.jsonl
+    python benchmarks/replay.py dump/GOCI/sensors.bson --service simulation_ingress --speed max \
+        --model candidate.npz --output candidate.jsonl --compare replay.jsonl
+"""
+import argparse
+import collections
+import contextlib
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from fakes import FEATURES, TIMESTAMP_FORMAT, FakeFirebase, install_fake_mongo, start_telegram_stub
+from run_benchmarks import SCRIPTS, latency_summary, run_script
+
+FORMATS = ("jsonl", "json", "csv", "bson")
+EXTENSIONS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "json", ".csv": "csv", ".bson": "bson"}
+
+
+def read_documents(path, fmt):
+    if fmt == "bson":
+        import bson
+
+        with open(path, "rb") as f:
+            yield from bson.decode_file_iter(f)
+        return
+    if fmt == "csv":
+        with open(path, newline="") as f:
+            yield from csv.DictReader(f)
+        return
+    # mongoexport writes MongoDB extended JSON ({"$date": ...}, {"$oid": ...})
+    from bson import json_util
+
+    with open(path) as f:
+        if fmt == "json":
+            yield from json_util.loads(f.read())
+        else:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def reading_time(doc):
+    if doc.get("Timestamp"):
+        return datetime.strptime(doc["Timestamp"], TIMESTAMP_FORMAT)
+    value = doc.get("Time")
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None, microsecond=0)
+    if value:
+        return datetime.fromisoformat(value).replace(tzinfo=None, microsecond=0)
+    raise ValueError(f"Reading without Timestamp or Time: {doc}")
+
+
+def load_history(path, fmt=None):
+    """
+    Return the readings of an export as (times, readings), ordered by time:
+    times in epoch seconds and readings as the JSON values the simulator
+    sends to Firebase (Timestamp, the features and Sensor_id if present).
+    """
+    fmt = fmt or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format of {path}, pass --format ({', '.join(FORMATS)})")
+    times = []
+    readings = []
+    for doc in read_documents(path, fmt):
+        when = reading_time(doc)
+        reading = {"Timestamp": when.strftime(TIMESTAMP_FORMAT)}
+        for name in FEATURES:
+            reading[name] = float(doc[name])
+        if doc.get("Sensor_id"):
+            reading["Sensor_id"] = str(doc["Sensor_id"])
+        times.append(when.timestamp())
+        readings.append(reading)
+    order = np.argsort(np.array(times), kind="stable")
+    return [times[i] for i in order], [readings[i] for i in order]
+
+
+def status_transitions(events):
+    """
+    Mark the events where a sensor's alerted status changes: an anomaly
+    after Normal, or Normal after an anomaly (events in input order).
+    """
+    status = {}
+    transitions = 0
+    for event in events:
+        previous = status.get(event["key"], "Normal")
+        label = event["label"]
+        if (label != "Normal" and previous == "Normal") or (label == "Normal" and previous != "Normal"):
+            event["status"] = label
+            status[event["key"]] = label
+            transitions += 1
+    return transitions
+
+
+def replay(service, times, readings, speed, model=None, timeout=300.0):
+    """
+    Push the readings through the service's stream handler and return
+    (events ordered by sequence number, summary).
+    """
+    firebase = FakeFirebase()
+    firebase.install()
+    install_fake_mongo()
+    _, telegram_url = start_telegram_stub()
+
+    script = SCRIPTS[service]
+    model = model or os.path.join(os.path.dirname(script), "water_system_model.npz")
+    engine = "keras" if model.endswith(".h5") else "numpy"
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    shutil.copyfile(model, os.path.join(workdir, "water_system_model" + os.path.splitext(model)[1]))
+    os.chdir(workdir)
+    os.environ.update({"TELEGRAM_API_URL": telegram_url, "METRICS_PORT": "0", "INFERENCE_ENGINE": engine})
+    # Label every reading unless the run asks for the service's overload policy
+    os.environ.setdefault("INTAKE_POLICY", "block")
+
+    module = run_script(script)
+    firebase.wait_for_stream("sensor_data")
+
+    handler_name = "handle_label" if "handle_label" in module.__dict__ else "handle_anomaly_label"
+    original = module.__dict__[handler_name]
+    events = []
+    lock = threading.Lock()
+
+    def recording_handler(key, sensor_data, anomaly_label):
+        original(key, sensor_data, anomaly_label)
+        latency = time.perf_counter() - sensor_data["_replay_sent"]
+        with lock:
+            events.append({
+                "seq": sensor_data["_replay_seq"],
+                "key": key,
+                "Timestamp": sensor_data["Timestamp"],
+                "label": anomaly_label,
+                "latency_ms": latency * 1000,
+            })
+
+    def shed():
+        intake = module.__dict__.get("intake")
+        return intake.coalesced + intake.dropped if intake is not None else 0
+
+    def errors():
+        # Readings that failed classification are counted but never labeled
+        return int(getattr(module.errors_total.labels(), "value", 0))
+
+    module.__dict__[handler_name] = recording_handler
+
+    started = time.perf_counter()
+    behind = 0.0
+    for seq, (when, reading) in enumerate(zip(times, readings)):
+        if speed:
+            delay = started + (when - times[0]) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                behind = max(behind, -delay)
+        data = dict(reading, _replay_seq=seq, _replay_sent=time.perf_counter())
+        firebase.push("sensor_data", data, f"/{reading['Sensor_id']}" if "Sensor_id" in reading else "/")
+    deadline = time.monotonic() + timeout
+    while len(events) + shed() + errors() < len(readings) and time.monotonic() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    with lock:
+        events = sorted(events, key=lambda event: event["seq"])
+    transitions = status_transitions(events)
+    summary = {
+        "service": service,
+        "model": os.path.abspath(model) if os.path.exists(model) else model,
+        "model_version": module.__dict__.get("model_version"),
+        "speed": speed or "max",
+        "readings": len(readings),
+        "handled": len(events),
+        "shed": shed(),
+        "errors": errors(),
+        "seconds": elapsed,
+        "history_seconds": times[-1] - times[0] if times else 0.0,
+        "throughput_per_s": len(events) / elapsed if elapsed else 0.0,
+        "max_behind_schedule_ms": behind * 1000,
+        **latency_summary([event["latency_ms"] / 1000 for event in events]),
+        "labels": dict(collections.Counter(event["label"] for event in events)),
+        "status_transitions": transitions,
+    }
+    if hasattr(module, "bench_error"):
+        summary["error"] = repr(module.bench_error)
+    return events, summary
+
+
+def read_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_labels(baseline, events, show=10):
+    """
+    Print the label changes against an earlier replay of the same input;
+    returns the number of readings whose label differs.
+    """
+    before = {event["seq"]: event for event in baseline}
+    changes = collections.Counter()
+    changed = []
+    for event in events:
+        old = before.get(event["seq"])
+        if old is not None and old["label"] != event["label"]:
+            changes[(old["label"], event["label"])] += 1
+            changed.append((old, event))
+    common = sum(event["seq"] in before for event in events)
+    print(f"\nCompared with the earlier replay: {len(changed)} of {common} common readings changed label")
+    for (old, new), count in changes.most_common():
+        print(f"  {old:<22} -> {new:<22} {count}")
+    for old, new in changed[:show]:
+        print(f"  #{new['seq']} {new['key']} {new['Timestamp']}: {old['label']} -> {new['label']}")
+    old_transitions = sum("status" in event for event in baseline)
+    new_transitions = sum("status" in event for event in events)
+    print(f"  Status transitions: {old_transitions} -> {new_transitions}")
+    return len(changed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay exported sensor history through an ingress service.")
+    parser.add_argument('input', help='JSONL, JSON array, CSV or mongodump .bson file of readings')
+    parser.add_argument('--format', choices=FORMATS, help='input format (default: from the file extension)')
+    parser.add_argument('--service', choices=list(SCRIPTS), default='ingress')
+    parser.add_argument('--speed', default='1', help='multiple of real time (1, 10, ...) or "max"')
+    parser.add_argument('--model', help='classifier .npz or .h5 to serve (default: the bundled model)')
+    parser.add_argument('--limit', type=int, help='replay only the first N readings')
+    parser.add_argument('--output', default='replay.jsonl', help='per-reading results (JSON lines)')
+    parser.add_argument('--summary', help='also write the summary to this JSON file')
+    parser.add_argument('--compare', help='earlier --output of the same input to check the labels against')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds to wait for the last labels')
+    parser.add_argument('--verbose', action='store_true', help="show the service's console output")
+    args = parser.parse_args()
+
+    speed = 0.0 if args.speed == 'max' else float(args.speed)
+    times, readings = load_history(args.input, args.format)
+    if args.limit is not None:
+        times, readings = times[:args.limit], readings[:args.limit]
+    if not readings:
+        sys.exit(f"No readings in {args.input}")
+    model = os.path.abspath(args.model) if args.model else None
+    output = os.path.abspath(args.output)
+    summary_path = os.path.abspath(args.summary) if args.summary else None
+    baseline = read_events(args.compare) if args.compare else None
+    print(f"Replaying {len(readings)} readings ({readings[0]['Timestamp']} to {readings[-1]['Timestamp']}) "
+          f"through {args.service} at {args.speed}x")
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        events, summary = replay(args.service, times, readings, speed, model, args.timeout)
+
+    with open(output, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    if summary_path:
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    print(f"Per-reading results written to {output}")
+
+    code = 0
+    if baseline is not None and compare_labels(baseline, events):
+        code = 1
+    missing = summary["readings"] - summary["handled"] - summary["shed"] - summary["errors"]
+    if missing > 0:
+        print(f"Timed out: {missing} readings were not labeled")
+        code = 1
+    sys.stdout.flush()
+    # The service threads (stream loop, lanes, dispatchers) are not meant to exit
+    os._exit(code)
+
+
+if __name__ == '__main__':
+    main()
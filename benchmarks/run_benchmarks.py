@@ -0,0 +1,368 @@
+"""
+Offline benchmark suite for the ingress, analyze and predict services.
+
+Each service runs in its own subprocess against in-process fakes (see
+fakes.py): a fake pyrebase stream, an in-memory MongoDB, a local Telegram
+endpoint and a weather file, with a synthetic classifier and synthetic
+sensor history of configurable size. Throughput, p50/p99 latency and peak
+memory (max RSS) of every service are written to a JSON file; --compare
+prints the change against an earlier result file.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --services ingress simulation_ingress \
+        --events 50000 --sensors 500 --hidden 128,64 --output bench.json --compare baseline.json
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from fakes import (
+    ROOT,
+    FakeFirebase,
+    SensorArray,
+    install_fake_mongo,
+    sensor_history,
+    start_telegram_stub,
+    write_synthetic_model,
+    write_weather_file,
+)
+
+SCRIPTS = {
+    "ingress": os.path.join(ROOT, "ingress", "ingress.py"),
+    "simulation_ingress": os.path.join(ROOT, "Simulation", "Ingress.py"),
+}
+
+
+def latency_summary(latencies, prefix=""):
+    latencies = np.array(latencies) if len(latencies) else np.zeros(1)
+    return {
+        f"{prefix}latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        f"{prefix}latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_script(path):
+    """
+    Execute a service script on a daemon thread and return its live module.
+    The ingress scripts end in an endless main loop, so they never return;
+    their globals are reachable (and patchable) while they run.
+    """
+    sys.path.insert(0, os.path.dirname(path))
+    module = types.ModuleType("__bench__")
+    module.__file__ = path
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+
+    def target():
+        try:
+            exec(code, module.__dict__)
+        except Exception as e:
+            module.bench_error = e
+
+    threading.Thread(target=target, name="script", daemon=True).start()
+    return module
+
+
+def import_service(folder, name):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+    return importlib.import_module(name)
+
+
+def bench_ingress(service, args):
+    """
+    Push events through the stream handler as fast as possible (or at --rate
+    events/s) and time each one from push until its label is handled.
+    Events shed by the intake under overload are counted separately.
+    """
+    firebase = FakeFirebase()
+    firebase.install()
+    install_fake_mongo()
+    _, telegram_url = start_telegram_stub()
+
+    workdir = tempfile.mkdtemp(prefix="bench-ingress-")
+    write_synthetic_model(os.path.join(workdir, "water_system_model.npz"), hidden=args.hidden)
+    os.chdir(workdir)
+    os.environ.update({"TELEGRAM_API_URL": telegram_url, "METRICS_PORT": "0", "INFERENCE_ENGINE": "numpy"})
+
+    module = run_script(SCRIPTS[service])
+    firebase.wait_for_stream("sensor_data")
+
+    # Both scripts route every label through one module-level function
+    handler_name = "handle_label" if "handle_label" in module.__dict__ else "handle_anomaly_label"
+    original = module.__dict__[handler_name]
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_handler(key, sensor_data, anomaly_label):
+        original(key, sensor_data, anomaly_label)
+        with lock:
+            latencies.append(time.perf_counter() - sensor_data["_bench_sent"])
+
+    def shed():
+        # Readings the intake coalesced or dropped under overload are never handled
+        intake = module.__dict__.get("intake")
+        return intake.coalesced + intake.dropped if intake is not None else 0
+
+    module.__dict__[handler_name] = timed_handler
+
+    sensors = SensorArray(n=args.sensors, seed=0)
+    interval = 1 / args.rate if args.rate else 0
+    started = time.perf_counter()
+    next_send = started
+    sent = 0
+    while sent < args.events:
+        sensors.step()
+        sensors.inject_random(0.01)
+        for reading in sensors.readings():
+            if sent == args.events:
+                break
+            # Firebase holds JSON values only
+            del reading["Time"]
+            reading["_bench_sent"] = time.perf_counter()
+            path = f"/{reading['Sensor_id']}" if args.sensors > 1 else "/"
+            firebase.push("sensor_data", reading, path)
+            sent += 1
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+    deadline = time.monotonic() + args.timeout
+    while len(latencies) + shed() < args.events and time.monotonic() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    with lock:
+        handled = len(latencies)
+        result = {
+            "events": args.events,
+            "handled": handled,
+            "shed": shed(),
+            "sensors": args.sensors,
+            "throughput_per_s": handled / elapsed,
+            **latency_summary(latencies),
+        }
+    if hasattr(module, "bench_error"):
+        result["error"] = repr(module.bench_error)
+    return result
+
+
+def time_requests(client, count, before=None):
+    latencies = []
+    for _ in range(count):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        response = client.get("/")
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET / returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return latencies
+
+
+def bench_analyze(args):
+    """
+    Train on synthetic history, then time GET / with the summary cache reset
+    before every request (full forecast) and with the cache warm.
+    """
+    client = install_fake_mongo()
+    workdir = tempfile.mkdtemp(prefix="bench-analyze-")
+    os.chdir(workdir)
+    write_weather_file("weather.json")
+    os.environ.update({"MODEL_STORE_DIR": "models", "WEATHER_PROVIDER": "file", "WEATHER_FILE": "weather.json"})
+    client.GOCI.sensors.insert_many(sensor_history(args.readings, datetime.now() - timedelta(minutes=1)))
+
+    analyze = import_service("analyze", "analyze")
+    started = time.perf_counter()
+    times, data = analyze.fetch_recent_readings(analyze.db_collection)
+    model, scaler = analyze.train_model(data, epochs=args.epochs)
+    analyze.model_store.save(model, scaler, analyze.format_timestamp(times[-1]), len(data))
+    train_seconds = time.perf_counter() - started
+
+    # Let the weather stand-in be read once so requests see a fetched value
+    analyze.get_ambient_temperature()
+    deadline = time.monotonic() + 10
+    while analyze.get_ambient_temperature()[1] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    http = analyze.app.test_client()
+    http.get("/")
+
+    def reset_cache():
+        analyze.summary_cache = analyze.ResultCache()
+
+    uncached = time_requests(http, args.requests, before=reset_cache)
+    cached = time_requests(http, args.requests)
+    return {
+        "readings": args.readings,
+        "train_seconds": train_seconds,
+        "uncached_throughput_per_s": len(uncached) / sum(uncached),
+        **latency_summary(uncached, "uncached_"),
+        "cached_throughput_per_s": len(cached) / sum(cached),
+        **latency_summary(cached, "cached_"),
+    }
+
+
+def bench_predict(args):
+    """
+    Time the catch-up over the whole history (startup to ready), one
+    incremental refresh, and GET / once ready.
+    """
+    client = install_fake_mongo()
+    os.environ.update({"INGEST_LAG_SECONDS": "0"})
+    end = datetime.now() - timedelta(hours=1)
+    history = sensor_history(args.readings, end)
+    client.GOCI.sensors.insert_many(history)
+    client.GOCI.lastmaintenances.insert_one({"Timestamp": history[0]["Timestamp"]})
+
+    predict = import_service("predict", "predict")
+    started = time.perf_counter()
+    predict.refresh_estimator()
+    catch_up_seconds = time.perf_counter() - started
+    predict.ready.set()
+
+    new_readings = sensor_history(args.new_readings, end + timedelta(seconds=args.new_readings), seed=1)
+    client.GOCI.sensors.insert_many(new_readings)
+    started = time.perf_counter()
+    predict.refresh_estimator()
+    refresh_seconds = time.perf_counter() - started
+
+    requests = time_requests(predict.app.test_client(), args.requests)
+    return {
+        "readings": args.readings,
+        "catch_up_seconds": catch_up_seconds,
+        "catch_up_throughput_per_s": args.readings / catch_up_seconds,
+        "incremental_refresh_seconds": refresh_seconds,
+        "throughput_per_s": len(requests) / sum(requests),
+        **latency_summary(requests),
+    }
+
+
+BENCHMARKS = {
+    "ingress": lambda args: bench_ingress("ingress", args),
+    "simulation_ingress": lambda args: bench_ingress("simulation_ingress", args),
+    "analyze": bench_analyze,
+    "predict": bench_predict,
+}
+
+
+def run_worker(args):
+    """
+    Run one benchmark in this process with the scripts' console output
+    silenced, and write its result to --worker-output.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = BENCHMARKS[args.worker](args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    with open(args.worker_output, "w") as f:
+        json.dump(result, f)
+    # Service threads (stream loops, trainers) are not meant to exit
+    os._exit(0)
+
+
+def run_service(service):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker", service, "--worker-output", output]
+    completed = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    try:
+        with open(output) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"error": (completed.stderr or completed.stdout).strip().splitlines()[-1:] or ["no output"]}
+    finally:
+        os.remove(output)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """
+    Print every numeric result next to the baseline value and the relative change.
+    """
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('created_at')}):")
+    for service, result in current["results"].items():
+        base = baseline.get("results", {}).get(service, {})
+        for name, value in result.items():
+            old = base.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            print(f"  {service:<20} {name:<32} {old:>12.3f} -> {value:>12.3f} ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--services', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    # Ingress
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=0, help='events per second, 0 for as fast as possible')
+    parser.add_argument('--hidden', type=lambda s: tuple(int(x) for x in s.split(',')), default=(64, 32),
+                        help='hidden layer sizes of the synthetic classifier')
+    parser.add_argument('--timeout', type=float, default=300)
+    # Analyze and predict
+    parser.add_argument('--readings', type=int, default=50000, help='synthetic readings stored in MongoDB')
+    parser.add_argument('--new-readings', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--epochs', type=int, default=2)
+    # Internal: run one service in this process
+    parser.add_argument('--worker', choices=list(BENCHMARKS), help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "worker", "worker_output")},
+        "results": {},
+    }
+    for service in args.services:
+        print(f"Running {service} ...")
+        result = run_service(service)
+        report["results"][service] = result
+        print(f"  {json.dumps(result)}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
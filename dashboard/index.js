@@ -26,6 +26,15 @@ const StatusModel = mongoose.model('status', new mongoose.Schema({}, { strict: f
 const NotiModel = mongoose.model('notifications', new mongoose.Schema({}, { strict: false }));
 const ScheduleModel = mongoose.model('schedules', new mongoose.Schema({}, { strict: false }));
 
+// Downsampled readings maintained by the predict service (predict/rollups.py):
+// one document per minute, hour or day with the mean, min and max of each feature.
+const RollupModels = Object.fromEntries(
+  ['1m', '1h', '1d'].map((resolution) => [
+    resolution,
+    mongoose.model(`sensors_${resolution}`, new mongoose.Schema({}, { strict: false }), `sensors_${resolution}`),
+  ])
+);
+
 app.get('/Status', async (req, res) => {
   const data = await StatusModel.find();
   res.json(data);
@@ -40,9 +49,32 @@ app.get('/Latestsensorvalue', async (req, res) => {
   }
 });
 
+// Optional query parameters:
+//   resolution: raw (default), 1m, 1h or 1d
+//   start, end: Timestamp range, e.g. 2025-01-01T10:00 or 2025-01-01 10:00:00
+//   limit: only the latest N readings (still returned oldest first)
 app.get('/Sensorvalue', async (req, res) => {
-  const data = await SensorModel.find();
-  res.json(data);
+  try {
+    const { resolution = 'raw', start, end, limit } = req.query;
+    const Model = resolution === 'raw' ? SensorModel : RollupModels[resolution];
+    if (!Model) {
+      return res.status(400).json({ error: `Unknown resolution ${resolution}` });
+    }
+    const filter = {};
+    if (start || end) {
+      filter.Timestamp = {};
+      if (start) filter.Timestamp.$gte = String(start).replace('T', ' ');
+      if (end) filter.Timestamp.$lte = String(end).replace('T', ' ');
+    }
+    if (limit) {
+      const data = await Model.find(filter).sort({ Timestamp: -1 }).limit(parseInt(limit, 10));
+      return res.json(data.reverse());
+    }
+    const data = await Model.find(filter).sort({ Timestamp: 1 });
+    res.json(data);
+  } catch (error) {
+    res.status(500).json({ error: 'Failed to fetch data' });
+  }
 });
 
 app.get('/Notification', async (req, res) => {
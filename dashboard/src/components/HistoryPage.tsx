@@ -25,12 +25,26 @@ const HistoryPage: React.FC = () => {
   // If needed, you can use the selectedArea value to filter sensor data on the backend.
   // For now, it is simply stored as state and displayed in the header.
 
+  // Pick the coarsest rollup that still gives a detailed chart for the range:
+  // raw readings up to 2 hours, minutes up to 3 days, hours up to 90 days, then days.
+  const resolutionFor = (start: string, end: string): string => {
+    if (!start || !end) return 'raw';
+    const hours = (new Date(end).getTime() - new Date(start).getTime()) / 3600000;
+    if (hours <= 2) return 'raw';
+    if (hours <= 72) return '1m';
+    if (hours <= 90 * 24) return '1h';
+    return '1d';
+  };
+
   // Fetch history data for charting using fetch
   const fetchHistory = async () => {
     setLoading(true);
     try {
       // Optionally, you can pass selectedArea as a query parameter if your backend supports it.
-      const response = await fetch(`http://192.168.1.159:30001/Sensorvalue?start=${startDate}&end=${endDate}`);
+      const resolution = resolutionFor(startDate, endDate);
+      const response = await fetch(
+        `http://192.168.1.159:30001/Sensorvalue?start=${startDate}&end=${endDate}&resolution=${resolution}`
+      );
       const data: HistoryData[] = await response.json();
       if (Array.isArray(data) && data.length > 0 && startDate && endDate) {
         const start = new Date(startDate);
@@ -60,7 +74,7 @@ const HistoryPage: React.FC = () => {
   const handleAnalyzeTrend = async () => {
     try {
       // Fetch last 200 readings from Sensorvalue API
-      const response = await fetch('http://192.168.1.159:30001/Sensorvalue');
+      const response = await fetch('http://192.168.1.159:30001/Sensorvalue?limit=200');
       const allData: HistoryData[] = await response.json();
       
       if (allData.length < 200) {
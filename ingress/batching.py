@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collect single events into batches and run one forward pass per batch.
+
+    Events are queued by submit(). A background thread drains the queue into
+    a batch whenever max_batch_size events are waiting or max_wait seconds
+    have passed since the first event of the batch, whichever comes first.
+    predict_fn receives the list of queued items and must return one result
+    per item, in the same order. Callbacks passed to submit() run on the
+    batcher thread in submission order. If given, on_batch(queue_waits) is
+    called after every batch with each event's time spent queued, e.g. to
+    feed metrics.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait=0.05, report_every=100, latency_window=1000,
+                 on_batch=None):
+        self.predict_fn = predict_fn
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.report_every = report_every
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        # Running statistics for batch sizes and per-event latency
+        self.batch_count = 0
+        self.event_count = 0
+        self.max_batch_seen = 0
+        self._latencies = deque(maxlen=latency_window)
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item, callback=None):
+        """
+        Queue one item for batched processing and return a Future for its result.
+        callback(future) is called on the batcher thread once the result is set.
+        """
+        future = Future()
+        self._queue.put((item, future, callback, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        """
+        Block for the first event, then keep collecting until the batch is full
+        or the wait deadline has passed.
+        """
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if not batch:
+                continue
+
+            items = [entry[0] for entry in batch]
+            started = time.perf_counter()
+            try:
+                results = self.predict_fn(items)
+            except Exception as e:
+                for _, future, callback, _ in batch:
+                    future.set_exception(e)
+                    if callback is not None:
+                        callback(future)
+                continue
+
+            done = time.perf_counter()
+            latencies = [done - enqueued for _, _, _, enqueued in batch]
+            with self._lock:
+                self.batch_count += 1
+                self.event_count += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                self._latencies.extend(latencies)
+            if self.on_batch is not None:
+                self.on_batch([started - enqueued for _, _, _, enqueued in batch])
+
+            for (_, future, callback, _), result in zip(batch, results):
+                future.set_result(result)
+                if callback is not None:
+                    callback(future)
+
+            if self.report_every and self.batch_count % self.report_every == 0:
+                print(self.report())
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """
+        Return a snapshot of batch size and per-event latency statistics.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            return {
+                "batches": self.batch_count,
+                "events": self.event_count,
+                "mean_batch_size": self.event_count / self.batch_count if self.batch_count else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "queue_depth": self._queue.qsize(),
+                "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+            }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"Batches: {s['batches']}, events: {s['events']}, "
+            f"mean batch size: {s['mean_batch_size']:.1f}, max batch size: {s['max_batch_size']}, "
+            f"queue depth: {s['queue_depth']}, "
+            f"latency p50: {s['latency_p50_ms']:.1f} ms, p99: {s['latency_p99_ms']:.1f} ms"
+        )
+
+    def close(self):
+        """
+        Stop accepting work once the queue has drained and wait for the worker thread.
+        """
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,85 @@
+"""
+Export the Dense layers of a Keras .h5 classifier into a compact .npz
+that numpy_model.NumpyModel can run without TensorFlow.
+
+Needs h5py, and TensorFlow for --check (ingress/requirements-export.txt).
+
+Usage:
+    python export_model.py [water_system_model.h5] [water_system_model.npz]
+    python export_model.py --check   # compare against Keras (needs tensorflow)
+"""
+import json
+import sys
+
+import h5py
+import numpy as np
+
+from numpy_model import ACTIVATIONS, NumpyModel
+
+
+def export_model(h5_path="water_system_model.h5", npz_path="water_system_model.npz"):
+    """
+    Read the model config and weights straight from the .h5 file and save
+    one kernel/bias pair and activation name per Dense layer.
+    """
+    arrays = {}
+    activations = []
+    with h5py.File(h5_path, "r") as f:
+        config = f.attrs["model_config"]
+        if isinstance(config, bytes):
+            config = config.decode("utf-8")
+        layers = json.loads(config)["config"]["layers"]
+        weights = f["model_weights"]
+
+        for layer in layers:
+            class_name = layer["class_name"]
+            if class_name in ("InputLayer", "Dropout"):
+                continue
+            if class_name != "Dense":
+                raise ValueError(f"Unsupported layer type for NumPy export: {class_name}")
+
+            name = layer["config"]["name"]
+            activation = layer["config"]["activation"]
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation for NumPy export: {activation}")
+
+            group = weights[name]
+            weight_names = [n.decode("utf-8") if isinstance(n, bytes) else n for n in group.attrs["weight_names"]]
+            kernel = next(group[n] for n in weight_names if n.endswith("kernel"))
+            bias = next(group[n] for n in weight_names if n.endswith("bias"))
+
+            i = len(activations)
+            arrays[f"kernel_{i}"] = np.asarray(kernel, dtype=np.float32)
+            arrays[f"bias_{i}"] = np.asarray(bias, dtype=np.float32)
+            activations.append(activation)
+
+    np.savez_compressed(npz_path, activations=np.array(activations), **arrays)
+    print(f"Exported {len(activations)} Dense layers from {h5_path} to {npz_path}")
+
+
+def check_parity(h5_path="water_system_model.h5", npz_path="water_system_model.npz", n=10000):
+    """
+    Compare labels and probabilities of the NumPy engine against Keras on random
+    standardized inputs. Requires tensorflow.
+    """
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(h5_path)
+    numpy_model = NumpyModel(npz_path)
+
+    rng = np.random.default_rng(0)
+    batch = rng.normal(0, 3, size=(n, 4)).astype(np.float32)
+    expected = keras_model.predict(batch, verbose=0)
+    actual = numpy_model.predict(batch)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    label_match = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    print(f"Max probability difference: {max_diff:.2e}")
+    print(f"Label agreement: {label_match * 100:.2f}%")
+    return max_diff <= 1e-5 and label_match == 1.0
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        sys.exit(0 if check_parity() else 1)
+    export_model(*sys.argv[1:3])
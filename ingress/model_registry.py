@@ -0,0 +1,218 @@
+"""
+Versioned registry of the ingress classifier, on local disk or in MongoDB
+GridFS, and a watcher that hot-swaps the serving model.
+
+A version holds the model in one or both formats, keyed by file extension:
+".npz" for the NumPy engine (see export_model.py) and ".h5" for Keras.
+ModelWatcher polls the registry; a new version is fetched, loaded and warmed
+up with synthetic batches on the watcher thread while the current model keeps
+serving, then handed to on_swap, which replaces the model reference. Batches
+pick up the reference once, so the swap lands between batches and no event
+is dropped or waits for a load.
+
+Publish a model with:
+    python model_registry.py --dir <registry dir> water_system_model.npz [water_system_model.h5]
+    python model_registry.py --mongo <mongo_uri> water_system_model.npz [water_system_model.h5]
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+ENGINE_EXTENSIONS = {"numpy": ".npz", "keras": ".h5"}
+
+
+def _new_version():
+    # The time orders the versions; the random suffix keeps two versions
+    # published in the same second apart, as in the analyze ModelStore
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class DiskRegistry:
+    """
+    Versions live in their own directories under root; the LATEST file names
+    the newest complete version and is replaced atomically, like the analyze
+    ModelStore. Point several replicas at a shared volume.
+    """
+
+    def __init__(self, root="model_registry"):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _latest_path(self):
+        return os.path.join(self.root, "LATEST")
+
+    def latest_version(self):
+        try:
+            with open(self._latest_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, paths, version=None):
+        """
+        Copy model files in as a new version and make it the latest one.
+        """
+        version = version or _new_version()
+        final_dir = os.path.join(self.root, version)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        extensions = []
+        for path in paths:
+            extension = os.path.splitext(path)[1]
+            shutil.copyfile(path, os.path.join(tmp_dir, "model" + extension))
+            extensions.append(extension)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"version": version, "formats": extensions, "published_at": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.rename(tmp_dir, final_dir)
+
+        tmp_latest = self._latest_path() + ".tmp"
+        with open(tmp_latest, "w") as f:
+            f.write(version)
+        os.replace(tmp_latest, self._latest_path())
+        return version
+
+    def fetch(self, version, extension):
+        """
+        Local path of the model file of a version in the given format.
+        """
+        path = os.path.join(self.root, version, "model" + extension)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model version {version} has no {extension} file")
+        return path
+
+
+class GridFSRegistry:
+    """
+    Versions stored as GridFS files named "classifier<extension>" with the
+    version in their metadata; the newest upload is the latest version.
+    Fetched files are cached under cache_dir.
+    """
+
+    def __init__(self, db, bucket="classifier_models", cache_dir="model_cache"):
+        import gridfs
+
+        self.files = db[f"{bucket}.files"]
+        self.fs = gridfs.GridFSBucket(db, bucket_name=bucket)
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def latest_version(self):
+        doc = self.files.find_one({}, {"metadata": 1}, sort=[("uploadDate", -1)])
+        return doc["metadata"]["version"] if doc else None
+
+    def publish(self, paths, version=None):
+        version = version or _new_version()
+        for path in paths:
+            extension = os.path.splitext(path)[1]
+            with open(path, "rb") as f:
+                self.fs.upload_from_stream("classifier" + extension, f, metadata={"version": version})
+        return version
+
+    def fetch(self, version, extension):
+        path = os.path.join(self.cache_dir, f"{version}{extension}")
+        if os.path.exists(path):
+            return path
+        doc = self.files.find_one({"filename": "classifier" + extension, "metadata.version": version})
+        if doc is None:
+            raise FileNotFoundError(f"Model version {version} has no {extension} file")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            self.fs.download_to_stream(doc["_id"], f)
+        os.replace(tmp_path, path)
+        return path
+
+
+def load_model(path, engine):
+    if engine == "keras":
+        from tensorflow.keras.models import load_model as load_keras_model
+        return load_keras_model(path)
+    from numpy_model import NumpyModel
+    return NumpyModel(path)
+
+
+def warm_up(model, batch_sizes=(1, 64), rounds=3, n_features=4):
+    """
+    Run synthetic standardized batches through the model so graph tracing
+    and buffer allocation happen before it serves real events.
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(rounds):
+        for size in batch_sizes:
+            model.predict(rng.standard_normal((size, n_features)).astype(np.float32), verbose=0)
+
+
+class ModelWatcher:
+    """
+    Poll the registry every poll_seconds and swap in new versions.
+    """
+
+    def __init__(self, registry, engine, on_swap, poll_seconds=30.0, batch_sizes=(1, 64), version=None):
+        self.registry = registry
+        self.engine = engine
+        self.extension = ENGINE_EXTENSIONS[engine]
+        self.on_swap = on_swap
+        self.poll_seconds = poll_seconds
+        self.batch_sizes = batch_sizes
+        self.version = version
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+
+    def load(self, version):
+        """
+        Fetch, load and warm up a version; returns (model, load seconds).
+        """
+        started = time.perf_counter()
+        model = load_model(self.registry.fetch(version, self.extension), self.engine)
+        warm_up(model, self.batch_sizes)
+        return model, time.perf_counter() - started
+
+    def check(self):
+        version = self.registry.latest_version()
+        if version is None or version == self.version:
+            return False
+        model, seconds = self.load(version)
+        self.on_swap(model, version)
+        self.version = version
+        print(f"Swapped in model version {version} (loaded and warmed up in {seconds:.2f} s)")
+        return True
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep serving the current model
+                print("Model watcher error:", e)
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Publish a classifier version to the model registry.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--dir", help="disk registry directory")
+    target.add_argument("--mongo", help="MongoDB URI of a GridFS registry")
+    parser.add_argument("--db", default="GOCI")
+    parser.add_argument("--version", default=None)
+    parser.add_argument("paths", nargs="+", help=".npz and/or .h5 model files")
+    args = parser.parse_args()
+
+    if args.dir:
+        registry = DiskRegistry(args.dir)
+    else:
+        from pymongo import MongoClient
+        registry = GridFSRegistry(MongoClient(args.mongo)[args.db])
+    print(f"Published model version {registry.publish(args.paths, args.version)}")
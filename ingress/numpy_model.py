@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+def softmax(x):
+    x = x - np.max(x, axis=-1, keepdims=True)
+    e = np.exp(x)
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": relu,
+    "softmax": softmax,
+    "sigmoid": sigmoid,
+    "tanh": np.tanh,
+}
+
+
+class NumpyModel:
+    """
+    Forward pass of the exported dense classifier using only NumPy.
+
+    Loads the .npz written by export_model.py and mirrors the part of the
+    Keras API the ingress scripts use: predict(batch) returns the softmax
+    output for an (N, 4) batch, so get_anomaly_label(s) work unchanged.
+    Dropout layers are not exported since they are a no-op at inference.
+    """
+
+    def __init__(self, path="water_system_model.npz"):
+        with np.load(path) as data:
+            activations = [str(a) for a in data["activations"]]
+            self.layers = [
+                (data[f"kernel_{i}"].astype(np.float32),
+                 data[f"bias_{i}"].astype(np.float32),
+                 ACTIVATIONS[name])
+                for i, name in enumerate(activations)
+            ]
+
+    def predict(self, batch, verbose=0):
+        x = np.asarray(batch, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        for kernel, bias, activation in self.layers:
+            x = activation(x @ kernel + bias)
+        return x
@@ -0,0 +1,43 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+def partition(key, partitions):
+    """
+    Stable lane index for a sensor or site key (same result in every process,
+    unlike the built-in hash()).
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % partitions
+
+
+class PartitionedExecutor:
+    """
+    Fixed set of lanes, each with a single worker thread.
+
+    Work for one key always lands on the same lane and runs in submission
+    order, so per-sensor state needs no locking; different keys spread across
+    lanes and run in parallel. Add lanes for throughput, or replicas (each
+    owning part of the keyspace) to scale across processes.
+    """
+
+    def __init__(self, lanes=4, name="lane"):
+        self.lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-{i}")
+            for i in range(lanes)
+        ]
+
+    def lane_for(self, key):
+        return partition(key, len(self.lanes))
+
+    def submit(self, key, fn, *args, **kwargs):
+        return self.lanes[self.lane_for(key)].submit(fn, *args, **kwargs)
+
+    def backlog(self):
+        """
+        Number of queued tasks across all lanes.
+        """
+        return sum(lane._work_queue.qsize() for lane in self.lanes)
+
+    def shutdown(self, wait=True):
+        for lane in self.lanes:
+            lane.shutdown(wait=wait)
@@ -0,0 +1,59 @@
+"""
+Parity of the exported NumPy classifier with the Keras .h5 it comes from.
+
+Both engines classify the same batch of standardized inputs; the
+probabilities must agree to 1e-5 and every label (argmax) must match, for a
+fresh export and for the bundled water_system_model.npz. Skipped when
+TensorFlow is not installed (it is in requirements-export.txt).
+
+Usage:
+    pip install -r ingress/requirements-export.txt
+    python -m pytest ingress/test_export_model.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from export_model import check_parity, export_model  # noqa: E402
+from numpy_model import NumpyModel  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+H5_PATH = os.path.join(HERE, "water_system_model.h5")
+NPZ_PATH = os.path.join(HERE, "water_system_model.npz")
+MAX_ABS_DIFF = 1e-5
+
+
+@pytest.fixture(scope="module")
+def keras_model():
+    return tf.keras.models.load_model(H5_PATH)
+
+
+@pytest.fixture(scope="module")
+def batch():
+    rng = np.random.default_rng(0)
+    return rng.normal(0, 3, size=(10000, 4)).astype(np.float32)
+
+
+def assert_parity(keras_model, npz_path, batch):
+    expected = keras_model.predict(batch, verbose=0)
+    actual = NumpyModel(npz_path).predict(batch)
+    assert actual.shape == expected.shape
+    assert float(np.max(np.abs(expected - actual))) <= MAX_ABS_DIFF
+    np.testing.assert_array_equal(np.argmax(actual, axis=1), np.argmax(expected, axis=1))
+
+
+def test_exported_model_matches_keras(keras_model, batch, tmp_path):
+    npz_path = str(tmp_path / "water_system_model.npz")
+    export_model(H5_PATH, npz_path)
+    assert_parity(keras_model, npz_path, batch)
+
+
+def test_bundled_model_matches_keras(keras_model, batch):
+    assert_parity(keras_model, NPZ_PATH, batch)
+
+
+def test_check_parity():
+    assert check_parity(H5_PATH, NPZ_PATH)
@@ -0,0 +1,166 @@
+"""
+Benchmark maintenance forecasting across many pipe segments.
+
+Generates synthetic readings for --segments segments since a common last
+maintenance, interleaved in Timestamp order as they come from MongoDB, and
+times three ways of forecasting every segment's maintenance date from them:
+one sklearn LinearRegression pair per segment (as predict.py originally
+fitted its single series; skipped when scikit-learn is not installed), one
+MaintenanceEstimator per segment, and SegmentTrends for all segments at once.
+The per-segment ways include grouping the readings by segment. Also reports
+the peak memory of each, the time to recompute every forecast once the sums
+are in (what a new request or threshold costs), and checks that the batched
+dates match the per-segment ones.
+
+Usage:
+    python benchmark_segments.py [--segments 10000] [--readings 100] [--batch 100000]
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from sensor_store import TIMESTAMP_FORMAT
+from trend_model import (
+    MAX_HOURS, MaintenanceEstimator, SegmentTrends, wq_threshold, temp_upper_threshold, temp_lower_threshold,
+)
+
+
+def synthetic_readings(segments, readings, last_maintenance, seed=0):
+    """
+    (sites, times, water quality, temperature) for readings per segment over
+    30 days, in Timestamp order, each segment with its own drift.
+    """
+    rng = np.random.default_rng(seed)
+    n = segments * readings
+    sites = np.array([f"pipe-{i:05d}" for i in range(segments)], dtype=object)[rng.integers(0, segments, n)]
+    offsets = np.sort(rng.integers(0, 30 * 86400, n))
+    times = np.datetime64(last_maintenance, 's') + offsets.astype('timedelta64[s]')
+    hours = offsets / 3600
+    index = np.array([int(site[5:]) for site in sites])
+    wq_drift = rng.normal(-0.005, 0.005, segments)[index]
+    temp_drift = rng.normal(0.0, 0.003, segments)[index]
+    water_quality = 98 + wq_drift * hours + rng.normal(0, 0.5, n)
+    temperature = 20 + temp_drift * hours + rng.normal(0, 0.5, n)
+    return sites, times, water_quality, temperature
+
+
+def group_by_site(sites, *columns):
+    order = np.argsort(sites, kind='stable')
+    unique, starts = np.unique(sites[order], return_index=True)
+    bounds = np.r_[starts, len(order)]
+    return {
+        site: tuple(column[order[bounds[i]:bounds[i + 1]]] for column in columns)
+        for i, site in enumerate(unique)
+    }
+
+
+def per_segment_sklearn(sites, times, water_quality, temperature, last_maintenance):
+    from sklearn.linear_model import LinearRegression
+
+    results = {}
+    start = np.datetime64(last_maintenance, 's')
+    for site, (times, water_quality, temperature) in group_by_site(sites, times, water_quality, temperature).items():
+        x = ((times - start).astype(np.float64) / 3600).reshape(-1, 1)
+        wq_model = LinearRegression().fit(x, water_quality)
+        temp_model = LinearRegression().fit(x, temperature)
+        pred_times = []
+        if wq_model.coef_[0] != 0:
+            pred_times.append((wq_threshold - wq_model.intercept_) / wq_model.coef_[0])
+        if temp_model.coef_[0] != 0:
+            pred_times.append((temp_upper_threshold - temp_model.intercept_) / temp_model.coef_[0])
+            pred_times.append((temp_lower_threshold - temp_model.intercept_) / temp_model.coef_[0])
+        pred_times = [t for t in pred_times if np.isfinite(t) and t > 0]
+        results[site] = last_maintenance + timedelta(hours=min(pred_times)) if pred_times else None
+    return results
+
+
+def per_segment_estimators(sites, times, water_quality, temperature, last_maintenance):
+    estimators = {}
+    for site, (times, water_quality, temperature) in group_by_site(sites, times, water_quality, temperature).items():
+        estimators[site] = MaintenanceEstimator(last_maintenance)
+        estimators[site].add_readings(times, water_quality, temperature)
+    return estimators
+
+
+def batched(sites, times, water_quality, temperature, last_maintenance, batch):
+    trends = SegmentTrends(last_maintenance)
+    for start in range(0, len(times), batch):
+        end = start + batch
+        trends.add_readings(sites[start:end], times[start:end], water_quality[start:end], temperature[start:end])
+    return trends
+
+
+def forecast_estimators(estimators):
+    return {site: estimator.predicted_maintenance()[0] for site, estimator in estimators.items()}
+
+
+def forecast_trends(trends):
+    return trends.predicted_maintenance()
+
+
+def rank_trends(trends):
+    return trends.ranked()
+
+
+def measure(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--segments', type=int, default=10000)
+    parser.add_argument('--readings', type=int, default=100, help='readings per segment')
+    parser.add_argument('--batch', type=int, default=100000, help='readings per SegmentTrends update')
+    args = parser.parse_args()
+
+    last_maintenance = datetime(2024, 1, 1)
+    sites, times, water_quality, temperature = synthetic_readings(args.segments, args.readings, last_maintenance)
+    readings = (sites, times, water_quality, temperature, last_maintenance)
+    print(f"Segments: {args.segments}, readings: {len(times)}")
+
+    print("Fit and forecast from readings:")
+    try:
+        import sklearn  # noqa: F401
+        _, seconds, peak = measure(per_segment_sklearn, *readings)
+        print(f"  {'LinearRegression per segment':34s} {seconds * 1000:9.1f} ms  peak {peak / 2 ** 20:7.1f} MiB")
+    except ImportError:
+        print("  scikit-learn is not installed; skipping the LinearRegression baseline")
+    estimators, seconds, peak = measure(per_segment_estimators, *readings)
+    expected, forecast_seconds, _ = measure(forecast_estimators, estimators)
+    print(f"  {'MaintenanceEstimator per segment':34s} {(seconds + forecast_seconds) * 1000:9.1f} ms  peak {peak / 2 ** 20:7.1f} MiB")
+    trends, seconds, peak = measure(batched, *readings, args.batch)
+    _, trends_seconds, _ = measure(forecast_trends, trends)
+    print(f"  {'SegmentTrends, all segments':34s} {(seconds + trends_seconds) * 1000:9.1f} ms  peak {peak / 2 ** 20:7.1f} MiB")
+
+    print("Forecast only, from the running sums:")
+    print(f"  {'MaintenanceEstimator per segment':34s} {forecast_seconds * 1000:9.1f} ms")
+    print(f"  {'SegmentTrends, all segments':34s} {trends_seconds * 1000:9.1f} ms")
+    ranked, ranked_seconds, _ = measure(rank_trends, trends)
+    print(f"Ranked list of all segments (the /segments body): {ranked_seconds * 1000:.1f} ms")
+
+    # The ranked dates must match the per-segment estimator up to the forecast
+    # horizon, to the second or 1e-9 of the time since maintenance: the sums
+    # are added in a different order
+    horizon = last_maintenance + timedelta(hours=MAX_HOURS)
+    expected = {site: date for site, date in expected.items() if date is not None and date < horizon}
+    got = {row['segment']: datetime.strptime(row['predicted_maintenance'], TIMESTAMP_FORMAT) for row in ranked}
+    mismatches = len(set(got) ^ set(expected)) + sum(
+        abs(got[site] - date) > max(timedelta(seconds=1), (date - last_maintenance) * 1e-9)
+        for site, date in expected.items() if site in got)
+    print(f"Segments with a predicted maintenance: {len(ranked)}, mismatches: {mismatches}")
+    if ranked:
+        print(f"Soonest: {ranked[0]['segment']} at {ranked[0]['predicted_maintenance']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Streaming per-feature statistics of the sensor readings, published as
+versioned snapshots in MongoDB.
+
+FeatureStatsUpdater folds new readings from GOCI.sensors into running
+count/mean/M2 (Welford, merged batch-wise with Chan's formula) and min/max,
+following the readings' Inserted_at (the time they were written to MongoDB)
+with an IngestPosition kept in feature_stats_state (see sensor_store.py), so
+readings that arrive late are still counted, and only once. It periodically
+writes a snapshot to the feature_stats collection ('watermark' is the newest
+reading Timestamp seen):
+
+    {'_id': <version>, 'created_at', 'watermark', 'count', 'features',
+     'mean': [...], 'std': [...], 'min': [...], 'max': [...]}
+
+Consumers pick a snapshot with SnapshotWatcher and swap their scaler when it
+changes. Which snapshot is in use is explicit: "latest" follows every new
+snapshot, "active" only the one promoted with
+`python feature_stats.py --promote <version|latest> <mongo_uri>`, since a
+trained model expects the scaling it was trained with.
+
+Run `python feature_stats.py --backfill <mongo_uri>` to recompute the
+statistics over every stored reading and write a fresh snapshot.
+"""
+import sys
+import threading
+from datetime import timedelta
+
+import numpy as np
+from pymongo import DESCENDING
+
+from preprocessing import FEATURES, MinMaxScaler, Standardizer
+from sensor_store import INGEST_OVERLAP_SECONDS, IngestPosition, format_timestamp, iter_reading_batches, utc_now
+
+UPDATER_ID = 'updater'
+ACTIVE_ID = 'active'
+
+
+class RunningStats:
+    """
+    Count, mean, sum of squared deviations (M2), min and max per feature.
+    """
+
+    def __init__(self, n_features=len(FEATURES)):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+        self.min = np.full(n_features, np.inf)
+        self.max = np.full(n_features, -np.inf)
+
+    def update(self, values):
+        """
+        Fold an (N, F) batch in: the batch moments are computed with NumPy and
+        merged with the running ones (Chan et al.), which is exact and stable.
+        """
+        values = values[~np.isnan(values).any(axis=1)]
+        n = len(values)
+        if n == 0:
+            return
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+
+    @property
+    def std(self):
+        """
+        Population standard deviation, as used for standardization.
+        """
+        return np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.mean)
+
+    def to_document(self):
+        return {
+            'count': self.count,
+            'mean': self.mean.tolist(),
+            'm2': self.m2.tolist(),
+            'min': self.min.tolist(),
+            'max': self.max.tolist(),
+        }
+
+    @classmethod
+    def from_document(cls, doc):
+        stats = cls(len(doc['mean']))
+        stats.count = doc['count']
+        stats.mean = np.array(doc['mean'])
+        stats.m2 = np.array(doc['m2'])
+        stats.min = np.array(doc['min'])
+        stats.max = np.array(doc['max'])
+        return stats
+
+
+def _column(snapshot, key, features):
+    index = {name: i for i, name in enumerate(snapshot['features'])}
+    return [snapshot[key][index[name]] for name in features]
+
+
+def standardizer_from_snapshot(snapshot, features=FEATURES):
+    stds = np.array(_column(snapshot, 'std', features))
+    # A constant feature is only centered
+    stds[stds == 0] = 1.0
+    return Standardizer(_column(snapshot, 'mean', features), stds)
+
+
+def scaler_from_snapshot(snapshot, features=FEATURES, feature_range=(0, 1)):
+    return MinMaxScaler(feature_range).fit_range(_column(snapshot, 'min', features), _column(snapshot, 'max', features))
+
+
+def latest_snapshot(db):
+    return db.feature_stats.find_one({}, sort=[('_id', DESCENDING)])
+
+
+def active_snapshot(db):
+    pointer = db.feature_stats_state.find_one({'_id': ACTIVE_ID})
+    return db.feature_stats.find_one({'_id': pointer['version']}) if pointer else None
+
+
+def promote(db, version):
+    """
+    Make a snapshot version (or the latest one) the active snapshot.
+    """
+    snapshot = latest_snapshot(db) if version == 'latest' else db.feature_stats.find_one({'_id': int(version)})
+    if snapshot is None:
+        raise ValueError(f"No feature statistics snapshot {version}")
+    db.feature_stats_state.update_one({'_id': ACTIVE_ID}, {'$set': {'version': snapshot['_id']}}, upsert=True)
+    return snapshot['_id']
+
+
+class FeatureStatsUpdater:
+    """
+    Keep the running statistics current and write snapshots.
+
+    update() consumes readings inserted up to lag_seconds before now
+    (re-reading overlap_seconds before the previous cutoff) and writes a
+    snapshot when snapshot_seconds have passed since the last one and new
+    readings were seen; call it periodically. Only the newest `keep`
+    snapshots (and the active one) are kept.
+    """
+
+    def __init__(self, db, lag_seconds=5.0, snapshot_seconds=3600.0, keep=48, batch_size=10000,
+                 overlap_seconds=INGEST_OVERLAP_SECONDS):
+        self.db = db
+        self.lag_seconds = lag_seconds
+        self.overlap_seconds = overlap_seconds
+        self.snapshot_seconds = snapshot_seconds
+        self.keep = keep
+        self.batch_size = batch_size
+        self.state = db.feature_stats_state
+        self.snapshots = db.feature_stats
+
+    def _load(self):
+        doc = self.state.find_one({'_id': UPDATER_ID})
+        if doc is None or doc.get('position') is None:
+            # Nothing consumed yet, or state kept before IngestPosition: start over
+            position = IngestPosition(overlap=self.overlap_seconds)
+            return RunningStats(), None, position, doc.get('snapshot_at') if doc else None
+        position = IngestPosition.from_document(doc['position'], self.overlap_seconds)
+        return RunningStats.from_document(doc['stats']), doc.get('watermark'), position, doc.get('snapshot_at')
+
+    def _save(self, stats, watermark, position, snapshot_at):
+        self.state.replace_one(
+            {'_id': UPDATER_ID},
+            {'_id': UPDATER_ID, 'stats': stats.to_document(), 'watermark': watermark,
+             'position': position.to_document(), 'snapshot_at': snapshot_at},
+            upsert=True,
+        )
+
+    def _consume(self, stats, watermark, position, cutoff):
+        """
+        Fold in the readings inserted up to cutoff that the position has not
+        consumed yet (on the first run all of them, including those without
+        Inserted_at); returns (consumed, newest Timestamp seen).
+        """
+        consumed = 0
+        for times, values in iter_reading_batches(self.db.sensors, batch_size=self.batch_size,
+                                                  inserted_after=position.inserted_after, inserted_until=cutoff,
+                                                  position=position):
+            stats.update(values)
+            consumed += len(times)
+            newest = format_timestamp(times.max())
+            watermark = newest if watermark is None else max(watermark, newest)
+        position.advance(cutoff)
+        return consumed, watermark
+
+    def update(self, now=None):
+        """
+        Consume new readings; returns (readings consumed, snapshot version or None).
+        now is naive UTC, as Inserted_at.
+        """
+        now = utc_now() if now is None else now
+        stats, watermark, position, snapshot_at = self._load()
+        cutoff = now - timedelta(seconds=self.lag_seconds)
+        consumed, watermark = self._consume(stats, watermark, position, cutoff)
+
+        version = None
+        latest = latest_snapshot(self.db)
+        due = snapshot_at is None or (now - snapshot_at).total_seconds() >= self.snapshot_seconds
+        changed = latest is None or latest['count'] != stats.count
+        if stats.count and due and changed:
+            version = self.snapshot(stats, watermark, now)
+            snapshot_at = now
+        self._save(stats, watermark, position, snapshot_at)
+        return consumed, version
+
+    def snapshot(self, stats, watermark, now=None):
+        latest = latest_snapshot(self.db)
+        version = latest['_id'] + 1 if latest else 1
+        self.snapshots.insert_one({
+            '_id': version,
+            'created_at': now or utc_now(),
+            'watermark': watermark,
+            'count': stats.count,
+            'features': FEATURES,
+            'mean': stats.mean.tolist(),
+            'std': stats.std.tolist(),
+            'min': stats.min.tolist(),
+            'max': stats.max.tolist(),
+        })
+        self._prune(version)
+        return version
+
+    def _prune(self, version):
+        pointer = self.state.find_one({'_id': ACTIVE_ID})
+        protected = [pointer['version']] if pointer else []
+        self.snapshots.delete_many({'_id': {'$lte': version - self.keep, '$nin': protected}})
+
+    def reset(self):
+        """
+        Forget the running statistics so the next update() recomputes them from all readings.
+        """
+        self.state.delete_one({'_id': UPDATER_ID})
+
+
+class SnapshotWatcher:
+    """
+    Poll for the snapshot selected by mode ("active" or "latest") and call
+    on_change(snapshot) from a daemon thread whenever its version changes.
+    """
+
+    def __init__(self, db, on_change, mode='active', poll_seconds=30.0):
+        if mode not in ('active', 'latest'):
+            raise ValueError(f"Unknown feature statistics mode {mode!r}, expected 'active' or 'latest'")
+        self.db = db
+        self.on_change = on_change
+        self.fetch = active_snapshot if mode == 'active' else latest_snapshot
+        self.poll_seconds = poll_seconds
+        self.version = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="feature-stats-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def check(self):
+        snapshot = self.fetch(self.db)
+        if snapshot is not None and snapshot['_id'] != self.version:
+            self.on_change(snapshot)
+            self.version = snapshot['_id']
+            return True
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print("Feature statistics watcher error:", e)
+            self._stop.wait(self.poll_seconds)
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--backfill':
+        uri = sys.argv[2]
+    elif len(sys.argv) == 4 and sys.argv[1] == '--promote':
+        uri = sys.argv[3]
+    else:
+        sys.exit("Usage: python feature_stats.py --backfill <mongo_uri>\n"
+                 "       python feature_stats.py --promote <version|latest> <mongo_uri>")
+
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+
+    db = MongoClient(uri, server_api=ServerApi('1')).GOCI
+    if sys.argv[1] == '--promote':
+        print(f"Active feature statistics: version {promote(db, sys.argv[2])}")
+    else:
+        updater = FeatureStatsUpdater(db)
+        updater.reset()
+        consumed, version = updater.update()
+        print(f"Consumed {consumed} readings; wrote snapshot version {version}")
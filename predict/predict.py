@@ -1,126 +1,410 @@
-import pandas as pd
-import numpy as np
-from pymongo import MongoClient
+import os
+import threading
+import time
+import uuid
+from pymongo import ASCENDING, MongoClient
 from pymongo.server_api import ServerApi
-from sklearn.linear_model import LinearRegression
 from datetime import datetime, timedelta
 from flask_cors import CORS, cross_origin
-from flask import Flask, Response
+from flask import Flask, Response, jsonify, request
+from sensor_store import (
+    TIMESTAMP_FORMAT, IngestPosition, ensure_indexes, iter_reading_batches, iter_site_batches, first_timestamp, utc_now,
+)
+from trend_model import MaintenanceEstimator, SegmentTrends
+from metrics import instrument_flask, registry_from_env
+from rollups import RollupUpdater, rewritten_since, rollup_collection
+from feature_stats import FeatureStatsUpdater
 
 
+# Startup is measured from module import until the first estimator result is ready.
+startup_started = time.monotonic()
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Request and refresh latency histograms served at /metrics in the Prometheus text
+# format. METRICS_ENABLED=0 turns every metric into a no-op.
+metrics = registry_from_env()
+instrument_flask(app, metrics, "predict")
+stage_seconds = metrics.histogram("predict_stage_seconds", "Time spent in each estimator stage", labels=("stage",))
+refresh_seconds = stage_seconds.labels("refresh")
+save_seconds = stage_seconds.labels("mongo_write")
+segments_seconds = stage_seconds.labels("segments")
+readings_consumed_total = metrics.counter("predict_readings_consumed_total", "Readings folded into the estimator")
+metrics.gauge("predict_ready", "1 once the first estimator result is available", lambda: ready.is_set())
+metrics.gauge("predict_segments", "Pipe segments with maintenance trends", lambda: len(segments.sites) if segments else 0)
+
 # --------------------------
-# Connect to MongoDB and fetch sensor data
-mongo_uri = "#####################################################e"
+# Connect to MongoDB (MongoClient connects lazily, so this never blocks startup)
+mongo_uri = os.environ.get("MONGO_URI", "#####################################################e")
 client = MongoClient(mongo_uri, server_api=ServerApi('1'))
+db = client[os.environ.get("MONGO_DB", "GOCI")]
 
-# Fetch sensor data from "sensors" collection
-db_sensors = client.GOCI.sensors
-sensor_cursor = db_sensors.find({})
-sensor_data = list(sensor_cursor)
-df = pd.DataFrame(sensor_data)
-if '_id' in df.columns:
-    df = df.drop(columns=['_id'])
-# Convert Timestamp to datetime and sort
-df['Timestamp'] = pd.to_datetime(df['Timestamp'], format='%Y-%m-%d %H:%M:%S')
-df = df.sort_values('Timestamp')
+# Sensor data lives in the "sensors" collection
+db_sensors = db.sensors
+# Maintenance records and the persisted estimator state
+db_last = db.lastmaintenances
+db_state = db.predict_state
 
-print("Latest sensor data sample:")
-print(df.tail(1000))
+# PREDICT_RESOLUTION "raw" fits the trends on individual readings; "1m", "1h" or "1d"
+# fits them on the per-bucket means of the rollup collections (see rollups.py),
+# which cuts the catch-up after a restart or a new maintenance record accordingly.
+PREDICT_RESOLUTION = os.environ.get("PREDICT_RESOLUTION", "raw")
+db_source = rollup_collection(db, PREDICT_RESOLUTION)
+ESTIMATOR_ID = 'maintenance_estimator' if PREDICT_RESOLUTION == 'raw' else f'maintenance_estimator_{PREDICT_RESOLUTION}'
 
-# --------------------------
-# Fetch the last maintenance timestamp from "lastmaintenances" collection
-db_last = client.GOCI.lastmaintenances
-maintenance_cursor = db_last.find({}).sort("Timestamp", -1).limit(1)
-maintenance_data = list(maintenance_cursor)
-if maintenance_data:
-    last_maintenance = pd.to_datetime(maintenance_data[0]['Timestamp'], format='%Y-%m-%d %H:%M:%S')
-else:
-    # If no maintenance record exists, use the earliest sensor data timestamp
-    last_maintenance = df['Timestamp'].min()
+# The rollups are kept up to date by this service every ROLLUP_POLL_SECONDS;
+# ROLLUPS_ENABLED=0 leaves that to another replica. Only one replica may run
+# it (k8s/predict-updaters-deployment.yaml), as with the feature statistics.
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "1") == "1"
+ROLLUP_POLL_SECONDS = float(os.environ.get("ROLLUP_POLL_SECONDS", "30"))
 
-# --------------------------
-# Filter sensor data from the last maintenance date to now
-df_filtered = df[df['Timestamp'] >= last_maintenance].copy()
+# Streaming feature statistics (see feature_stats.py) are updated every
+# FEATURE_STATS_POLL_SECONDS and published as a new snapshot for ingress and
+# analyze every FEATURE_STATS_SNAPSHOT_SECONDS; FEATURE_STATS_ENABLED=0 leaves
+# that to another replica.
+FEATURE_STATS_ENABLED = os.environ.get("FEATURE_STATS_ENABLED", "1") == "1"
+FEATURE_STATS_POLL_SECONDS = float(os.environ.get("FEATURE_STATS_POLL_SECONDS", "30"))
+FEATURE_STATS_SNAPSHOT_SECONDS = float(os.environ.get("FEATURE_STATS_SNAPSHOT_SECONDS", "3600"))
+
+# The trends are also kept per pipe segment (Sensor_id) from the raw readings,
+# all segments at once (see SegmentTrends in trend_model.py), for the ranked
+# maintenance dates at /segments; SEGMENTS_ENABLED=0 turns that off.
+SEGMENTS_ENABLED = os.environ.get("SEGMENTS_ENABLED", "1") == "1"
+SEGMENTS_ID = 'segment_trends'
 
-# Compute elapsed hours since last maintenance
-df_filtered['Hours'] = (df_filtered['Timestamp'] - last_maintenance).dt.total_seconds() / 3600
+# New readings are consumed every PREDICT_POLL_SECONDS in insertion order
+# (Inserted_at, see sensor_store.py), up to INGEST_LAG_SECONDS before now.
+# Readings that reach MongoDB late, e.g. replayed from the simulator's write
+# buffer, are still consumed. Every pass re-reads INGEST_OVERLAP_SECONDS before
+# the previous cutoff and skips the readings already consumed, for inserts that
+# became visible after the cutoff passed them (slow writes, writer clock skew).
+PREDICT_POLL_SECONDS = float(os.environ.get("PREDICT_POLL_SECONDS", "5"))
+INGEST_LAG_SECONDS = float(os.environ.get("INGEST_LAG_SECONDS", "5"))
+INGEST_OVERLAP_SECONDS = float(os.environ.get("INGEST_OVERLAP_SECONDS", "60"))
 
 # --------------------------
-# We will use two features for prediction:
+# We use two features for prediction:
 #   - Water_quality: Lower values indicate potential corrosion
 #   - Temperature: Extreme values (too high or too low) may trigger maintenance
-# Define thresholds (adjust these based on real-life criteria)
-wq_threshold = 95           # e.g., if water quality drops below 95, it could be a sign of corrosion
-temp_upper_threshold = 22   # upper bound for normal water temperature
-temp_lower_threshold = 18   # lower bound for normal water temperature
+# Their linear trends since the last maintenance are kept as running sums
+# (see trend_model.py) instead of refitting on every reading.
+model_features = ['Water_quality', 'Temperature']
+estimator = None
+estimator_lock = threading.Lock()
+segments = None
+segments_lock = threading.Lock()
 
-# --------------------------
-# Fit linear regression for water quality trend
-X = df_filtered[['Hours']].values  # independent variable: hours since last maintenance
-y_wq = df_filtered['Water_quality'].values.reshape(-1, 1)
-lr_wq = LinearRegression()
-lr_wq.fit(X, y_wq)
-
-# Solve for the time when predicted water quality reaches the threshold
-if lr_wq.coef_[0][0] != 0:
-    x_wq = (wq_threshold - lr_wq.intercept_[0]) / lr_wq.coef_[0][0]
-else:
-    x_wq = np.inf
+# Set once the first refresh has completed; /readyz and / report "warming up" until then.
+ready = threading.Event()
+ready_after_seconds = None
 
-# --------------------------
-# Fit linear regression for temperature trend
-y_temp = df_filtered['Temperature'].values.reshape(-1, 1)
-lr_temp = LinearRegression()
-lr_temp.fit(X, y_temp)
-
-# Solve for the time when predicted temperature exceeds upper threshold and when it falls below lower threshold
-x_temp_upper = np.inf
-x_temp_lower = np.inf
-if lr_temp.coef_[0][0] != 0:
-    x_temp_upper = (temp_upper_threshold - lr_temp.intercept_[0]) / lr_temp.coef_[0][0]
-    x_temp_lower = (temp_lower_threshold - lr_temp.intercept_[0]) / lr_temp.coef_[0][0]
+def get_last_maintenance():
+    """
+    Fetch the last maintenance timestamp from "lastmaintenances" collection
+    (network-wide records; those with a Sensor_id only reset their segment).
+    """
+    maintenance_data = list(db_last.find({'Sensor_id': None}).sort("Timestamp", -1).limit(1))
+    if maintenance_data:
+        return datetime.strptime(maintenance_data[0]['Timestamp'], TIMESTAMP_FORMAT)
+    # If no maintenance record exists, use the earliest sensor data timestamp
+    first = first_timestamp(db_sensors)
+    return datetime.strptime(first, TIMESTAMP_FORMAT) if first else None
 
-# --------------------------
-# Decide on the predicted maintenance time:
-# We consider only positive time differences (future predictions).
-pred_times = []
-recommendations = []
-
-if x_wq > 0:
-    pred_times.append(x_wq)
-    recommendations.append("Inspection for corrosion due to significant water quality drop.")
-
-if x_temp_upper > 0:
-    pred_times.append(x_temp_upper)
-    recommendations.append("Maintenance for temperature regulation to prevent pipe break (temperature too high).")
-
-if x_temp_lower > 0:
-    pred_times.append(x_temp_lower)
-    recommendations.append("Maintenance for temperature regulation to prevent pipe break (temperature too low).")
-
-# Prepare the output message
-current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-output_lines = []
-output_lines.append(f"Last maintenance timestamp: {last_maintenance.strftime('%Y-%m-%d %H:%M:%S')}")
-if len(pred_times) == 0:
-    output_lines.append("No maintenance needed based on current trends.")
-else:
-    pred_hours = min(pred_times)
-    predicted_maintenance_date = last_maintenance + timedelta(hours=pred_hours)
-    output_lines.append(f"Predicted next maintenance date: {predicted_maintenance_date.strftime('%Y-%m-%d %H:%M:%S')}")
-    idx = pred_times.index(pred_hours)
-    final_recommendation = recommendations[idx]
-    output_lines.append(f"Maintenance Recommendation: {final_recommendation}")
-output_lines.append(f"Time (current local time): {current_time}")
-
-output = "\n".join(output_lines)
+def load_estimator():
+    doc = db_state.find_one({'_id': ESTIMATOR_ID})
+    return MaintenanceEstimator.from_document(doc) if doc else None
+
+def save_estimator(current):
+    db_state.replace_one({'_id': ESTIMATOR_ID}, current.to_document(), upsert=True)
+
+def refresh_estimator():
+    """
+    Fold readings inserted since the last refresh into the running sums,
+    starting over when a new maintenance record appears (or a rollup bucket
+    that was already consumed has been rewritten), and persist the result.
+    """
+    global estimator
+    last_maintenance = get_last_maintenance()
+    if last_maintenance is None:
+        return
+
+    with estimator_lock:
+        current = estimator
+    if current is None:
+        current = load_estimator()
+    if current is None or current.last_maintenance != last_maintenance or current.position is None:
+        # New maintenance record (or state saved before IngestPosition): reset the statistics
+        current = MaintenanceEstimator(last_maintenance)
+    else:
+        # Update a copy so requests never see half-applied sums
+        current = MaintenanceEstimator.from_document(current.to_document())
+    position = IngestPosition.from_document(current.position, INGEST_OVERLAP_SECONDS)
+
+    cutoff = utc_now() - timedelta(seconds=INGEST_LAG_SECONDS)
+    if position.inserted is not None and PREDICT_RESOLUTION != 'raw' and rewritten_since(db_source, position.inserted, cutoff):
+        # Late readings changed buckets whose old means are in the sums
+        current = MaintenanceEstimator(last_maintenance)
+        position = IngestPosition(overlap=INGEST_OVERLAP_SECONDS)
+    consumed = 0
+    for times, values in iter_reading_batches(db_source, start=last_maintenance, features=model_features,
+                                              inserted_after=position.inserted_after, inserted_until=cutoff,
+                                              position=position):
+        current.add_readings(times, values[:, 0], values[:, 1])
+        consumed += len(times)
+    position.advance(cutoff)
+    current.position = position.to_document()
+
+    with save_seconds.time():
+        save_estimator(current)
+    with estimator_lock:
+        estimator = current
+    readings_consumed_total.inc(consumed)
+    if consumed:
+        print(f"Consumed {consumed} new readings (watermark {current.watermark})")
+
+def run_refresher():
+    """
+    Background task: create indexes, catch up from the persisted state (or the
+    last maintenance), mark the service ready, then keep consuming new readings.
+    """
+    global ready_after_seconds
+    while True:
+        try:
+            if not ready.is_set():
+                ensure_indexes(db_sensors)
+                ensure_indexes(db_source)
+            with refresh_seconds.time():
+                refresh_estimator()
+            if not ready.is_set():
+                ready_after_seconds = time.monotonic() - startup_started
+                ready.set()
+                print(f"Predict service ready after {ready_after_seconds:.2f} s")
+        except Exception as e:
+            print("Estimator refresh error:", e)
+        time.sleep(PREDICT_POLL_SECONDS)
+
+def get_segment_maintenance():
+    """
+    Return ({Sensor_id: newest maintenance}, newest network-wide maintenance).
+    Records without a Sensor_id apply to every segment; without any, the
+    earliest sensor data timestamp stands in for the network-wide one.
+    """
+    by_site = {}
+    default = None
+    for doc in db_last.aggregate([{'$group': {'_id': '$Sensor_id', 'Timestamp': {'$max': '$Timestamp'}}}]):
+        when = datetime.strptime(doc['Timestamp'], TIMESTAMP_FORMAT)
+        if doc['_id'] is None:
+            default = when
+        else:
+            by_site[doc['_id']] = when
+    if default is None:
+        first = first_timestamp(db_sensors)
+        default = datetime.strptime(first, TIMESTAMP_FORMAT) if first else None
+    return by_site, default
+
+def load_segments():
+    """
+    The saved SegmentTrends, or None when there are none (or the chunks of the
+    saved generation were replaced while reading: they are rebuilt).
+    """
+    head = db_state.find_one({'_id': SEGMENTS_ID})
+    if head is None:
+        return None
+    if 'generation' not in head:
+        # Saved as a single document before chunking
+        return SegmentTrends.from_document(head)
+    chunks = list(db_state.find({'segments_generation': head['generation']}).sort('index', ASCENDING))
+    if len(chunks) != head['chunks']:
+        return None
+    return SegmentTrends.from_documents(head, chunks)
+
+def save_segments(current):
+    """
+    Store the state as a head document and chunk documents (see
+    SegmentTrends.to_documents). The chunks of a new generation are written
+    first, then the head is pointed at them and the generation it replaced is
+    dropped, so a reader never joins chunks of different saves.
+    """
+    head, chunks = current.to_documents()
+    generation = uuid.uuid4().hex
+    if chunks:
+        db_state.insert_many([
+            dict(chunk, _id=f'{SEGMENTS_ID}:{generation}:{i}', segments_generation=generation, index=i)
+            for i, chunk in enumerate(chunks)
+        ])
+    previous = db_state.find_one_and_replace(
+        {'_id': SEGMENTS_ID}, dict(head, _id=SEGMENTS_ID, generation=generation, chunks=len(chunks)), upsert=True)
+    if previous is not None and 'generation' in previous:
+        db_state.delete_many({'segments_generation': previous['generation']})
+
+def refresh_segments():
+    """
+    Fold new readings of all segments into the per-segment sums. Segments
+    with a new maintenance record start over from their readings since then.
+    """
+    global segments
+    by_site, default = get_segment_maintenance()
+    if default is None:
+        return
+
+    with segments_lock:
+        current = segments
+    if current is None:
+        current = load_segments()
+    # Update a copy so requests never see half-applied sums; state saved
+    # before IngestPosition starts over
+    current = SegmentTrends(default) if current is None or current.position is None else current.copy()
+    position = IngestPosition.from_document(current.position, INGEST_OVERLAP_SECONDS)
+    reset = current.set_maintenance(by_site, default)
+
+    cutoff = utc_now() - timedelta(seconds=INGEST_LAG_SECONDS)
+    consumed = 0
+    if position.inserted is not None and reset:
+        # Segments that start over take all their readings up to the cutoff
+        # here; the pass below skips them as already consumed
+        start = current.last_maintenance[[current.index[site] for site in reset]].min()
+        for sites, times, values in iter_site_batches(db_sensors, start=start, features=model_features, sites=reset,
+                                                      inserted_until=cutoff, position=position):
+            current.add_readings(sites, times, values[:, 0], values[:, 1])
+            consumed += len(times)
+    # Every segment's last maintenance is at or after the network-wide one
+    for sites, times, values in iter_site_batches(db_sensors, start=default, features=model_features,
+                                                  inserted_after=position.inserted_after, inserted_until=cutoff,
+                                                  position=position):
+        current.add_readings(sites, times, values[:, 0], values[:, 1])
+        consumed += len(times)
+    position.advance(cutoff)
+    current.position = position.to_document()
+
+    if consumed or reset or segments is None:
+        with save_seconds.time():
+            save_segments(current)
+    with segments_lock:
+        segments = current
+    if consumed:
+        print(f"Consumed {consumed} readings across {len(current.sites)} segments (watermark {current.watermark})")
+
+def run_segments():
+    """
+    Background task: keep the per-segment trends current.
+    """
+    while True:
+        try:
+            with segments_seconds.time():
+                refresh_segments()
+        except Exception as e:
+            print("Segment refresh error:", e)
+        time.sleep(PREDICT_POLL_SECONDS)
+
+def run_rollups():
+    """
+    Background task: roll newly completed buckets of readings up into the
+    1m, 1h and 1d collections.
+    """
+    updater = RollupUpdater(db, lag_seconds=INGEST_LAG_SECONDS, overlap_seconds=INGEST_OVERLAP_SECONDS)
+    while True:
+        try:
+            written = updater.update()
+            if any(written.values()):
+                print("Rolled up " + ", ".join(f"{count} {resolution}" for resolution, count in written.items()) + " buckets")
+        except Exception as e:
+            print("Rollup error:", e)
+        time.sleep(ROLLUP_POLL_SECONDS)
+
+def run_feature_stats():
+    """
+    Background task: fold new readings into the feature statistics and
+    publish snapshots.
+    """
+    updater = FeatureStatsUpdater(db, lag_seconds=INGEST_LAG_SECONDS, snapshot_seconds=FEATURE_STATS_SNAPSHOT_SECONDS,
+                                  overlap_seconds=INGEST_OVERLAP_SECONDS)
+    while True:
+        try:
+            consumed, version = updater.update()
+            if version is not None:
+                print(f"Published feature statistics version {version}")
+        except Exception as e:
+            print("Feature statistics error:", e)
+        time.sleep(FEATURE_STATS_POLL_SECONDS)
+
+def start_background_tasks():
+    threading.Thread(target=run_refresher, name="estimator-refresher", daemon=True).start()
+    if SEGMENTS_ENABLED:
+        threading.Thread(target=run_segments, name="segment-refresher", daemon=True).start()
+    if ROLLUPS_ENABLED:
+        threading.Thread(target=run_rollups, name="rollup-updater", daemon=True).start()
+    if FEATURE_STATS_ENABLED:
+        threading.Thread(target=run_feature_stats, name="feature-stats-updater", daemon=True).start()
+
+def render_output():
+    """
+    Prepare the output message from the current estimator state.
+    """
+    with estimator_lock:
+        current = estimator
+    current_time = datetime.now().strftime(TIMESTAMP_FORMAT)
+    output_lines = []
+    if current is None:
+        output_lines.append("No sensor data available.")
+    else:
+        output_lines.append(f"Last maintenance timestamp: {current.last_maintenance.strftime(TIMESTAMP_FORMAT)}")
+        predicted_maintenance_date, final_recommendation = current.predicted_maintenance()
+        if predicted_maintenance_date is None:
+            output_lines.append("No maintenance needed based on current trends.")
+        else:
+            output_lines.append(f"Predicted next maintenance date: {predicted_maintenance_date.strftime(TIMESTAMP_FORMAT)}")
+            output_lines.append(f"Maintenance Recommendation: {final_recommendation}")
+    output_lines.append(f"Time (current local time): {current_time}")
+    return "\n".join(output_lines)
+
+def warming_up_response():
+    response = Response("Warming up: maintenance model is still loading, please retry shortly.", status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(int(PREDICT_POLL_SECONDS))
+    return response
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving HTTP
+    return Response("ok", status=200, mimetype='text/plain')
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: the first estimator result is available
+    if not ready.is_set():
+        return warming_up_response()
+    return Response(f"ready (startup took {ready_after_seconds:.2f} s)", status=200, mimetype='text/plain')
 
 @app.route('/', methods=['GET'])
 def analyze():
-    return Response(output, status=200, mimetype='text/plain')
+    if not ready.is_set():
+        return warming_up_response()
+    return Response(render_output(), status=200, mimetype='text/plain')
+
+@app.route('/segments', methods=['GET'])
+def ranked_segments():
+    """
+    Upcoming maintenance dates of all pipe segments, soonest first
+    (?limit=N for the first N).
+    """
+    if not SEGMENTS_ENABLED:
+        return jsonify({'error': "segment forecasting is disabled (SEGMENTS_ENABLED=0)"}), 404
+    with segments_lock:
+        current = segments
+    if current is None:
+        response = jsonify({'error': "warming up: segment trends are still loading, please retry shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(PREDICT_POLL_SECONDS))
+        return response
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'watermark': current.watermark,
+        'segments': len(current.sites),
+        'ranked': current.ranked(limit),
+        'time': datetime.now().strftime(TIMESTAMP_FORMAT),
+    })
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    # Bind immediately; model state loads in the background.
+    start_background_tasks()
+    app.run(host='0.0.0.0', port=int(os.environ.get("PORT", "5000")))
@@ -0,0 +1,295 @@
+"""
+Windowed, index-backed reads from the GOCI.sensors collection.
+
+Readings carry the original 'Timestamp' string ('%Y-%m-%d %H:%M:%S', which the
+dashboard displays and which sorts chronologically) and a 'Time' datetime that
+the simulator parses once at write time. Reads push the filter, sort and limit
+to MongoDB through the Timestamp index, project only the requested feature
+fields, and fill NumPy arrays straight from the cursor.
+
+Writers also stamp 'Inserted_at', the UTC datetime the reading was written to
+MongoDB. Consumers that follow new readings page through Inserted_at rather
+than Timestamp (inserted_after / inserted_until), so a reading that reaches
+MongoDB late, e.g. replayed from the simulator's write buffer after an
+outage, is still consumed instead of falling behind the watermark. Since
+Inserted_at is stamped on the writer's clock before its insert completes,
+consumers keep an IngestPosition that re-reads a margin before their last
+cutoff and skips the readings it already consumed.
+
+Run `python sensor_store.py --backfill <mongo_uri>` once to add 'Time' to older readings.
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from preprocessing import features_from_dicts
+
+FEATURES = ['Pressure', 'Flow_rate', 'Water_quality', 'Temperature']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Site of readings without a Sensor_id (single-sensor deployments)
+DEFAULT_SITE = 'sensor_data'
+# How far before its previous cutoff a consumer re-reads by Inserted_at
+INGEST_OVERLAP_SECONDS = 60.0
+
+
+def utc_now():
+    """
+    The current time as the naive UTC datetime MongoDB returns, to compare with Inserted_at.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _id_key(value):
+    # Rollup documents have compound (dict) _ids
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
+
+
+class IngestPosition:
+    """
+    How far a consumer got through the readings by Inserted_at.
+
+    Every reading inserted up to `inserted` has been consumed, and `seen`
+    holds the _ids of those inserted in the last `overlap` seconds before it.
+    A writer stamps Inserted_at on its own clock before its insert completes,
+    so a reading can become visible after a consumer's cutoff has passed its
+    Inserted_at. Each pass therefore re-reads from `overlap` seconds before
+    the previous cutoff (inserted_after) and take() drops the readings
+    already seen, so such a reading is still consumed, and only once.
+    """
+
+    def __init__(self, inserted=None, seen=(), overlap=INGEST_OVERLAP_SECONDS):
+        self.inserted = inserted
+        self.overlap = timedelta(seconds=overlap)
+        # _id key -> (_id, Inserted_at)
+        self.seen = {_id_key(doc_id): (doc_id, at) for doc_id, at in seen}
+
+    @property
+    def inserted_after(self):
+        # None before the first pass, which reads everything up to its cutoff
+        return None if self.inserted is None else self.inserted - self.overlap
+
+    def take(self, doc):
+        """
+        Whether the document (with _id and Inserted_at) is new; marks it consumed.
+        """
+        key = _id_key(doc['_id'])
+        if key in self.seen:
+            return False
+        if doc.get('Inserted_at') is not None:
+            # Readings without Inserted_at are never read again
+            self.seen[key] = (doc['_id'], doc['Inserted_at'])
+        return True
+
+    def advance(self, cutoff):
+        """
+        Record a completed pass up to cutoff; forgets the _ids the next pass no longer re-reads.
+        """
+        self.inserted = cutoff
+        keep_after = cutoff - self.overlap
+        self.seen = {key: value for key, value in self.seen.items() if value[1] > keep_after}
+
+    def to_document(self):
+        return {'inserted': self.inserted, 'seen': [list(value) for value in self.seen.values()]}
+
+    @classmethod
+    def from_document(cls, doc, overlap=INGEST_OVERLAP_SECONDS):
+        if not doc:
+            return cls(overlap=overlap)
+        return cls(doc.get('inserted'), doc.get('seen', ()), overlap)
+
+
+def ensure_indexes(collection):
+    """
+    Create the Timestamp index used for sorting and range filters, the
+    per-site one for readings of one Sensor_id and the Inserted_at one for
+    following new readings (idempotent).
+    """
+    collection.create_index([('Timestamp', ASCENDING)], name='Timestamp_1')
+    collection.create_index([('Sensor_id', ASCENDING), ('Timestamp', ASCENDING)], name='Sensor_id_1_Timestamp_1')
+    collection.create_index([('Inserted_at', ASCENDING)], name='Inserted_at_1')
+
+
+def format_timestamp(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, np.datetime64):
+        value = value.astype('datetime64[s]').astype(datetime)
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def document_time(doc):
+    """
+    Return the reading time, falling back to parsing the string for readings
+    written before 'Time' existed.
+    """
+    value = doc.get('Time')
+    if value is None:
+        value = datetime.strptime(doc['Timestamp'], TIMESTAMP_FORMAT)
+    return value
+
+
+def _time_query(start=None, end=None, after=None, site=None, inserted_after=None, inserted_until=None):
+    """
+    Timestamp range filter: start and end are inclusive, after is exclusive.
+    site restricts it to the readings of one Sensor_id (DEFAULT_SITE: those
+    without one). inserted_after
+    (exclusive) and inserted_until (inclusive) bound Inserted_at; readings
+    without Inserted_at (written before it existed) only match inserted_until
+    alone, as readings that are already in.
+    """
+    bounds = {}
+    if start is not None:
+        bounds['$gte'] = format_timestamp(start)
+    if after is not None:
+        bounds['$gt'] = format_timestamp(after)
+    if end is not None:
+        bounds['$lte'] = format_timestamp(end)
+    query = {'Timestamp': bounds} if bounds else {}
+    if site is not None:
+        # {'Sensor_id': None} also matches readings without the field
+        query['Sensor_id'] = None if site == DEFAULT_SITE else site
+    if inserted_after is not None:
+        inserted = {'$gt': inserted_after}
+        if inserted_until is not None:
+            inserted['$lte'] = inserted_until
+        query['Inserted_at'] = inserted
+    elif inserted_until is not None:
+        query['$or'] = [{'Inserted_at': {'$lte': inserted_until}}, {'Inserted_at': {'$exists': False}}]
+    return query
+
+
+def _sort_key(inserted_after):
+    # New readings are read in insertion order through the Inserted_at index
+    return 'Inserted_at' if inserted_after is not None else 'Timestamp'
+
+
+def _projection(features, position=None):
+    projection = {'_id': 0, 'Timestamp': 1, 'Time': 1}
+    projection.update({name: 1 for name in features})
+    if position is not None:
+        projection.update({'_id': 1, 'Inserted_at': 1})
+    return projection
+
+
+def _to_arrays(docs, features):
+    times = np.empty(len(docs), dtype='datetime64[s]')
+    for i, doc in enumerate(docs):
+        times[i] = document_time(doc)
+    # float64: predict keeps running sums over long ranges of these values
+    return times, features_from_dicts(docs, features, dtype=np.float64)
+
+
+def fetch_readings(collection, limit=None, start=None, end=None, after=None, features=FEATURES, site=None):
+    """
+    Return (times, values) for readings in the Timestamp range, oldest first.
+
+    times is a datetime64[s] array and values an (N, len(features)) float64
+    array. With limit, only the newest `limit` readings are returned.
+    """
+    query = _time_query(start, end, after, site)
+    projection = _projection(features)
+
+    if limit is not None:
+        cursor = collection.find(query, projection).sort('Timestamp', DESCENDING).limit(limit)
+        docs = list(cursor)
+        docs.reverse()
+    else:
+        docs = list(collection.find(query, projection).sort('Timestamp', ASCENDING).batch_size(10000))
+    return _to_arrays(docs, features)
+
+
+def iter_reading_batches(collection, start=None, end=None, after=None, features=FEATURES, site=None, batch_size=10000,
+                         inserted_after=None, inserted_until=None, position=None):
+    """
+    Yield (times, values) batches of at most batch_size readings, oldest first
+    (in insertion order with inserted_after), so long ranges can be consumed
+    without holding them in memory. site restricts them to one Sensor_id.
+    With an IngestPosition, only the readings it has not consumed yet are
+    yielded (and marked consumed).
+    """
+    query = _time_query(start, end, after, site, inserted_after=inserted_after, inserted_until=inserted_until)
+    projection = _projection(features, position)
+    cursor = collection.find(query, projection).sort(_sort_key(inserted_after), ASCENDING).batch_size(batch_size)
+    docs = []
+    for doc in cursor:
+        if position is not None and not position.take(doc):
+            continue
+        docs.append(doc)
+        if len(docs) >= batch_size:
+            yield _to_arrays(docs, features)
+            docs = []
+    if docs:
+        yield _to_arrays(docs, features)
+
+
+def _sites(docs):
+    return np.array([doc.get('Sensor_id', DEFAULT_SITE) for doc in docs], dtype=object)
+
+
+def iter_site_batches(collection, start=None, end=None, after=None, features=FEATURES, sites=None, batch_size=10000,
+                      inserted_after=None, inserted_until=None, position=None):
+    """
+    Like iter_reading_batches, but yield (sites, times, values) with the
+    Sensor_id of every reading (DEFAULT_SITE when it has none) as an object
+    array. sites restricts the readings to those Sensor_ids.
+    """
+    query = _time_query(start, end, after, inserted_after=inserted_after, inserted_until=inserted_until)
+    if sites is not None:
+        query['Sensor_id'] = {'$in': [None if site == DEFAULT_SITE else site for site in sites]}
+    projection = _projection(features, position)
+    projection['Sensor_id'] = 1
+    cursor = collection.find(query, projection).sort(_sort_key(inserted_after), ASCENDING).batch_size(batch_size)
+    docs = []
+    for doc in cursor:
+        if position is not None and not position.take(doc):
+            continue
+        docs.append(doc)
+        if len(docs) >= batch_size:
+            yield (_sites(docs),) + _to_arrays(docs, features)
+            docs = []
+    if docs:
+        yield (_sites(docs),) + _to_arrays(docs, features)
+
+
+def first_timestamp(collection):
+    doc = collection.find_one({}, {'_id': 0, 'Timestamp': 1}, sort=[('Timestamp', ASCENDING)])
+    return doc['Timestamp'] if doc else None
+
+
+def latest_timestamp(collection, start=None, end=None, site=None):
+    doc = collection.find_one(_time_query(start, end, site=site), {'_id': 0, 'Timestamp': 1}, sort=[('Timestamp', DESCENDING)])
+    return doc['Timestamp'] if doc else None
+
+
+def count_since(collection, watermark, site=None):
+    return collection.count_documents(_time_query(after=watermark, site=site))
+
+
+def backfill_time(collection, batch=1000):
+    """
+    Add the parsed 'Time' field to readings that only have the string Timestamp.
+    """
+    updated = 0
+    ops = []
+    for doc in collection.find({'Time': {'$exists': False}}, {'_id': 1, 'Timestamp': 1}):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'Time': datetime.strptime(doc['Timestamp'], TIMESTAMP_FORMAT)}}))
+        if len(ops) >= batch:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != '--backfill':
+        sys.exit("Usage: python sensor_store.py --backfill <mongo_uri>")
+
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+
+    collection = MongoClient(sys.argv[2], server_api=ServerApi('1')).GOCI.sensors
+    ensure_indexes(collection)
+    print(f"Backfilled Time on {backfill_time(collection)} readings")
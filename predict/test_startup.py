@@ -0,0 +1,135 @@
+"""
+predict.py startup against a large synthetic sensors collection.
+
+predict.py runs against a database seeded with STARTUP_DOCUMENTS readings
+and is served on a local port, as in production. /healthz must answer within
+HEALTHZ_BUDGET_SECONDS (2 s) of startup (the port is bound before any state
+loads) and /readyz must flip from 503 to 200 within READYZ_BUDGET_SECONDS
+(60 s; the first estimator result is loaded).
+
+The target is 1M readings. That needs a real MongoDB: point
+STARTUP_MONGO_URI at a scratch server (the test drops its GOCI database) and
+the test seeds 1M readings by default. Without it the test runs against an
+in-memory mongomock database with a reduced default of 50000 readings:
+mongomock re-slices its results for every document a cursor returns, so
+reading grows quadratically with the collection (200000 readings already
+take about 12 minutes). The size and budgets can be changed through the
+environment variables of the same names.
+
+Usage:
+    python -m pytest predict/test_startup.py
+    STARTUP_MONGO_URI=mongodb://localhost:27017 python -m pytest predict/test_startup.py
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+STARTUP_MONGO_URI = os.environ.get("STARTUP_MONGO_URI")
+if STARTUP_MONGO_URI is None:
+    mongomock = pytest.importorskip("mongomock")
+
+STARTUP_DOCUMENTS = int(os.environ.get("STARTUP_DOCUMENTS", "1000000" if STARTUP_MONGO_URI else "50000"))
+HEALTHZ_BUDGET_SECONDS = float(os.environ.get("HEALTHZ_BUDGET_SECONDS", "2"))
+READYZ_BUDGET_SECONDS = float(os.environ.get("READYZ_BUDGET_SECONDS", "60"))
+
+
+def populate(collection, documents, batch=10000):
+    """
+    Fill the collection with synthetic 2 Hz readings up to now, as written by
+    the ingress services (each inserted, in UTC, when it was taken).
+    """
+    rng = np.random.default_rng(0)
+    start = datetime.now() - timedelta(seconds=documents / 2)
+    inserted = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=documents / 2)
+    for offset in range(0, documents, batch):
+        n = min(batch, documents - offset)
+        values = rng.normal([100, 50, 98, 20], [5, 3, 1, 1], size=(n, 4))
+        docs = []
+        for i in range(n):
+            t = (start + timedelta(seconds=(offset + i) / 2)).replace(microsecond=0)
+            docs.append({
+                'Timestamp': t.strftime('%Y-%m-%d %H:%M:%S'),
+                'Time': t,
+                'Pressure': float(values[i, 0]),
+                'Flow_rate': float(values[i, 1]),
+                'Water_quality': float(values[i, 2]),
+                'Temperature': float(values[i, 3]),
+                'Inserted_at': inserted + timedelta(seconds=(offset + i) / 2),
+            })
+        collection.insert_many(docs, ordered=False)
+
+
+def get(url):
+    """
+    Return the HTTP status of a GET, or None while the server does not answer.
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None
+
+
+def wait_for(url, status, deadline):
+    while time.monotonic() < deadline:
+        if get(url) == status:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture(scope="module")
+def monkeypatch_module():
+    with pytest.MonkeyPatch.context() as patch:
+        yield patch
+
+
+@pytest.fixture(scope="module")
+def seeded_client(monkeypatch_module):
+    if STARTUP_MONGO_URI:
+        import pymongo
+        client = pymongo.MongoClient(STARTUP_MONGO_URI)
+        client.drop_database("GOCI")
+    else:
+        client = mongomock.MongoClient()
+    populate(client.GOCI.sensors, STARTUP_DOCUMENTS)
+    monkeypatch_module.setattr("pymongo.MongoClient", lambda *args, **kwargs: client)
+    # Tests of the other services put their directories, with modules of the
+    # same names (feature_stats, preprocessing, ...), on sys.path too
+    monkeypatch_module.syspath_prepend(os.path.dirname(os.path.abspath(__file__)))
+    # Only the estimator decides readiness; the other background tasks stay off
+    for name in ("ROLLUPS_ENABLED", "FEATURE_STATS_ENABLED", "SEGMENTS_ENABLED"):
+        monkeypatch_module.setenv(name, "0")
+    monkeypatch_module.setenv("PREDICT_POLL_SECONDS", "0.1")
+    monkeypatch_module.setenv("INGEST_LAG_SECONDS", "0")
+    return client
+
+
+def test_healthz_answers_and_readyz_flips_within_budget(seeded_client):
+    from werkzeug.serving import make_server
+
+    started = time.monotonic()
+    sys.modules.pop("predict", None)
+    predict = importlib.import_module("predict")
+    predict.start_background_tasks()
+    server = make_server("127.0.0.1", 0, predict.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="predict-http", daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        assert wait_for(f"{base}/healthz", 200, started + HEALTHZ_BUDGET_SECONDS), \
+            f"/healthz did not answer within {HEALTHZ_BUDGET_SECONDS} s"
+        assert wait_for(f"{base}/readyz", 200, started + READYZ_BUDGET_SECONDS), \
+            f"/readyz did not flip within {READYZ_BUDGET_SECONDS} s of startup ({STARTUP_DOCUMENTS} readings)"
+        assert predict.estimator.wq.n == STARTUP_DOCUMENTS
+    finally:
+        server.shutdown()
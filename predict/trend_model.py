@@ -0,0 +1,363 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Thresholds (adjust these based on real-life criteria)
+wq_threshold = 95           # e.g., if water quality drops below 95, it could be a sign of corrosion
+temp_upper_threshold = 22   # upper bound for normal water temperature
+temp_lower_threshold = 18   # lower bound for normal water temperature
+
+# Recommendation for each threshold crossing: water quality, temperature too high, too low
+RECOMMENDATIONS = (
+    "Inspection for corrosion due to significant water quality drop.",
+    "Maintenance for temperature regulation to prevent pipe break (temperature too high).",
+    "Maintenance for temperature regulation to prevent pipe break (temperature too low).",
+)
+
+
+class RunningRegression:
+    """
+    Ordinary least squares y = slope * x + intercept kept as running sums
+    (n, Σx, Σy, Σxy, Σx²), so each new point is an O(1) update and the fit
+    matches LinearRegression on all points seen so far.
+    """
+
+    def __init__(self, n=0, sx=0.0, sy=0.0, sxy=0.0, sxx=0.0):
+        self.n = n
+        self.sx = sx
+        self.sy = sy
+        self.sxy = sxy
+        self.sxx = sxx
+
+    def update(self, x, y):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxy += x * y
+        self.sxx += x * x
+
+    def update_many(self, x, y):
+        """
+        Add a batch of points (same result as calling update for each).
+        """
+        self.n += len(x)
+        self.sx += float(np.sum(x))
+        self.sy += float(np.sum(y))
+        self.sxy += float(np.dot(x, y))
+        self.sxx += float(np.dot(x, x))
+
+    def fit(self):
+        """
+        Return (slope, intercept); slope is 0 when x has no spread.
+        """
+        if self.n == 0:
+            return 0.0, 0.0
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if denominator == 0:
+            return 0.0, self.sy / self.n
+        slope = (self.n * self.sxy - self.sx * self.sy) / denominator
+        intercept = (self.sy - slope * self.sx) / self.n
+        return slope, intercept
+
+    def to_dict(self):
+        return {'n': self.n, 'sx': self.sx, 'sy': self.sy, 'sxy': self.sxy, 'sxx': self.sxx}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class MaintenanceEstimator:
+    """
+    Water quality and temperature trends since the last maintenance, fed
+    incrementally with readings inserted after the previous refresh.
+    """
+
+    def __init__(self, last_maintenance, watermark=None, wq=None, temp=None, position=None):
+        self.last_maintenance = last_maintenance
+        self.watermark = watermark          # Timestamp string of the newest reading consumed
+        self.position = position            # IngestPosition document of the readings consumed (see sensor_store.py)
+        self.wq = wq or RunningRegression()
+        self.temp = temp or RunningRegression()
+
+    def add_readings(self, times, water_quality, temperature):
+        """
+        Consume readings in any order; x is hours since last maintenance.
+        """
+        if len(times) == 0:
+            return
+        hours = (times - np.datetime64(self.last_maintenance, 's')).astype(np.float64) / 3600
+        self.wq.update_many(hours, water_quality)
+        self.temp.update_many(hours, temperature)
+        newest = times.max().astype(datetime).strftime(TIMESTAMP_FORMAT)
+        self.watermark = newest if self.watermark is None else max(self.watermark, newest)
+
+    def predicted_maintenance(self):
+        """
+        Return (predicted_maintenance_date, recommendation), or (None, None) when
+        no threshold crossing lies in the future.
+        """
+        # Solve for the time when predicted water quality reaches the threshold
+        wq_slope, wq_intercept = self.wq.fit()
+        x_wq = (wq_threshold - wq_intercept) / wq_slope if wq_slope != 0 else np.inf
+
+        # Solve for the time when predicted temperature exceeds upper threshold and when it falls below lower threshold
+        temp_slope, temp_intercept = self.temp.fit()
+        x_temp_upper = np.inf
+        x_temp_lower = np.inf
+        if temp_slope != 0:
+            x_temp_upper = (temp_upper_threshold - temp_intercept) / temp_slope
+            x_temp_lower = (temp_lower_threshold - temp_intercept) / temp_slope
+
+        # We consider only positive, finite time differences (future predictions).
+        pred_times = []
+        recommendations = []
+        if np.isfinite(x_wq) and x_wq > 0:
+            pred_times.append(x_wq)
+            recommendations.append(RECOMMENDATIONS[0])
+        if np.isfinite(x_temp_upper) and x_temp_upper > 0:
+            pred_times.append(x_temp_upper)
+            recommendations.append(RECOMMENDATIONS[1])
+        if np.isfinite(x_temp_lower) and x_temp_lower > 0:
+            pred_times.append(x_temp_lower)
+            recommendations.append(RECOMMENDATIONS[2])
+
+        if not pred_times:
+            return None, None
+        pred_hours = min(pred_times)
+        idx = pred_times.index(pred_hours)
+        return self.last_maintenance + timedelta(hours=pred_hours), recommendations[idx]
+
+    def to_document(self):
+        return {
+            'last_maintenance': self.last_maintenance.strftime(TIMESTAMP_FORMAT),
+            'watermark': self.watermark,
+            'position': self.position,
+            'wq': self.wq.to_dict(),
+            'temp': self.temp.to_dict(),
+        }
+
+    @classmethod
+    def from_document(cls, doc):
+        return cls(
+            datetime.strptime(doc['last_maintenance'], TIMESTAMP_FORMAT),
+            watermark=doc.get('watermark'),
+            wq=RunningRegression.from_dict(doc['wq']),
+            temp=RunningRegression.from_dict(doc['temp']),
+            position=doc.get('position'),
+        )
+
+
+# Columns of SegmentTrends.sums: count, Σx, Σx² and Σy, Σxy of water quality and temperature
+N, SX, SXX, SY_WQ, SXY_WQ, SY_TEMP, SXY_TEMP = range(7)
+# Crossings further out than this are no prediction (and would overflow the date range)
+MAX_HOURS = 24 * 365 * 1000
+# Segments per stored chunk: about 150 bytes each, so a chunk stays far below
+# MongoDB's 16 MB document limit
+SEGMENT_CHUNK_SITES = 10000
+# Per-segment fields of SegmentTrends.to_document, split across chunks
+_SEGMENT_FIELDS = ('sites', 'last_maintenance', 'sums')
+
+
+def _format_times(values):
+    """
+    TIMESTAMP_FORMAT strings of a datetime64[s] array.
+    """
+    return [value.replace('T', ' ') for value in np.datetime_as_string(values, unit='s').tolist()]
+
+
+def fit_lines(n, sx, sxx, sy, sxy):
+    """
+    Vectorized RunningRegression.fit: (slopes, intercepts) from arrays of running sums.
+    """
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.where(denominator != 0, (n * sxy - sx * sy) / denominator, 0.0)
+        intercepts = np.where(n > 0, (sy - slopes * sx) / n, 0.0)
+    return slopes, intercepts
+
+
+def crossing_hours(slopes, intercepts, threshold):
+    """
+    Hours at which each line reaches threshold; inf for flat lines.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(slopes != 0, (threshold - intercepts) / slopes, np.inf)
+
+
+class SegmentTrends:
+    """
+    MaintenanceEstimator for many pipe segments (sites) at once.
+
+    The running sums of every segment are rows of one (segments, 7) array:
+    a batch of readings from any mix of segments is folded in with grouped
+    sums (np.bincount) and all slopes, intercepts and threshold crossings are
+    computed with array operations, so the cost does not grow with per-segment
+    Python objects. x is hours since the segment's own last maintenance.
+    """
+
+    def __init__(self, default_maintenance, watermark=None, position=None):
+        self.default_maintenance = default_maintenance
+        self.watermark = watermark          # Timestamp string of the newest reading consumed
+        self.position = position            # IngestPosition document of the readings consumed (see sensor_store.py)
+        self.sites = []
+        self.index = {}
+        self.last_maintenance = np.empty(0, dtype='datetime64[s]')
+        self.sums = np.zeros((0, 7))
+
+    def _add_sites(self, sites, maintenance=None):
+        start = len(self.sites)
+        for site in sites:
+            self.index[site] = len(self.sites)
+            self.sites.append(site)
+        added = len(self.sites) - start
+        if maintenance is None:
+            maintenance = np.full(added, np.datetime64(self.default_maintenance, 's'))
+        self.last_maintenance = np.concatenate([self.last_maintenance, maintenance])
+        self.sums = np.concatenate([self.sums, np.zeros((added, 7))])
+
+    def _indices(self, sites):
+        # A dict lookup per reading is cheaper than np.unique on an object array
+        new = set(sites).difference(self.index)
+        if new:
+            self._add_sites(sorted(new))
+        return np.fromiter(map(self.index.__getitem__, sites), dtype=np.intp, count=len(sites))
+
+    def set_maintenance(self, by_site, default):
+        """
+        Apply the newest maintenance per site (by_site) and the newest
+        network-wide one (default); a segment's last maintenance is the later
+        of the two. Segments whose last maintenance changed start over; their
+        sites are returned so their readings since then can be consumed again.
+        """
+        self.default_maintenance = default
+        new = [site for site in by_site if site not in self.index]
+        if new:
+            self._add_sites(new)
+        latest = np.full(len(self.sites), np.datetime64(default, 's'))
+        for site, when in by_site.items():
+            i = self.index[site]
+            latest[i] = max(latest[i], np.datetime64(when, 's'))
+        changed = latest != self.last_maintenance
+        self.last_maintenance = latest
+        self.sums[changed] = 0.0
+        return [self.sites[i] for i in np.flatnonzero(changed)]
+
+    def add_readings(self, sites, times, water_quality, temperature):
+        """
+        Consume readings of any segments in any order; readings older than
+        their segment's last maintenance are skipped.
+        """
+        if len(times) == 0:
+            return
+        newest = times.max().astype(datetime).strftime(TIMESTAMP_FORMAT)
+        self.watermark = newest if self.watermark is None else max(self.watermark, newest)
+        rows = self._indices(sites)
+        hours = (times - self.last_maintenance[rows]).astype(np.float64) / 3600
+        keep = hours >= 0
+        rows, hours = rows[keep], hours[keep]
+        water_quality, temperature = water_quality[keep], temperature[keep]
+
+        columns = {
+            N: None, SX: hours, SXX: hours * hours,
+            SY_WQ: water_quality, SXY_WQ: hours * water_quality,
+            SY_TEMP: temperature, SXY_TEMP: hours * temperature,
+        }
+        for column, weights in columns.items():
+            self.sums[:, column] += np.bincount(rows, weights=weights, minlength=len(self.sites))
+
+    def fit(self):
+        """
+        Return ((wq slopes, wq intercepts), (temperature slopes, temperature intercepts)).
+        """
+        s = self.sums
+        return (
+            fit_lines(s[:, N], s[:, SX], s[:, SXX], s[:, SY_WQ], s[:, SXY_WQ]),
+            fit_lines(s[:, N], s[:, SX], s[:, SXX], s[:, SY_TEMP], s[:, SXY_TEMP]),
+        )
+
+    def predicted_maintenance(self):
+        """
+        Return (hours after last maintenance, index into RECOMMENDATIONS) per
+        segment, as MaintenanceEstimator.predicted_maintenance does for one;
+        hours is inf where no threshold crossing lies in the future.
+        """
+        (wq_slopes, wq_intercepts), (temp_slopes, temp_intercepts) = self.fit()
+        hours = np.stack([
+            crossing_hours(wq_slopes, wq_intercepts, wq_threshold),
+            crossing_hours(temp_slopes, temp_intercepts, temp_upper_threshold),
+            crossing_hours(temp_slopes, temp_intercepts, temp_lower_threshold),
+        ], axis=1)
+        # Only positive, finite times count (future predictions)
+        hours[~((hours > 0) & (hours < MAX_HOURS))] = np.inf
+        reasons = hours.argmin(axis=1)
+        return hours[np.arange(len(hours)), reasons], reasons
+
+    def ranked(self, limit=None):
+        """
+        Segments with a predicted maintenance, soonest first, as dicts.
+        """
+        hours, reasons = self.predicted_maintenance()
+        due = np.flatnonzero(np.isfinite(hours))
+        dates = self.last_maintenance[due] + (hours[due] * 3600).astype('timedelta64[s]')
+        order = np.argsort(dates, kind='stable')[:limit]
+        due, dates = due[order], dates[order]
+        return [
+            {
+                'segment': self.sites[i],
+                'last_maintenance': last,
+                'predicted_maintenance': date,
+                'recommendation': RECOMMENDATIONS[reason],
+                'readings': readings,
+            }
+            for i, last, date, reason, readings in zip(
+                due.tolist(), _format_times(self.last_maintenance[due]), _format_times(dates),
+                reasons[due].tolist(), self.sums[due, N].astype(int).tolist())
+        ]
+
+    def copy(self):
+        trends = SegmentTrends(self.default_maintenance, self.watermark, self.position)
+        trends.sites = list(self.sites)
+        trends.index = dict(self.index)
+        trends.last_maintenance = self.last_maintenance.copy()
+        trends.sums = self.sums.copy()
+        return trends
+
+    def to_document(self):
+        return {
+            'default_maintenance': self.default_maintenance.strftime(TIMESTAMP_FORMAT),
+            'watermark': self.watermark,
+            'position': self.position,
+            'sites': self.sites,
+            'last_maintenance': [value.astype(datetime).strftime(TIMESTAMP_FORMAT) for value in self.last_maintenance],
+            'sums': self.sums.tolist(),
+        }
+
+    @classmethod
+    def from_document(cls, doc):
+        trends = cls(datetime.strptime(doc['default_maintenance'], TIMESTAMP_FORMAT), watermark=doc.get('watermark'),
+                     position=doc.get('position'))
+        trends._add_sites(doc['sites'], np.array(doc['last_maintenance'], dtype='datetime64[s]'))
+        trends.sums = np.array(doc['sums'], dtype=np.float64).reshape(-1, 7)
+        return trends
+
+    def to_documents(self, chunk_sites=SEGMENT_CHUNK_SITES):
+        """
+        to_document() split into a head document and chunks of at most
+        chunk_sites segments, so any number of segments can be stored.
+        """
+        doc = self.to_document()
+        head = {key: value for key, value in doc.items() if key not in _SEGMENT_FIELDS}
+        chunks = [{key: doc[key][start:start + chunk_sites] for key in _SEGMENT_FIELDS}
+                  for start in range(0, len(self.sites), chunk_sites)]
+        return head, chunks
+
+    @classmethod
+    def from_documents(cls, head, chunks):
+        """
+        Join the head and chunks written by to_documents(), chunks in order.
+        """
+        joined = {key: [value for chunk in chunks for value in chunk[key]] for key in _SEGMENT_FIELDS}
+        return cls.from_document(dict(head, **joined))